@@ -0,0 +1,2 @@
+from .performance import PortfolioAnalytics, compute_analytics, money_weighted_return, SERIES_COLUMNS, \
+    CONTRIBUTION_COLUMNS
@@ -0,0 +1,234 @@
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import brentq
+
+from data_types import Security
+
+DAYS_PER_YEAR = 365.25
+
+# Bounds of the annual money-weighted return searched for, from losing almost everything to growing a hundredfold
+MIN_ANNUAL_RETURN = -0.9999
+MAX_ANNUAL_RETURN = 100.0
+
+SERIES_COLUMNS = ['value', 'cash_flow', 'daily_return', 'cumulative_return', 'drawdown', 'deviation']
+CONTRIBUTION_COLUMNS = ['value', 'net_invested', 'gain', 'return_contribution']
+
+
+@dataclass
+class PortfolioAnalytics:
+    """
+    Performance of a portfolio over a calendar, computed from its holdings and the prices of its securities at the
+    end of every date.
+
+    series has the columns of SERIES_COLUMNS per date. The cash flow of a date is the value of the shares bought
+    minus the value of the shares sold on it, and its return excludes that cash flow. The deviation is the standard
+    error from the allocation, as in balance.get_deviation_from_ideal, or NaN without an allocation.
+    weights and drift have a column per security identifier, with the fraction of the value of every security and its
+    difference to the allocation.
+    contributions has the columns of CONTRIBUTION_COLUMNS per security identifier. The return contributions of the
+    securities add up to the sum of the daily returns.
+    """
+    series: pd.DataFrame
+    weights: pd.DataFrame
+    drift: pd.DataFrame
+    contributions: pd.DataFrame
+    time_weighted_return: float
+    annualized_time_weighted_return: float
+    # Annual internal rate of return of the cash flows and the final value, or NaN when there is none
+    money_weighted_return: float
+    max_drawdown: float
+    max_drawdown_peak: Optional[pd.Timestamp]
+    max_drawdown_trough: Optional[pd.Timestamp]
+
+    @property
+    def start(self) -> pd.Timestamp:
+        return self.series.index[0]
+
+    @property
+    def end(self) -> pd.Timestamp:
+        return self.series.index[-1]
+
+    @property
+    def final_value(self) -> float:
+        return float(self.series['value'].iloc[-1])
+
+    @property
+    def net_invested(self) -> float:
+        return float(self.series['cash_flow'].sum())
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            'start': self.start.strftime('%Y-%m-%d'),
+            'end': self.end.strftime('%Y-%m-%d'),
+            'final_value': self.final_value,
+            'net_invested': self.net_invested,
+            'gain': self.final_value - self.net_invested,
+            'time_weighted_return': self.time_weighted_return,
+            'annualized_time_weighted_return': self.annualized_time_weighted_return,
+            'money_weighted_return': _json_number(self.money_weighted_return),
+            'max_drawdown': self.max_drawdown,
+            'max_drawdown_peak': _json_date(self.max_drawdown_peak),
+            'max_drawdown_trough': _json_date(self.max_drawdown_trough),
+            'deviation': _json_number(float(self.series['deviation'].iloc[-1]))
+        }
+
+    def to_json(self) -> Dict[str, object]:
+        """
+        :return: The summary, the contributions and the series with the drift of every security, with only JSON types.
+        The series has a list of values per column, with None for NaN.
+        """
+        series = self.time_series()
+        return {
+            'summary': self.summary(),
+            'contributions': {identifier: {column: float(value) for column, value in row.items()}
+                              for identifier, row in self.contributions.iterrows()},
+            'series': {
+                'date': series.index.strftime('%Y-%m-%d').tolist(),
+                **{column: series[column].astype(object).where(series[column].notna(), None).tolist()
+                   for column in series.columns}
+            }
+        }
+
+    def time_series(self) -> pd.DataFrame:
+        """
+        :return: The series with a drift_<identifier> column per security
+        """
+        return pd.concat([self.series, self.drift.add_prefix('drift_')], axis=1)
+
+
+def compute_analytics(holdings: pd.DataFrame, prices: pd.DataFrame,
+                      allocations: Optional[Mapping[Security, float]] = None) -> PortfolioAnalytics:
+    """
+    Computes the performance of a portfolio with array operations over all the dates at once
+    :param holdings: Shares of every security at the end of every date, as a dataframe indexed by date with a column
+    per security identifier, such as TransactionPersistence.read_holdings_history with a frequency. The shares before
+    the first date are zero.
+    :param prices: Prices indexed by date with a column per security identifier. The price at a date is the last known
+    price on or before it, or the first known price for dates before it.
+    :param allocations: Desired fraction of every security, to compute the drift from it
+    """
+    if holdings.empty:
+        raise ValueError('There are no holdings to analyse')
+
+    dates = pd.DatetimeIndex(holdings.index)
+    identifiers = [str(identifier) for identifier in holdings.columns]
+    shares = holdings.to_numpy(dtype=np.float64)
+    share_prices = _prices_at(prices, identifiers, dates)
+
+    values = shares * share_prices
+    share_changes = np.diff(shares, axis=0, prepend=0)
+    cash_flows = share_changes * share_prices
+    total_values = values.sum(axis=1)
+    total_cash_flows = cash_flows.sum(axis=1)
+
+    # The gain of a date is the change of value of the shares held at the end of the previous date
+    previous_shares = np.vstack([np.zeros((1, len(identifiers))), shares[:-1]])
+    previous_prices = np.vstack([share_prices[:1], share_prices[:-1]])
+    gains = previous_shares * (share_prices - previous_prices)
+    previous_values = np.concatenate([[0.0], total_values[:-1]])
+    has_previous_value = previous_values > 0
+    safe_previous_values = np.where(has_previous_value, previous_values, 1.0)
+    returns = np.where(has_previous_value, gains.sum(axis=1) / safe_previous_values, 0.0)
+    return_contributions = np.where(has_previous_value[:, None], gains / safe_previous_values[:, None], 0.0)
+
+    growth = np.cumprod(1 + returns)
+    drawdowns = growth / np.maximum.accumulate(growth) - 1
+    trough = int(np.argmin(drawdowns))
+    peak = int(np.argmax(growth[:trough + 1]))
+    has_drawdown = drawdowns[trough] < 0
+
+    weights, drift, deviations = _allocation_drift(values, total_values, identifiers, allocations)
+
+    time_weighted_return = float(growth[-1] - 1)
+    years = (dates[-1] - dates[0]).days / DAYS_PER_YEAR
+    annualized_time_weighted_return = float(growth[-1] ** (1 / years) - 1) if years > 0 else time_weighted_return
+
+    series = pd.DataFrame({
+        'value': total_values,
+        'cash_flow': total_cash_flows,
+        'daily_return': returns,
+        'cumulative_return': growth - 1,
+        'drawdown': drawdowns,
+        'deviation': deviations
+    }, index=dates)
+    net_invested = cash_flows.sum(axis=0)
+    contributions = pd.DataFrame({
+        'value': values[-1],
+        'net_invested': net_invested,
+        'gain': values[-1] - net_invested,
+        'return_contribution': return_contributions.sum(axis=0)
+    }, index=pd.Index(identifiers, name='security_id'))
+
+    return PortfolioAnalytics(
+        series=series,
+        weights=pd.DataFrame(weights, index=dates, columns=drift.columns),
+        drift=drift.set_axis(dates, axis=0),
+        contributions=contributions,
+        time_weighted_return=time_weighted_return,
+        annualized_time_weighted_return=annualized_time_weighted_return,
+        money_weighted_return=money_weighted_return(dates, total_cash_flows, total_values[-1]),
+        max_drawdown=float(drawdowns[trough]),
+        max_drawdown_peak=dates[peak] if has_drawdown else None,
+        max_drawdown_trough=dates[trough] if has_drawdown else None
+    )
+
+
+def money_weighted_return(dates: pd.DatetimeIndex, cash_flows: np.ndarray, final_value: float) -> float:
+    """
+    Annual rate at which investing the cash flows on their dates grows to the final value at the last date, which
+    is the internal rate of return of the investor
+    :return: The rate, or NaN if no rate between MIN_ANNUAL_RETURN and MAX_ANNUAL_RETURN gives the final value
+    """
+    has_cash_flow = cash_flows != 0
+    flows = np.append(-cash_flows[has_cash_flow], final_value)
+    years = np.append((dates[has_cash_flow] - dates[0]).days.to_numpy(), (dates[-1] - dates[0]).days) / DAYS_PER_YEAR
+
+    def net_present_value(rate: float) -> float:
+        return float(np.sum(flows * np.power(1 + rate, -years)))
+
+    low, high = net_present_value(MIN_ANNUAL_RETURN), net_present_value(MAX_ANNUAL_RETURN)
+    if not np.isfinite(low) or not np.isfinite(high) or np.sign(low) == np.sign(high):
+        return float('nan')
+
+    return float(brentq(net_present_value, MIN_ANNUAL_RETURN, MAX_ANNUAL_RETURN, xtol=1e-10))
+
+
+def _prices_at(prices: pd.DataFrame, identifiers: List[str], dates: pd.DatetimeIndex) -> np.ndarray:
+    missing_identifiers = [identifier for identifier in identifiers if identifier not in prices.columns
+                           or prices[identifier].isna().all()]
+    if missing_identifiers:
+        raise ValueError(f'There are no prices for {", ".join(missing_identifiers)}')
+
+    prices = prices.set_axis(pd.to_datetime(prices.index), axis=0).sort_index()[identifiers].ffill().bfill()
+    positions = np.clip(prices.index.searchsorted(dates, side='right') - 1, 0, len(prices.index) - 1)
+    return prices.to_numpy(dtype=np.float64)[positions]
+
+
+def _allocation_drift(values: np.ndarray, total_values: np.ndarray, identifiers: List[str],
+                      allocations: Optional[Mapping[Security, float]]):
+    """
+    :return: The weight and the drift of every security held or allocated at every date, and the deviation from the
+    allocation at every date. Dates without value have no weights.
+    """
+    allocated = {security.identifier: fraction for security, fraction in (allocations or dict()).items()}
+    all_identifiers = identifiers + [identifier for identifier in allocated if identifier not in identifiers]
+    all_values = np.hstack([values, np.zeros((len(values), len(all_identifiers) - len(identifiers)))])
+
+    has_value = total_values > 0
+    weights = np.where(has_value[:, None], all_values / np.where(has_value, total_values, 1.0)[:, None], np.nan)
+    targets = np.array([allocated.get(identifier, 0.0) for identifier in all_identifiers], dtype=np.float64)
+    drift = weights - targets
+
+    deviations = np.sqrt(np.sum(drift ** 2, axis=1)) if allocations is not None else np.full(len(values), np.nan)
+    return weights, pd.DataFrame(drift, columns=pd.Index(all_identifiers)), deviations
+
+
+def _json_number(value: float) -> Optional[float]:
+    return float(value) if np.isfinite(value) else None
+
+
+def _json_date(date: Optional[pd.Timestamp]) -> Optional[str]:
+    return date.strftime('%Y-%m-%d') if date is not None else None
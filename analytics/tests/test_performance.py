@@ -0,0 +1,88 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from analytics import compute_analytics, money_weighted_return
+from analytics.performance import DAYS_PER_YEAR
+from data_types import Security
+
+
+class PerformanceTests(unittest.TestCase):
+    def test_returns_exclude_cash_flows(self):
+        dates = pd.date_range('2021-01-01', periods=4)
+        holdings = pd.DataFrame({'AAPL': [10, 10, 20, 20]}, index=dates)
+        prices = pd.DataFrame({'AAPL': [10.0, 11.0, 11.0, 12.1]}, index=dates)
+
+        analytics = compute_analytics(holdings, prices)
+
+        np.testing.assert_allclose([100, 0, 110, 0], analytics.series['cash_flow'])
+        np.testing.assert_allclose([0, 0.1, 0, 0.1], analytics.series['daily_return'])
+        self.assertAlmostEqual(0.21, analytics.time_weighted_return)
+        self.assertAlmostEqual(242, analytics.final_value)
+        self.assertAlmostEqual(32, analytics.contributions.loc['AAPL', 'gain'])
+        self.assertAlmostEqual(0.2, analytics.contributions.loc['AAPL', 'return_contribution'])
+
+    def test_contributions_add_up_to_returns(self):
+        dates = pd.bdate_range('2020-01-01', '2021-12-31')
+        rng = np.random.default_rng(1)
+        prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.01, (len(dates), 3)), axis=0)), index=dates,
+                              columns=['AAPL', 'TSLA', 'AMZN'])
+        holdings = pd.DataFrame(np.cumsum(rng.integers(0, 2, (len(dates), 3)), axis=0), index=dates,
+                                columns=prices.columns)
+
+        analytics = compute_analytics(holdings, prices)
+
+        self.assertAlmostEqual(analytics.series['daily_return'].sum(),
+                               analytics.contributions['return_contribution'].sum())
+        self.assertAlmostEqual(analytics.final_value - analytics.net_invested, analytics.contributions['gain'].sum())
+
+    def test_max_drawdown(self):
+        dates = pd.date_range('2021-01-01', periods=5)
+        holdings = pd.DataFrame({'AAPL': [1, 1, 1, 1, 1]}, index=dates)
+        prices = pd.DataFrame({'AAPL': [10.0, 20.0, 15.0, 10.0, 30.0]}, index=dates)
+
+        analytics = compute_analytics(holdings, prices)
+
+        self.assertAlmostEqual(-0.5, analytics.max_drawdown)
+        self.assertEqual(dates[1], analytics.max_drawdown_peak)
+        self.assertEqual(dates[3], analytics.max_drawdown_trough)
+
+    def test_drift_from_allocation(self):
+        dates = pd.date_range('2021-01-01', periods=2)
+        holdings = pd.DataFrame({'AAPL': [1, 1]}, index=dates)
+        prices = pd.DataFrame({'AAPL': [10.0, 10.0]}, index=dates)
+
+        analytics = compute_analytics(holdings, prices, {Security('AAPL'): 0.5, Security('TSLA'): 0.5})
+
+        self.assertEqual(['AAPL', 'TSLA'], list(analytics.drift.columns))
+        np.testing.assert_allclose([0.5, -0.5], analytics.drift.iloc[-1])
+        self.assertAlmostEqual(np.sqrt(0.5), analytics.series['deviation'].iloc[-1])
+        self.assertIn('drift_TSLA', analytics.time_series().columns)
+
+    def test_money_weighted_return_of_single_investment(self):
+        dates = pd.DatetimeIndex(['2020-01-01', '2022-01-01'])
+
+        rate = money_weighted_return(dates, np.array([100.0, 0.0]), 121.0)
+
+        self.assertAlmostEqual(1.21 ** (DAYS_PER_YEAR / 731) - 1, rate)
+
+    def test_prices_are_taken_as_of_every_date(self):
+        dates = pd.date_range('2021-01-01', periods=4)
+        holdings = pd.DataFrame({'AAPL': [1, 1, 1, 1]}, index=dates)
+        prices = pd.DataFrame({'AAPL': [10.0, 12.0]}, index=pd.DatetimeIndex(['2021-01-02', '2021-01-03']))
+
+        analytics = compute_analytics(holdings, prices)
+
+        np.testing.assert_allclose([10, 10, 12, 12], analytics.series['value'])
+
+    def test_missing_prices(self):
+        dates = pd.date_range('2021-01-01', periods=2)
+        holdings = pd.DataFrame({'AAPL': [1, 1]}, index=dates)
+
+        with self.assertRaises(ValueError):
+            compute_analytics(holdings, pd.DataFrame({'TSLA': [1.0, 1.0]}, index=dates))
+
+
+if __name__ == '__main__':
+    unittest.main()
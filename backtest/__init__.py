@@ -0,0 +1,2 @@
+from .backtester import BacktestParameters, BacktestResult, FREQUENCIES, parameter_grid, run_backtest, \
+    run_backtests
@@ -0,0 +1,165 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import balance
+from data_types import Security
+from data_types.security_values import Allocation, Portfolio
+
+
+# Periods of the contributions, as pandas periods. Every contribution is made on the first trading day of its period.
+FREQUENCIES = {'weekly': 'W', 'monthly': 'M', 'quarterly': 'Q'}
+
+CHUNK_SIZE = 4
+
+
+@dataclass(frozen=True)
+class BacktestParameters:
+    amount: float
+    frequency: str = 'monthly'
+    # Maximum number of securities bought in every contribution, or None to buy all of them
+    purchases_to_keep: Optional[int] = None
+
+
+@dataclass
+class BacktestResult:
+    """
+    Value of the portfolio and its deviation from the desired allocation at the end of every trading day, with the
+    same standard error as balance.get_deviation_from_ideal
+    """
+    parameters: BacktestParameters
+    contribution_count: int
+    invested: float
+    values: np.ndarray
+    deviations: np.ndarray
+
+    @property
+    def final_value(self) -> float:
+        return float(self.values[-1]) if len(self.values) > 0 else 0.0
+
+    @property
+    def mean_deviation(self) -> float:
+        return float(self.deviations.mean()) if len(self.deviations) > 0 else 0.0
+
+    @property
+    def max_deviation(self) -> float:
+        return float(self.deviations.max()) if len(self.deviations) > 0 else 0.0
+
+    @property
+    def final_deviation(self) -> float:
+        return float(self.deviations[-1]) if len(self.deviations) > 0 else 0.0
+
+
+@dataclass
+class _BacktestData:
+    days: pd.DatetimeIndex
+    securities: List[Security]
+    prices: np.ndarray
+    desired_percentages: Allocation
+
+
+def _backtest_data(prices: pd.DataFrame, allocations: Mapping[Security, float]) -> _BacktestData:
+    """
+    Keeps the prices of the securities of the allocation, from the first day when all of them have a price. Days
+    without the price of a security take its previous price.
+    """
+    identifiers = [security.identifier for security in allocations.keys()]
+    missing_identifiers = [identifier for identifier in identifiers if identifier not in prices.columns]
+    if missing_identifiers:
+        raise ValueError(f'There are no prices for {", ".join(missing_identifiers)}')
+
+    prices = prices.set_axis(pd.to_datetime(prices.index), axis=0).sort_index()[identifiers].ffill()
+    prices = prices[prices.notna().all(axis=1)]
+    if prices.empty:
+        raise ValueError('There is no day with the prices of all the securities of the allocation')
+
+    return _BacktestData(days=pd.DatetimeIndex(prices.index), securities=list(allocations.keys()),
+                         prices=prices.to_numpy(dtype=np.float64),
+                         desired_percentages=Allocation.from_mapping(allocations))
+
+
+def _contribution_rows(days: pd.DatetimeIndex, frequency: str) -> np.ndarray:
+    if frequency not in FREQUENCIES:
+        raise ValueError(f'Unknown contribution frequency {frequency}')
+
+    periods = days.to_period(FREQUENCIES[frequency]).asi8
+    _, first_rows = np.unique(periods, return_index=True)
+    return np.sort(first_rows)
+
+
+def _run_backtest(data: _BacktestData, parameters: BacktestParameters) -> BacktestResult:
+    rows = _contribution_rows(data.days, parameters.frequency)
+    index = data.desired_percentages.index
+
+    # Only the contribution days change the shares, so the shares of every day are the cumulative sum of the changes
+    share_changes = np.zeros_like(data.prices)
+    shares = np.zeros(len(data.securities))
+    for row in rows:
+        row_prices = data.prices[row]
+        values = Portfolio(index, shares * row_prices)
+        purchases = balance.calculate_next_purchases(values, data.desired_percentages, parameters.amount,
+                                                     purchases_to_keep=parameters.purchases_to_keep)
+        positions = index.positions_of(purchases.keys())
+        share_changes[row, positions] = purchases.array / row_prices[positions]
+        shares += share_changes[row]
+
+    holdings_values = np.cumsum(share_changes, axis=0) * data.prices
+    totals = holdings_values.sum(axis=1)
+    desired = data.desired_percentages.array
+    with np.errstate(divide='ignore', invalid='ignore'):
+        residuals = desired - holdings_values / totals[:, np.newaxis]
+    deviations = np.where(totals > 0, np.sqrt((residuals ** 2).sum(axis=1)), 0.0)
+
+    return BacktestResult(parameters=parameters, contribution_count=len(rows), invested=parameters.amount * len(rows),
+                          values=totals, deviations=deviations)
+
+
+def run_backtest(prices: pd.DataFrame, allocations: Mapping[Security, float],
+                 parameters: BacktestParameters) -> BacktestResult:
+    """
+    Replays investing an amount periodically with calculate_next_purchases, starting from an empty portfolio, over
+    historical prices.
+    :param prices: Prices indexed by day, with the identifier of every security as column
+    :param allocations: Desired allocation of the portfolio
+    """
+    return _run_backtest(_backtest_data(prices, allocations), parameters)
+
+
+def parameter_grid(amounts: Iterable[float], frequencies: Iterable[str],
+                   purchases_to_keep: Iterable[Optional[int]]) -> List[BacktestParameters]:
+    return [BacktestParameters(amount, frequency, count)
+            for amount, frequency, count in itertools.product(amounts, frequencies, purchases_to_keep)]
+
+
+# Data of the backtests of a worker process, sent once when the process starts instead of with every backtest
+_worker_data: Optional[_BacktestData] = None
+
+
+def _initialize_worker(data: _BacktestData):
+    global _worker_data
+    _worker_data = data
+
+
+def _run_worker_backtest(parameters: BacktestParameters) -> BacktestResult:
+    return _run_backtest(_worker_data, parameters)
+
+
+def run_backtests(prices: pd.DataFrame, allocations: Mapping[Security, float],
+                  parameters: Sequence[BacktestParameters], workers: int = 1,
+                  chunk_size: int = CHUNK_SIZE) -> List[BacktestResult]:
+    """
+    Runs a backtest for every set of parameters over the same prices, across a process pool. The prices are sent to
+    every process once.
+    :param workers: Number of processes, or 1 to run everything in this process
+    :return: The result of every set of parameters, in the same order
+    """
+    data = _backtest_data(prices, allocations)
+    if workers <= 1:
+        return [_run_backtest(data, backtest_parameters) for backtest_parameters in parameters]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initialize_worker, initargs=(data,)) as executor:
+        return list(executor.map(_run_worker_backtest, parameters, chunksize=chunk_size))
@@ -0,0 +1,83 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from backtest import BacktestParameters, parameter_grid, run_backtest, run_backtests
+from data_types import Security
+
+ALLOCATIONS = {Security('AAPL'): 0.5, Security('TSLA'): 0.3, Security('AMZN'): 0.2}
+
+
+def _random_prices(days: pd.DatetimeIndex, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0003, 0.02, (len(days), len(ALLOCATIONS)))
+    return pd.DataFrame(100 * np.exp(np.cumsum(returns, axis=0)), index=days,
+                        columns=[security.identifier for security in ALLOCATIONS])
+
+
+class BacktesterTests(unittest.TestCase):
+    def test_contributions_on_first_trading_day_of_period(self):
+        prices = _random_prices(pd.bdate_range('2021-01-01', '2021-12-31'))
+
+        monthly = run_backtest(prices, ALLOCATIONS, BacktestParameters(100, 'monthly'))
+        quarterly = run_backtest(prices, ALLOCATIONS, BacktestParameters(100, 'quarterly'))
+        weekly = run_backtest(prices, ALLOCATIONS, BacktestParameters(100, 'weekly'))
+
+        self.assertEqual(12, monthly.contribution_count)
+        self.assertEqual(1200, monthly.invested)
+        self.assertEqual(4, quarterly.contribution_count)
+        self.assertEqual(53, weekly.contribution_count)
+        self.assertEqual(len(prices), len(monthly.values))
+        self.assertAlmostEqual(100, monthly.values[0])
+
+    def test_constant_prices_keep_allocation(self):
+        days = pd.bdate_range('2021-01-01', '2021-06-30')
+        prices = pd.DataFrame({'AAPL': 10.0, 'TSLA': 20.0, 'AMZN': 30.0}, index=days)
+
+        result = run_backtest(prices, ALLOCATIONS, BacktestParameters(100))
+
+        self.assertAlmostEqual(600, result.final_value)
+        self.assertAlmostEqual(0, result.max_deviation)
+
+    def test_limited_purchases_buy_one_security(self):
+        days = pd.bdate_range('2021-01-01', '2021-06-30')
+        prices = pd.DataFrame({'AAPL': 10.0, 'TSLA': 20.0, 'AMZN': 30.0}, index=days)
+
+        result = run_backtest(prices, ALLOCATIONS, BacktestParameters(100, purchases_to_keep=1))
+
+        # The first contribution only buys the security with the largest allocation
+        self.assertAlmostEqual(np.sqrt(0.3 ** 2 + 0.2 ** 2 + 0.5 ** 2), result.deviations[0])
+        self.assertLess(result.final_deviation, result.deviations[0])
+
+    def test_prices_start_when_all_securities_have_one(self):
+        days = pd.bdate_range('2021-01-01', '2021-03-31')
+        prices = _random_prices(days)
+        prices.loc[:'2021-01-31', 'AMZN'] = np.nan
+
+        result = run_backtest(prices, ALLOCATIONS, BacktestParameters(100))
+
+        self.assertEqual(2, result.contribution_count)
+        self.assertEqual(len(prices.loc['2021-02-01':]), len(result.values))
+
+    def test_missing_prices(self):
+        prices = _random_prices(pd.bdate_range('2021-01-01', '2021-03-31')).drop(columns=['TSLA'])
+
+        with self.assertRaises(ValueError):
+            run_backtest(prices, ALLOCATIONS, BacktestParameters(100))
+
+    def test_workers_return_same_results(self):
+        prices = _random_prices(pd.bdate_range('2018-01-01', '2021-12-31'), seed=3)
+        parameters = parameter_grid([100, 250], ['weekly', 'quarterly'], [1, None])
+
+        serial_results = run_backtests(prices, ALLOCATIONS, parameters)
+        parallel_results = run_backtests(prices, ALLOCATIONS, parameters, workers=2, chunk_size=3)
+
+        self.assertEqual(parameters, [result.parameters for result in parallel_results])
+        for serial_result, parallel_result in zip(serial_results, parallel_results):
+            np.testing.assert_array_equal(serial_result.values, parallel_result.values)
+            np.testing.assert_array_equal(serial_result.deviations, parallel_result.deviations)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1 +1,4 @@
-from .balance import calculate_next_purchases, get_deviation_from_ideal
\ No newline at end of file
+from .balance import calculate_next_purchases, get_deviation_from_ideal, LimitedPurchaseStrategy, \
+    search_limited_purchases, LimitedPurchaseSearch
+from .purchase_sweep import calculate_purchase_sweep, PurchaseSweep
+from .whole_shares import calculate_whole_share_purchases
@@ -1,27 +1,34 @@
-from typing import Dict
+from typing import Mapping
+
+import numpy as np
 
 from data_types import Security
+from data_types.security_values import Allocation
 
 
-Allocations = Dict[Security, float]
+Allocations = Mapping[Security, float]
 
 
-def _normalize_percentages_to_value(allocations: Allocations, value: float) -> Allocations:
-    sum_of_percentages = sum(allocations.values())
-    return {sec: percent * value / sum_of_percentages for sec, percent in allocations}
+def _normalize_percentages_to_value(allocations: Allocations, value: float) -> Allocation:
+    allocations = Allocation.from_mapping(allocations)
+    sum_of_percentages = allocations.array.sum()
+    return allocations.with_values(allocations.array * value / sum_of_percentages)
 
 
-def normalize_percentages(allocations: Allocations) -> Allocations:
+def normalize_percentages(allocations: Allocations) -> Allocation:
     return _normalize_percentages_to_value(allocations, 1.0)
 
 
-def set_single_allocation(allocations: Allocations, security: Security, percentage_to_set: float) -> Allocations:
+def set_single_allocation(allocations: Allocations, security: Security, percentage_to_set: float) -> Allocation:
     if percentage_to_set < 0.0 or percentage_to_set > 1.0:
         raise ValueError('Cannot set a percentage out of bounds')
 
     remaining_total_allocation = 1.0 - percentage_to_set
-    other_allocations = {sec: value for sec, value in allocations if sec != security}
+    allocations = Allocation.from_mapping(allocations)
+    is_other = np.array([sec != security for sec in allocations], dtype=bool)
+    other_allocations = Allocation.from_arrays([sec for sec in allocations if sec != security],
+                                               allocations.array[is_other])
 
     result_allocations = _normalize_percentages_to_value(other_allocations, remaining_total_allocation)
-    result_allocations[security] = percentage_to_set
-    return result_allocations
+    return Allocation.from_arrays([*result_allocations, security],
+                                  np.append(result_allocations.array, percentage_to_set))
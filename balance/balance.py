@@ -1,82 +1,163 @@
-import itertools
-from typing import Dict, Sequence, Optional
+from dataclasses import dataclass
+from enum import Enum
+from typing import Mapping, Optional
 
 import numpy as np
-import scipy.optimize as opt
 
+import profiling
 from data_types import Security
+from data_types.security_values import Allocation, Portfolio
+from .candidate_search import CandidateSearch, SearchBudget, search_all_candidates
+from .deviation_objective import DeviationObjective
 
 
 Money = float
 
 
-def _get_squared_deviation(purchases: np.ndarray, stocks: Sequence[Security],
-                           current_portfolio: Dict[Security, Money], desired_percentages: Dict[Security, float]):
-    purchases_dict = dict(zip(stocks, purchases))
-    all_stocks = set(current_portfolio.keys()).union(desired_percentages.keys())
-    new_portfolio = {stock: current_portfolio.get(stock, 0) + purchases_dict.get(stock, 0) for stock in all_stocks}
-    new_corrections = _get_fractional_corrections(new_portfolio, desired_percentages)
-
-    return sum(value ** 2 for value in new_corrections.values())
-
-
-def _get_fractional_corrections(current_portfolio: Dict[Security, Money],
-                                desired_percentages: Dict[Security, float]) -> Dict[Security, float]:
-    total_value = sum(current_portfolio.values())
-    if total_value > 0:
-        current_balance = {stock: price / total_value for stock, price in current_portfolio.items()}
-
-        all_stocks = set(current_balance.keys()).union(desired_percentages.keys())
-        difference_to_desired = {stock: desired_percentages.get(stock, 0) - current_balance.get(stock, 0) for stock in
-                                 all_stocks}
-
-        return difference_to_desired
+class LimitedPurchaseStrategy(Enum):
+    """
+    Search strategy used to choose the securities to buy when the number of purchases is limited.
+
+    EXACT solves the problem in closed form by water-filling the most underweight securities, and scales with the
+    number of securities as a sort. BRUTE_FORCE optimizes every combination of securities numerically, and is kept as
+    a reference.
+    """
+    EXACT = 'exact'
+    BRUTE_FORCE = 'brute_force'
+
+
+@dataclass
+class LimitedPurchaseSearch:
+    """
+    Best purchases found by the brute-force search, with their deviation from the desired allocation and a lower bound
+    of the deviation of any purchases of at most purchases_to_keep securities, both as standard errors. The search is
+    complete when every combination was searched before the budget ran out.
+    """
+    purchases: Portfolio
+    deviation: float
+    lower_bound: float
+    optimizations: int
+    complete: bool
+
+    @property
+    def gap(self) -> float:
+        return max(self.deviation - self.lower_bound, 0.0)
+
+
+def search_limited_purchases(current_portfolio: Mapping[Security, Money],
+                             desired_percentages: Mapping[Security, float], amount_to_invest: Money,
+                             purchases_to_keep: int, time_budget: Optional[float] = None,
+                             max_evaluations: Optional[int] = None, workers: int = 1) -> LimitedPurchaseSearch:
+    """
+    Optimizes the purchases of every combination of purchases_to_keep securities numerically, starting with the most
+    underweight securities, until the time budget or the maximum number of optimized combinations runs out.
+
+    The lower bound is the deviation of the exact water-filling, which no purchases of at most purchases_to_keep
+    securities can improve. When no combination with positive purchases was found, the exact purchases are returned.
+    :param time_budget: Seconds after which the search stops, or None to search every combination
+    :param max_evaluations: Maximum number of combinations optimized, or None to search every combination
+    :param workers: Number of processes used by the search
+    """
+    objective = DeviationObjective(current_portfolio, desired_percentages)
+    search = CandidateSearch(objective, amount_to_invest, purchases_to_keep)
+    budget = SearchBudget(time_budget, max_evaluations)
+    with profiling.phase('brute-force search'):
+        best_deviation, best_candidate, best_purchases = search_all_candidates(search, workers, budget=budget)
+    profiling.count('optimizer runs', search.optimizations)
+    profiling.count('objective evaluations', search.objective_evaluations)
+
+    exact_purchases = _calculate_exact_limited_purchases(current_portfolio, desired_percentages, amount_to_invest,
+                                                         purchases_to_keep)
+    lower_bound = objective.value(objective.purchase_vector(exact_purchases), np.arange(len(objective.securities)))
+    if best_candidate is None:
+        purchases, best_deviation = exact_purchases, lower_bound
     else:
-        return {stock: 0.0 for stock in desired_percentages.keys()}
-
-
-def _calculate_limited_purchases(current_portfolio: Dict[Security, Money], desired_percentages: Dict[Security, float],
-                                 amount_to_invest: Money, purchases_to_keep: int) -> Dict[Security, Money]:
-    all_stocks = set(current_portfolio.keys()).union(desired_percentages.keys())
-    stock_combinations = itertools.combinations(all_stocks, purchases_to_keep)
-    min_deviation = float('inf')
-    next_purchases = None
-    for stock_candidates in stock_combinations:
-        purchase_guess = amount_to_invest * np.ones(purchases_to_keep) / purchases_to_keep
-        constraint_sum_to_investment = opt.LinearConstraint(np.ones_like(purchase_guess),
-                                                            amount_to_invest,
-                                                            amount_to_invest)
-        purchase_optim = opt.minimize(_get_squared_deviation, purchase_guess,
-                                      method='trust-constr',
-                                      args=(stock_candidates, current_portfolio, desired_percentages),
-                                      constraints=constraint_sum_to_investment)
-        deviation = purchase_optim.fun
-        if any(purchase < 0 for purchase in purchase_optim.x):
-            continue
-
-        if deviation < min_deviation:
-            min_deviation = deviation
-            next_purchases = dict(zip(stock_candidates, purchase_optim.x))
-
-    return next_purchases
-
-
-def calculate_next_purchases(current_portfolio: Dict[Security, Money], desired_percentages: Dict[Security, float],
-                             amount_to_invest: Money, purchases_to_keep: Optional[int] = None) -> Dict[Security, Money]:
+        purchases = Portfolio.from_arrays([objective.securities[index] for index in best_candidate], best_purchases)
+
+    return LimitedPurchaseSearch(purchases=purchases, deviation=float(np.sqrt(best_deviation)),
+                                 lower_bound=float(np.sqrt(lower_bound)), optimizations=search.optimizations,
+                                 complete=not budget.exhausted)
+
+
+def _calculate_exact_limited_purchases(current_portfolio: Mapping[Security, Money],
+                                       desired_percentages: Mapping[Security, float],
+                                       amount_to_invest: Money, purchases_to_keep: int) -> Portfolio:
+    """
+    Once the purchased securities are fixed, the total value after investing is fixed too, and every purchased
+    security ends up with the same residual (the water level) with respect to its desired fraction. Buying a more
+    underweight security is never worse than buying a less underweight one, so the optimal purchases are the
+    water-filling of the purchases_to_keep most underweight securities. Securities that would need a negative purchase
+    are dropped from the active set until the level is consistent.
+
+    When all the chosen securities get a positive purchase, the result is the same optimum as the brute-force search.
+    Otherwise fewer than purchases_to_keep securities are returned, with a deviation that is not worse than the best
+    combination where all the purchases are positive.
+    """
+    objective = DeviationObjective(current_portfolio, desired_percentages)
+    total_value = objective.current_total + amount_to_invest
+    if total_value <= 0 or amount_to_invest <= 0 or purchases_to_keep <= 0:
+        return Portfolio.from_arrays([], [])
+
+    residuals = objective.desired - objective.current / total_value
+    invested_fraction = amount_to_invest / total_value
+
+    active = np.argsort(-residuals, kind='stable')[:purchases_to_keep]
+    while True:
+        water_level = (residuals[active].sum() - invested_fraction) / len(active)
+        above_level = residuals[active] > water_level
+        if above_level.all():
+            break
+        active = active[above_level]
+
+    purchases = total_value * (residuals[active] - water_level)
+    return Portfolio.from_arrays([objective.securities[index] for index in active], purchases)
+
+
+def calculate_next_purchases(current_portfolio: Mapping[Security, Money],
+                             desired_percentages: Mapping[Security, float], amount_to_invest: Money,
+                             purchases_to_keep: Optional[int] = None,
+                             strategy: LimitedPurchaseStrategy = LimitedPurchaseStrategy.EXACT,
+                             workers: int = 1, time_budget: Optional[float] = None,
+                             max_evaluations: Optional[int] = None) -> Portfolio:
+    """
+    Calculates the purchases that bring the portfolio closest to the desired allocation.
+    :param purchases_to_keep: Maximum number of securities to buy, or None to buy all the securities
+    :param strategy: Search strategy used when purchases_to_keep is given
+    :param workers: Number of processes used by the brute-force search
+    :param time_budget: Seconds after which the brute-force search returns the best purchases found until then
+    :param max_evaluations: Maximum number of combinations of securities optimized by the brute-force search
+    """
+    with profiling.phase('balance'):
+        return _calculate_next_purchases(current_portfolio, desired_percentages, amount_to_invest, purchases_to_keep,
+                                         strategy, workers, time_budget, max_evaluations)
+
+
+def _calculate_next_purchases(current_portfolio: Mapping[Security, Money],
+                              desired_percentages: Mapping[Security, float], amount_to_invest: Money,
+                              purchases_to_keep: Optional[int], strategy: LimitedPurchaseStrategy, workers: int,
+                              time_budget: Optional[float], max_evaluations: Optional[int]) -> Portfolio:
     if purchases_to_keep is None:
-        total_value = sum(current_portfolio.values())
-        percent_corrections = _get_fractional_corrections(current_portfolio, desired_percentages)
-        corrections_needed = {stock: diff * total_value for stock, diff in percent_corrections.items()}
-
-        balanced_investments = {stock: desired_percentages.get(stock, 0) * amount_to_invest for stock in corrections_needed.keys()}
-        return {stock: correction + balanced_investments[stock] for stock, correction in corrections_needed.items()}
+        # Every security ends at its desired fraction of the total after investing. An empty portfolio is only split
+        # by the desired allocation.
+        objective = DeviationObjective(current_portfolio, desired_percentages)
+        if objective.current_total <= 0:
+            desired_percentages = Allocation.from_mapping(desired_percentages)
+            return Portfolio(desired_percentages.index, desired_percentages.array * amount_to_invest)
+
+        return objective.portfolio(objective.desired * (objective.current_total + amount_to_invest) - objective.current)
+    elif strategy == LimitedPurchaseStrategy.EXACT:
+        return _calculate_exact_limited_purchases(current_portfolio, desired_percentages, amount_to_invest,
+                                                  purchases_to_keep)
+    elif strategy == LimitedPurchaseStrategy.BRUTE_FORCE:
+        return search_limited_purchases(current_portfolio, desired_percentages, amount_to_invest, purchases_to_keep,
+                                        time_budget, max_evaluations, workers).purchases
     else:
-        return _calculate_limited_purchases(current_portfolio, desired_percentages, amount_to_invest, purchases_to_keep)
+        raise ValueError(f'Unknown limited purchase strategy {strategy}')
 
 
-def get_deviation_from_ideal(current_portfolio: Dict[Security, Money], purchases: Dict[Security, Money],
-                             desired_percentages: Dict[Security, float]):
-    purchases_array = np.array(list(purchases.values()))
-    stocks = list(purchases.keys())
+def get_deviation_from_ideal(current_portfolio: Mapping[Security, Money], purchases: Mapping[Security, Money],
+                             desired_percentages: Mapping[Security, float]):
+    objective = DeviationObjective(current_portfolio, desired_percentages)
+    all_indices = np.arange(len(objective.securities))
 
-    return np.sqrt(_get_squared_deviation(purchases_array, stocks, current_portfolio, desired_percentages))
+    return np.sqrt(objective.value(objective.purchase_vector(purchases), all_indices))
@@ -0,0 +1,239 @@
+import itertools
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .deviation_objective import DeviationObjective, Money
+
+
+CHUNK_SIZE = 256
+
+Candidate = Tuple[int, ...]
+SearchResult = Tuple[float, Optional[Candidate], Optional[np.ndarray]]
+
+
+class SearchBudget:
+    """
+    Time and number of optimizations after which a search stops, keeping the best candidate found until then. The
+    counters are in shared memory, so that every process of a parallel search spends the same budget.
+    """
+    def __init__(self, time_budget: Optional[float] = None, max_optimizations: Optional[int] = None):
+        # Wall clock time, since the reference of the monotonic clock may differ between processes
+        self._deadline = time.time() + time_budget if time_budget is not None else None
+        self._max_optimizations = max_optimizations
+        self._optimizations = multiprocessing.Value('q', 0)
+        self._exhausted = multiprocessing.RawValue('b', 0)
+
+    @property
+    def exhausted(self) -> bool:
+        """
+        :return: Whether a search was stopped because the budget ran out
+        """
+        return bool(self._exhausted.value)
+
+    def spend_optimization(self) -> bool:
+        """
+        :return: Whether there is budget left for another optimization, which is then counted as spent
+        """
+        if self._exhausted.value:
+            return False
+
+        if self._deadline is not None and time.time() >= self._deadline:
+            self._exhausted.value = 1
+            return False
+
+        if self._max_optimizations is not None:
+            with self._optimizations.get_lock():
+                if self._optimizations.value >= self._max_optimizations:
+                    self._exhausted.value = 1
+                    return False
+                self._optimizations.value += 1
+
+        return True
+
+
+class CandidateSearch:
+    """
+    Numerical optimization of the purchases for subsets of securities (candidates), given by their indices in a
+    DeviationObjective. Every purchase of a candidate is optimized with trust-constr, and candidates that need a
+    negative purchase are discarded.
+    """
+    def __init__(self, objective: DeviationObjective, amount_to_invest: Money, purchases_to_keep: int):
+        self.objective = objective
+        self.amount_to_invest = amount_to_invest
+        self.purchases_to_keep = purchases_to_keep
+
+        # Amount of numerical optimizations and of objective evaluations done by them, for profiling
+        self.optimizations = 0
+        self.objective_evaluations = 0
+
+        # The sum of the purchases is constrained to the amount to invest, so the total value after investing is
+        # fixed and the residuals of the securities that are not bought do not depend on the purchases.
+        total_value = objective.current_total + amount_to_invest
+        if total_value > 0:
+            self.residuals = objective.desired - objective.current / total_value
+        else:
+            self.residuals = np.zeros(len(objective.securities))
+        self._squared_residuals = self.residuals ** 2
+        self._total_squared_residual = self._squared_residuals.sum()
+
+    def lower_bound(self, candidate: Candidate) -> float:
+        """
+        :return: Deviation of the securities that are not in the candidate, which no purchase can reduce
+        """
+        return self._total_squared_residual - self._squared_residuals[list(candidate)].sum()
+
+    def optimize(self, candidate: Candidate) -> Optional[Tuple[float, np.ndarray]]:
+        """
+        :return: The squared deviation and the purchases of the candidate, or None if a purchase is negative
+        """
+        # scipy is only needed by the brute-force search, so the exact strategy does not pay for importing it
+        import scipy.optimize as opt
+
+        candidate_indices = np.array(candidate, dtype=np.intp)
+        purchase_guess = self.amount_to_invest * np.ones(self.purchases_to_keep) / self.purchases_to_keep
+        constraint_sum_to_investment = opt.LinearConstraint(np.ones_like(purchase_guess),
+                                                            self.amount_to_invest,
+                                                            self.amount_to_invest)
+        purchase_optim = opt.minimize(self.objective.value, purchase_guess,
+                                      method='trust-constr',
+                                      args=(candidate_indices,),
+                                      jac=self.objective.gradient,
+                                      hess=self.objective.hessian,
+                                      constraints=constraint_sum_to_investment)
+        self.optimizations += 1
+        self.objective_evaluations += purchase_optim.nfev
+        if any(purchase < 0 for purchase in purchase_optim.x):
+            return None
+
+        return purchase_optim.fun, purchase_optim.x
+
+    def search(self, candidates: Iterable[Candidate], shared_best,
+               budget: Optional[SearchBudget] = None) -> SearchResult:
+        """
+        Searches the best candidate of the iterable. Candidates whose lower bound is not better than the best
+        deviation found so far, either here or in shared_best, are skipped without optimizing them.
+        :param shared_best: Object with a float 'value' attribute holding the best deviation found by any search
+        :param budget: Budget of optimizations, after which the rest of the candidates are not searched
+        :return: The best squared deviation, candidate and purchases. The candidate is None if none was feasible.
+        """
+        best_deviation, best_candidate, best_purchases = float('inf'), None, None
+        for candidate in candidates:
+            if self.lower_bound(candidate) >= min(best_deviation, shared_best.value):
+                continue
+            if budget is not None and not budget.spend_optimization():
+                break
+
+            result = self.optimize(candidate)
+            if result is None:
+                continue
+
+            deviation, purchases = result
+            if deviation < best_deviation:
+                best_deviation, best_candidate, best_purchases = deviation, candidate, purchases
+                _update_shared_best(shared_best, deviation)
+
+        return best_deviation, best_candidate, best_purchases
+
+
+def _update_shared_best(shared_best, deviation: float):
+    get_lock = getattr(shared_best, 'get_lock', None)
+    if get_lock is None:
+        shared_best.value = min(shared_best.value, deviation)
+        return
+
+    with get_lock():
+        if deviation < shared_best.value:
+            shared_best.value = deviation
+
+
+_worker_search: Optional[CandidateSearch] = None
+_worker_best = None
+_worker_budget: Optional[SearchBudget] = None
+
+
+def _initialize_worker(search: CandidateSearch, shared_best, budget: Optional[SearchBudget]):
+    global _worker_search, _worker_best, _worker_budget
+    _worker_search = search
+    _worker_best = shared_best
+    _worker_budget = budget
+
+
+def _search_chunk(chunk: Sequence[Candidate]) -> Tuple[SearchResult, int, int]:
+    """
+    :return: The result of the chunk, and the amount of optimizations and objective evaluations it needed
+    """
+    optimizations, objective_evaluations = _worker_search.optimizations, _worker_search.objective_evaluations
+    result = _worker_search.search(chunk, _worker_best, _worker_budget)
+    return (result, _worker_search.optimizations - optimizations,
+            _worker_search.objective_evaluations - objective_evaluations)
+
+
+def _chunks(candidates: Iterator[Candidate], chunk_size: int) -> Iterator[Sequence[Candidate]]:
+    while True:
+        chunk = list(itertools.islice(candidates, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _is_better(result: SearchResult, best: SearchResult) -> bool:
+    deviation, candidate, _ = result
+    best_deviation, best_candidate, _ = best
+    if candidate is None:
+        return False
+
+    return best_candidate is None or (deviation, candidate) < (best_deviation, best_candidate)
+
+
+def ordered_candidates(search: CandidateSearch) -> Iterator[Candidate]:
+    """
+    Every combination of search.purchases_to_keep securities, starting with the most underweight securities, so that
+    the best candidates tend to come first and a search that runs out of budget has already seen them.
+    """
+    order = np.argsort(-search.residuals, kind='stable').tolist()
+    return itertools.combinations(order, search.purchases_to_keep)
+
+
+def search_all_candidates(search: CandidateSearch, workers: int = 1, chunk_size: int = CHUNK_SIZE,
+                          budget: Optional[SearchBudget] = None) -> SearchResult:
+    """
+    Searches every combination of search.purchases_to_keep securities, in the order of ordered_candidates, until the
+    budget runs out. With more than one worker, the combinations are split in chunks across a process pool, and the
+    workers share the best deviation so that they can skip candidates whose lower bound is already worse.
+    """
+    candidates = ordered_candidates(search)
+    if workers <= 1:
+        return search.search(candidates, multiprocessing.RawValue('d', float('inf')), budget)
+
+    shared_best = multiprocessing.Value('d', float('inf'))
+    best: SearchResult = (float('inf'), None, None)
+
+    def merge_chunk_result(future):
+        nonlocal best
+        result, optimizations, objective_evaluations = future.result()
+        search.optimizations += optimizations
+        search.objective_evaluations += objective_evaluations
+        if _is_better(result, best):
+            best = result
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initialize_worker,
+                             initargs=(search, shared_best, budget)) as executor:
+        pending = set()
+        for chunk in _chunks(candidates, chunk_size):
+            if budget is not None and budget.exhausted:
+                break
+            # Keep a bounded number of chunks in flight, so that the combinations are not materialized at once
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge_chunk_result(future)
+            pending.add(executor.submit(_search_chunk, chunk))
+
+        for future in pending:
+            merge_chunk_result(future)
+
+    return best
@@ -0,0 +1,109 @@
+from typing import Mapping, Sequence
+
+import numpy as np
+
+from data_types import Security
+from data_types.security_values import Allocation, Portfolio
+
+
+Money = float
+
+
+class DeviationObjective:
+    """
+    Squared deviation of a portfolio from its desired allocation after a set of purchases, evaluated on NumPy arrays.
+
+    The securities of the current portfolio and of the desired allocation are mapped to fixed integer indices once,
+    so that every evaluation of the objective (and of its exact gradient and Hessian) only deals with arrays. The
+    purchases are given for a subset of the securities, selected by their indices.
+
+    The portfolio and the allocation are converted to a Portfolio and an Allocation, so that the ones that already are
+    only need their arrays to be aligned.
+    """
+    def __init__(self, current_portfolio: Mapping[Security, Money], desired_percentages: Mapping[Security, float]):
+        current_portfolio = Portfolio.from_mapping(current_portfolio)
+        desired_percentages = Allocation.from_mapping(desired_percentages)
+        self.index = current_portfolio.index.union(desired_percentages.index)
+        self.securities = list(self.index.securities)
+
+        self.current = current_portfolio.aligned_to(self.index).astype(np.float64)
+        self.desired = desired_percentages.aligned_to(self.index).astype(np.float64)
+        self.current_total = self.current.sum()
+
+    def indices_of(self, securities: Sequence[Security]) -> np.ndarray:
+        return self.index.positions_of(securities)
+
+    def portfolio(self, vector: np.ndarray) -> Portfolio:
+        """
+        Converts an array over all the securities of the objective to a Portfolio that shares their index
+        """
+        return Portfolio(self.index, vector)
+
+    def purchase_vector(self, purchases: Mapping[Security, Money]) -> np.ndarray:
+        """
+        Converts a dictionary of purchases to an array over all the securities of the objective. Purchases of
+        securities that are neither in the portfolio nor in the desired allocation are ignored.
+        """
+        if isinstance(purchases, Portfolio) and purchases.index is self.index:
+            return purchases.array.astype(np.float64)
+
+        vector = np.zeros(len(self.securities))
+        positions = self.index.positions
+        for security, amount in purchases.items():
+            index = positions.get(security)
+            if index is not None:
+                vector[index] = amount
+
+        return vector
+
+    def _residuals(self, purchases: np.ndarray, indices: np.ndarray):
+        new_portfolio = self.current.copy()
+        new_portfolio[indices] += purchases
+        total = new_portfolio.sum()
+        if total <= 0:
+            return None, None, total
+
+        weights = new_portfolio / total
+        return self.desired - weights, weights, total
+
+    def value(self, purchases: np.ndarray, indices: np.ndarray) -> float:
+        residuals, _, _ = self._residuals(purchases, indices)
+        if residuals is None:
+            return 0.0
+
+        return float(residuals @ residuals)
+
+    def batch_value(self, purchases: np.ndarray) -> np.ndarray:
+        """
+        Evaluates the objective for several sets of purchases at once.
+        :param purchases: Matrix with a row of purchases over all the securities for every evaluation
+        """
+        new_portfolios = self.current + purchases
+        totals = new_portfolios.sum(axis=1)
+        positive_totals = totals > 0
+
+        residuals = self.desired - new_portfolios[positive_totals] / totals[positive_totals, np.newaxis]
+        values = np.zeros(len(totals))
+        values[positive_totals] = np.einsum('ij,ij->i', residuals, residuals)
+        return values
+
+    def gradient(self, purchases: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        residuals, weights, total = self._residuals(purchases, indices)
+        if residuals is None:
+            return np.zeros(len(indices))
+
+        weighted_residual = residuals @ weights
+        return -2.0 * (residuals[indices] - weighted_residual) / total
+
+    def hessian(self, purchases: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        residuals, weights, total = self._residuals(purchases, indices)
+        if residuals is None:
+            return np.zeros((len(indices), len(indices)))
+
+        weighted_residual = residuals @ weights
+        squared_weights = weights @ weights
+        selected = residuals[indices] - weights[indices]
+        hessian = np.eye(len(indices)) + selected[:, np.newaxis] + selected[np.newaxis, :]
+        hessian += squared_weights - 2.0 * weighted_residual
+
+        return 2.0 * hessian / total ** 2
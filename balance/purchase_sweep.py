@@ -0,0 +1,89 @@
+from dataclasses import dataclass
+from typing import List, Mapping, Optional, Sequence
+
+import numpy as np
+
+from data_types import Security
+from data_types.security_values import Portfolio
+from .deviation_objective import DeviationObjective, Money
+
+
+@dataclass
+class PurchaseSweep:
+    """
+    Purchases and deviations from the desired allocation for several amounts to invest. Row i of the purchases is the
+    purchase of every security when amounts[i] is invested.
+    """
+    amounts: np.ndarray
+    securities: List[Security]
+    purchases: np.ndarray
+    deviations: np.ndarray
+
+    def purchases_at(self, row: int) -> Portfolio:
+        """
+        :return: The purchases of the row that are not zero
+        """
+        row_purchases = self.purchases[row]
+        bought = np.flatnonzero(row_purchases)
+        return Portfolio.from_arrays([self.securities[index] for index in bought], row_purchases[bought])
+
+
+def _unlimited_purchases(objective: DeviationObjective, amounts: np.ndarray) -> np.ndarray:
+    # Every security ends at its desired fraction of the total after investing, so the purchases are linear in the
+    # amount. An empty portfolio is only split by the desired allocation.
+    purchases = np.outer(amounts, objective.desired)
+    if objective.current_total > 0:
+        purchases += objective.desired * objective.current_total - objective.current
+
+    return purchases
+
+
+def _limited_purchases(objective: DeviationObjective, amounts: np.ndarray, purchases_to_keep: int) -> np.ndarray:
+    # Same water-filling as balance._calculate_exact_limited_purchases, solved for every amount at once. The order of
+    # the securities depends on the total after investing, so it is computed for every row.
+    purchases = np.zeros((len(amounts), len(objective.securities)))
+    totals = objective.current_total + amounts
+    solvable = (totals > 0) & (amounts > 0)
+    purchases_to_keep = min(purchases_to_keep, len(objective.securities))
+    if purchases_to_keep <= 0 or not solvable.any():
+        return purchases
+
+    totals = totals[solvable]
+    residuals = objective.desired - objective.current / totals[:, np.newaxis]
+    invested_fractions = amounts[solvable] / totals
+
+    order = np.argsort(-residuals, axis=1, kind='stable')[:, :purchases_to_keep]
+    top_residuals = np.take_along_axis(residuals, order, axis=1)
+    active = np.ones_like(top_residuals, dtype=bool)
+    while True:
+        water_levels = ((top_residuals * active).sum(axis=1) - invested_fractions) / active.sum(axis=1)
+        above_level = active & (top_residuals > water_levels[:, np.newaxis])
+        if (above_level == active).all():
+            break
+        active = above_level
+
+    top_purchases = np.where(active, totals[:, np.newaxis] * (top_residuals - water_levels[:, np.newaxis]), 0.0)
+    solvable_purchases = np.zeros((len(totals), len(objective.securities)))
+    np.put_along_axis(solvable_purchases, order, top_purchases, axis=1)
+    purchases[solvable] = solvable_purchases
+
+    return purchases
+
+
+def calculate_purchase_sweep(current_portfolio: Mapping[Security, Money], desired_percentages: Mapping[Security, float],
+                             amounts: Sequence[Money], purchases_to_keep: Optional[int] = None) -> PurchaseSweep:
+    """
+    Calculates the next purchases and their deviation from the desired allocation for several amounts to invest, with
+    a single computation over all the amounts. The purchases of every amount are the same as the ones of
+    calculate_next_purchases with the exact strategy.
+    :param purchases_to_keep: Maximum number of securities to buy, or None to buy all the securities
+    """
+    objective = DeviationObjective(current_portfolio, desired_percentages)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    if purchases_to_keep is None:
+        purchases = _unlimited_purchases(objective, amounts)
+    else:
+        purchases = _limited_purchases(objective, amounts, purchases_to_keep)
+
+    return PurchaseSweep(amounts=amounts, securities=list(objective.securities), purchases=purchases,
+                         deviations=np.sqrt(objective.batch_value(purchases)))
@@ -0,0 +1,29 @@
+import unittest
+
+from balance import allocation_tools
+from data_types import Security
+
+ALLOCATIONS = {Security('AAPL'): 2.0, Security('TSLA'): 1.0, Security('AMZN'): 1.0}
+
+
+class AllocationToolsTests(unittest.TestCase):
+    def test_normalize_percentages(self):
+        normalized = allocation_tools.normalize_percentages(ALLOCATIONS)
+
+        self.assertEqual({Security('AAPL'): 0.5, Security('TSLA'): 0.25, Security('AMZN'): 0.25}, normalized)
+
+    def test_set_single_allocation(self):
+        allocations = allocation_tools.set_single_allocation(ALLOCATIONS, Security('TSLA'), 0.2)
+
+        self.assertEqual([Security('AAPL'), Security('AMZN'), Security('TSLA')], list(allocations.keys()))
+        self.assertAlmostEqual(0.8 * 2 / 3, allocations[Security('AAPL')])
+        self.assertAlmostEqual(0.8 / 3, allocations[Security('AMZN')])
+        self.assertAlmostEqual(0.2, allocations[Security('TSLA')])
+
+    def test_set_out_of_bounds_allocation(self):
+        with self.assertRaises(ValueError):
+            allocation_tools.set_single_allocation(ALLOCATIONS, Security('TSLA'), 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import unittest
 
+import numpy as np
+
 import balance as bln
+import profiling
 from data_types import Security
 
 
@@ -57,4 +60,118 @@ class TestBalance(unittest.TestCase):
         self.assertIn(Security('AMZN'), next_purchases.keys())
 
         self.assertAlmostEqual(next_purchases[Security('TSLA')], amount_to_invest / 2)
-        self.assertAlmostEqual(next_purchases[Security('AMZN')], amount_to_invest / 2)
\ No newline at end of file
+        self.assertAlmostEqual(next_purchases[Security('AMZN')], amount_to_invest / 2)
+
+    def test_exact_limited_purchases_match_brute_force(self):
+        rng = np.random.default_rng(0)
+        securities = [Security(f'SEC{index}') for index in range(6)]
+        for _ in range(5):
+            desired_percentages = dict(zip(securities, rng.dirichlet(np.ones(len(securities)))))
+            portfolio = dict(zip(securities, 1000 * rng.random(len(securities))))
+            amount_to_invest = 500
+
+            for purchases_to_keep in range(1, 4):
+                exact = bln.calculate_next_purchases(portfolio, desired_percentages, amount_to_invest,
+                                                     purchases_to_keep=purchases_to_keep)
+                brute_force = bln.calculate_next_purchases(portfolio, desired_percentages, amount_to_invest,
+                                                           purchases_to_keep=purchases_to_keep,
+                                                           strategy=bln.LimitedPurchaseStrategy.BRUTE_FORCE)
+
+                self.assertLessEqual(len(exact), purchases_to_keep)
+                self.assertAlmostEqual(sum(exact.values()), amount_to_invest, 8)
+                self.assertTrue(all(purchase > 0 for purchase in exact.values()))
+
+                exact_deviation = bln.get_deviation_from_ideal(portfolio, exact, desired_percentages)
+                if brute_force is not None:
+                    brute_force_deviation = bln.get_deviation_from_ideal(portfolio, brute_force, desired_percentages)
+                    self.assertLessEqual(exact_deviation, brute_force_deviation + 1e-6)
+                if len(exact) == purchases_to_keep:
+                    self.assertEqual(set(exact.keys()), set(brute_force.keys()))
+                    for security, purchase in exact.items():
+                        self.assertAlmostEqual(purchase, brute_force[security], 2)
+
+    def test_exact_limited_purchases_scale_to_many_securities(self):
+        rng = np.random.default_rng(1)
+        securities = [Security(f'SEC{index}') for index in range(2000)]
+        desired_percentages = dict(zip(securities, rng.dirichlet(np.ones(len(securities)))))
+        portfolio = dict(zip(securities, 1000 * rng.random(len(securities))))
+
+        next_purchases = bln.calculate_next_purchases(portfolio, desired_percentages, 10_000, purchases_to_keep=50)
+
+        self.assertLessEqual(len(next_purchases), 50)
+        self.assertAlmostEqual(sum(next_purchases.values()), 10_000, 6)
+
+    def test_parallel_brute_force_matches_serial(self):
+        rng = np.random.default_rng(2)
+        securities = [Security(f'SEC{index}') for index in range(7)]
+        desired_percentages = dict(zip(securities, rng.dirichlet(np.ones(len(securities)))))
+        portfolio = dict(zip(securities, 1000 * rng.random(len(securities))))
+
+        serial = bln.calculate_next_purchases(portfolio, desired_percentages, 800, purchases_to_keep=3,
+                                              strategy=bln.LimitedPurchaseStrategy.BRUTE_FORCE)
+        parallel = bln.calculate_next_purchases(portfolio, desired_percentages, 800, purchases_to_keep=3,
+                                                strategy=bln.LimitedPurchaseStrategy.BRUTE_FORCE, workers=2)
+
+        self.assertEqual(set(serial.keys()), set(parallel.keys()))
+        for security, purchase in serial.items():
+            self.assertAlmostEqual(purchase, parallel[security], 4)
+
+    def test_brute_force_records_objective_evaluations(self):
+        rng = np.random.default_rng(3)
+        securities = [Security(f'SEC{index}') for index in range(5)]
+        desired_percentages = dict(zip(securities, rng.dirichlet(np.ones(len(securities)))))
+        portfolio = dict(zip(securities, 1000 * rng.random(len(securities))))
+
+        with profiling.recording() as recorder:
+            bln.calculate_next_purchases(portfolio, desired_percentages, 800, purchases_to_keep=2,
+                                         strategy=bln.LimitedPurchaseStrategy.BRUTE_FORCE)
+
+        timings = recorder.timings
+        self.assertEqual(timings['balance'].calls, 1)
+        self.assertGreaterEqual(timings['optimizer runs'].calls, 1)
+        self.assertGreaterEqual(timings['objective evaluations'].calls, timings['optimizer runs'].calls)
+
+    def test_brute_force_stops_after_max_evaluations(self):
+        rng = np.random.default_rng(4)
+        securities = [Security(f'SEC{index}') for index in range(12)]
+        desired_percentages = dict(zip(securities, rng.dirichlet(np.ones(len(securities)))))
+        portfolio = dict(zip(securities, 1000 * rng.random(len(securities))))
+
+        search = bln.search_limited_purchases(portfolio, desired_percentages, 800, 3, max_evaluations=2)
+        exact = bln.calculate_next_purchases(portfolio, desired_percentages, 800, purchases_to_keep=3)
+
+        self.assertFalse(search.complete)
+        self.assertEqual(2, search.optimizations)
+        self.assertAlmostEqual(sum(search.purchases.values()), 800, 4)
+        self.assertAlmostEqual(search.deviation,
+                               bln.get_deviation_from_ideal(portfolio, search.purchases, desired_percentages), 6)
+        self.assertAlmostEqual(search.lower_bound, bln.get_deviation_from_ideal(portfolio, exact, desired_percentages))
+        self.assertGreaterEqual(search.gap, 0)
+
+    def test_brute_force_without_budget_falls_back_to_exact(self):
+        rng = np.random.default_rng(5)
+        securities = [Security(f'SEC{index}') for index in range(8)]
+        desired_percentages = dict(zip(securities, rng.dirichlet(np.ones(len(securities)))))
+        portfolio = dict(zip(securities, 1000 * rng.random(len(securities))))
+
+        search = bln.search_limited_purchases(portfolio, desired_percentages, 800, 3, time_budget=0)
+
+        self.assertFalse(search.complete)
+        self.assertEqual(0, search.optimizations)
+        self.assertEqual(bln.calculate_next_purchases(portfolio, desired_percentages, 800, purchases_to_keep=3),
+                         search.purchases)
+        self.assertAlmostEqual(0, search.gap)
+
+    def test_complete_brute_force_closes_gap(self):
+        rng = np.random.default_rng(6)
+        securities = [Security(f'SEC{index}') for index in range(7)]
+        desired_percentages = dict(zip(securities, rng.dirichlet(np.ones(len(securities)))))
+        portfolio = dict(zip(securities, 1000 * rng.random(len(securities))))
+
+        search = bln.search_limited_purchases(portfolio, desired_percentages, 800, 2, time_budget=60)
+        parallel_search = bln.search_limited_purchases(portfolio, desired_percentages, 800, 2, max_evaluations=3,
+                                                       workers=2)
+
+        self.assertTrue(search.complete)
+        self.assertAlmostEqual(search.lower_bound, search.deviation, 6)
+        self.assertLessEqual(parallel_search.optimizations, 3)
@@ -0,0 +1,39 @@
+import unittest
+
+import numpy as np
+import scipy.optimize as opt
+
+from balance.deviation_objective import DeviationObjective
+from data_types import Security
+
+
+class TestDeviationObjective(unittest.TestCase):
+    def setUp(self):
+        current_portfolio = {Security('TSLA'): 3000, Security('AMZN'): 4000, Security('AAPL'): 3000}
+        desired_percentages = {Security('TSLA'): 0.25, Security('AMZN'): 0.5, Security('AAPL'): 0.1,
+                               Security('MSFT'): 0.15}
+        self.objective = DeviationObjective(current_portfolio, desired_percentages)
+        self.indices = self.objective.indices_of([Security('MSFT'), Security('TSLA'), Security('AMZN')])
+        self.purchases = np.array([200.0, 500.0, 300.0])
+
+    def test_value(self):
+        expected_portfolio = {'TSLA': 3500, 'AMZN': 4300, 'AAPL': 3000, 'MSFT': 200}
+        expected_percentages = {'TSLA': 0.25, 'AMZN': 0.5, 'AAPL': 0.1, 'MSFT': 0.15}
+        total = sum(expected_portfolio.values())
+        expected_value = sum((expected_percentages[sec] - value / total) ** 2
+                             for sec, value in expected_portfolio.items())
+
+        self.assertAlmostEqual(self.objective.value(self.purchases, self.indices), expected_value, 12)
+
+    def test_gradient_matches_finite_differences(self):
+        numeric_gradient = opt.approx_fprime(self.purchases, self.objective.value, 1e-4, self.indices)
+        np.testing.assert_allclose(self.objective.gradient(self.purchases, self.indices), numeric_gradient,
+                                   atol=1e-10)
+
+    def test_hessian_matches_finite_differences(self):
+        numeric_hessian = np.array([
+            opt.approx_fprime(self.purchases, lambda x: self.objective.gradient(x, self.indices)[row], 1e-4)
+            for row in range(len(self.indices))
+        ])
+        np.testing.assert_allclose(self.objective.hessian(self.purchases, self.indices), numeric_hessian,
+                                   atol=1e-12)
@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+
+import balance as bln
+from data_types import Security
+
+
+class TestPurchaseSweep(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(4)
+        self.securities = [Security(f'SEC{index}') for index in range(12)]
+        self.desired_percentages = dict(zip(self.securities, rng.dirichlet(np.ones(len(self.securities)))))
+        self.portfolio = dict(zip(self.securities[:10], 1000 * rng.random(10)))
+        self.amounts = [0, 100, 500, 1000, 5000, 20000]
+
+    def _assert_sweep_matches(self, sweep: bln.PurchaseSweep, portfolio, purchases_to_keep):
+        for row, amount in enumerate(self.amounts):
+            expected = bln.calculate_next_purchases(portfolio, self.desired_percentages, amount,
+                                                    purchases_to_keep=purchases_to_keep)
+            swept = sweep.purchases_at(row)
+            for security in set(expected.keys()).union(swept.keys()):
+                self.assertAlmostEqual(expected.get(security, 0.0), swept.get(security, 0.0), 6)
+
+            expected_deviation = bln.get_deviation_from_ideal(portfolio, expected, self.desired_percentages)
+            self.assertAlmostEqual(expected_deviation, sweep.deviations[row], 9)
+
+    def test_unlimited_sweep(self):
+        sweep = bln.calculate_purchase_sweep(self.portfolio, self.desired_percentages, self.amounts)
+
+        self.assertEqual(sweep.purchases.shape, (len(self.amounts), len(self.securities)))
+        self._assert_sweep_matches(sweep, self.portfolio, None)
+
+    def test_limited_sweep(self):
+        for purchases_to_keep in [1, 3, 12]:
+            sweep = bln.calculate_purchase_sweep(self.portfolio, self.desired_percentages, self.amounts,
+                                                 purchases_to_keep=purchases_to_keep)
+
+            self._assert_sweep_matches(sweep, self.portfolio, purchases_to_keep)
+            self.assertTrue(((sweep.purchases > 0).sum(axis=1) <= purchases_to_keep).all())
+
+    def test_sweep_of_empty_portfolio(self):
+        sweep = bln.calculate_purchase_sweep({}, self.desired_percentages, self.amounts, purchases_to_keep=3)
+
+        self._assert_sweep_matches(sweep, {}, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import itertools
+import unittest
+
+import numpy as np
+
+import balance as bln
+from data_types import Security
+
+
+def _deviation(portfolio, desired_percentages, amount, prices, shares) -> float:
+    # Deviation of the portfolio after buying the shares, where the cash that is left counts as a position with a
+    # desired fraction of zero
+    securities = set(portfolio.keys()).union(desired_percentages.keys())
+    total = sum(portfolio.values()) + amount
+    spent = sum(count * prices[security] for security, count in shares.items())
+    residuals = [desired_percentages.get(security, 0.0) -
+                 (portfolio.get(security, 0.0) + shares.get(security, 0) * prices[security]) / total
+                 for security in securities]
+    return sum(residual ** 2 for residual in residuals) + ((amount - spent) / total) ** 2
+
+
+class TestWholeSharePurchases(unittest.TestCase):
+    def _random_case(self, rng, count: int):
+        securities = [Security(f'SEC{index}') for index in range(count)]
+        portfolio = dict(zip(securities, rng.uniform(0, 500, count)))
+        desired_percentages = dict(zip(securities, rng.dirichlet(np.ones(count))))
+        prices = dict(zip(securities, rng.uniform(20, 150, count)))
+        return securities, portfolio, desired_percentages, prices
+
+    def _assert_feasible(self, shares, prices, amount, purchases_to_keep=None):
+        self.assertLessEqual(sum(count * prices[security] for security, count in shares.items()), amount + 1e-9)
+        self.assertTrue(all(isinstance(count, int) and count > 0 for count in shares.values()))
+        if purchases_to_keep is not None:
+            self.assertLessEqual(len(shares), purchases_to_keep)
+
+    def test_whole_shares_match_best_combination(self):
+        rng = np.random.default_rng(3)
+        for _ in range(20):
+            securities, portfolio, desired_percentages, prices = self._random_case(rng, 4)
+            amount = float(rng.uniform(100, 600))
+            purchases_to_keep = int(rng.integers(1, 5))
+
+            shares = bln.calculate_whole_share_purchases(portfolio, desired_percentages, amount, prices,
+                                                         purchases_to_keep=purchases_to_keep)
+            self._assert_feasible(shares, prices, amount, purchases_to_keep)
+
+            best_deviation = min(
+                _deviation(portfolio, desired_percentages, amount, prices, dict(zip(securities, counts)))
+                for counts in itertools.product(*[range(int(amount // prices[security]) + 1)
+                                                  for security in securities])
+                if sum(count * prices[security] for count, security in zip(counts, securities)) <= amount and
+                sum(count > 0 for count in counts) <= purchases_to_keep)
+            self.assertAlmostEqual(best_deviation,
+                                   _deviation(portfolio, desired_percentages, amount, prices, shares), 12)
+
+    def test_whole_shares_are_close_to_fractional_purchases(self):
+        securities = [Security('A'), Security('B'), Security('C')]
+        portfolio = {securities[0]: 1000.0, securities[1]: 500.0}
+        desired_percentages = {securities[0]: 0.5, securities[1]: 0.3, securities[2]: 0.2}
+        prices = {securities[0]: 10.0, securities[1]: 10.0, securities[2]: 10.0}
+
+        shares = bln.calculate_whole_share_purchases(portfolio, desired_percentages, 1000.0, prices)
+
+        self.assertEqual({securities[0]: 25, securities[1]: 25, securities[2]: 50}, shares)
+
+    def test_securities_without_price_are_not_bought(self):
+        securities = [Security('A'), Security('B')]
+        desired_percentages = {securities[0]: 0.5, securities[1]: 0.5}
+
+        shares = bln.calculate_whole_share_purchases(dict(), desired_percentages, 1000.0, {securities[0]: 100.0})
+
+        self.assertEqual({securities[0]}, set(shares.keys()))
+
+    def test_unaffordable_shares_are_not_bought(self):
+        security = Security('A')
+
+        shares = bln.calculate_whole_share_purchases(dict(), {security: 1.0}, 50.0, {security: 100.0})
+
+        self.assertEqual(dict(), shares)
+
+    def test_many_securities(self):
+        rng = np.random.default_rng(5)
+        _, portfolio, desired_percentages, prices = self._random_case(rng, 150)
+        for amount, purchases_to_keep in [(10000.0, None), (100000.0, None), (10000.0, 10)]:
+            shares = bln.calculate_whole_share_purchases(portfolio, desired_percentages, amount, prices,
+                                                         purchases_to_keep=purchases_to_keep)
+
+            self._assert_feasible(shares, prices, amount, purchases_to_keep)
+            if purchases_to_keep is None:
+                # Every security can absorb the cash that is left, so less than a share is left
+                self.assertLess(amount - sum(count * prices[security] for security, count in shares.items()),
+                                max(prices.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+import time
+from typing import Mapping, Optional
+
+import numpy as np
+
+from data_types import Security
+from data_types.security_values import Portfolio
+from .deviation_objective import DeviationObjective, Money
+
+
+DEFAULT_TIME_BUDGET = 0.5
+
+# Moves that improve the deviation by less than this are rounding noise, and are not applied
+_IMPROVEMENT_TOLERANCE = 1e-15
+# Only purchases of up to this amount of shares are rebuilt. Larger purchases are fine-grained enough for the moves of
+# the local search.
+_MAX_REBUILT_SHARES = 10
+
+
+def _continuous_purchases(residuals: np.ndarray, invested_fraction: float, buyable: np.ndarray,
+                          purchases_to_keep: int) -> np.ndarray:
+    """
+    Water-filling of the purchases_to_keep most underweight buyable securities, as fractions of the total value. The
+    cash is filled too, as one more security with a residual of zero, so that money is only left uninvested when
+    buying would overshoot the desired allocation.
+    """
+    fractions = np.zeros(len(residuals))
+    candidates = np.flatnonzero(buyable)
+    active = candidates[np.argsort(-residuals[candidates], kind='stable')][:purchases_to_keep]
+    if len(active) == 0:
+        return fractions
+
+    # The last position stands for the cash
+    active_residuals = np.append(residuals[active], 0.0)
+    active = np.append(active, -1)
+    while True:
+        water_level = (active_residuals.sum() - invested_fraction) / len(active)
+        above_level = active_residuals > water_level
+        if above_level.all():
+            break
+        active, active_residuals = active[above_level], active_residuals[above_level]
+
+    securities = active >= 0
+    fractions[active[securities]] = active_residuals[securities] - water_level
+    return fractions
+
+
+class _WholeShareSearch:
+    """
+    Local search over whole shares. The total value after investing is fixed, and the cash that is not invested is
+    part of it with a desired fraction of zero, so that leaving money uninvested counts as a deviation.
+    """
+    def __init__(self, objective: DeviationObjective, amount_to_invest: Money, prices: np.ndarray,
+                 purchases_to_keep: int):
+        self.total_value = objective.current_total + amount_to_invest
+        self.prices = prices
+        self.price_fractions = prices / self.total_value
+        self.buyable = np.isfinite(prices) & (prices > 0)
+        self.purchases_to_keep = purchases_to_keep
+
+        self.shares = np.zeros(len(prices), dtype=np.int64)
+        self.residuals = objective.desired - objective.current / self.total_value
+        self.cash = amount_to_invest
+
+    def deviation(self) -> float:
+        return float(self.residuals @ self.residuals) + (self.cash / self.total_value) ** 2
+
+    def _buy(self, index: int, shares: int):
+        self.shares[index] += shares
+        self.residuals[index] -= shares * self.price_fractions[index]
+        self.cash -= shares * self.prices[index]
+
+    def start_from_rounded_optimum(self):
+        fractions = _continuous_purchases(self.residuals, self.cash / self.total_value, self.buyable,
+                                          self.purchases_to_keep)
+        rounded_shares = np.zeros(len(self.prices), dtype=np.int64)
+        rounded_shares[self.buyable] = np.floor(fractions[self.buyable] / self.price_fractions[self.buyable])
+        for index in np.flatnonzero(rounded_shares):
+            self._buy(index, rounded_shares[index])
+
+    def _cash_change(self, cash_delta) -> np.ndarray:
+        return ((self.cash + cash_delta) ** 2 - self.cash ** 2) / self.total_value ** 2
+
+    def _best_shares_to_buy(self, residuals: np.ndarray, cash) -> np.ndarray:
+        """
+        :return: The amount of shares of every security, at least 1, that minimizes the deviation when bought with
+        the cash. The deviation is a convex quadratic in the amount of shares, so its minimum is rounded and clipped
+        to the affordable shares.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            affordable_shares = np.floor(cash / self.prices)
+            best_shares = (residuals + cash / self.total_value) / (2 * self.price_fractions)
+            shares = np.clip(np.round(best_shares), 1, np.maximum(affordable_shares, 1))
+
+        return np.nan_to_num(shares, nan=1, posinf=1, neginf=1)
+
+    def _best_shares_to_sell(self) -> np.ndarray:
+        """
+        :return: The amount of bought shares of every security, at least 1, that minimizes the deviation when sold
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            best_shares = -(self.residuals + self.cash / self.total_value) / (2 * self.price_fractions)
+            shares = np.clip(np.round(best_shares), 1, np.maximum(self.shares, 1))
+
+        return np.nan_to_num(shares, nan=1, posinf=1, neginf=1)
+
+    def _exchanges(self, sold_indices: np.ndarray, buyable: np.ndarray, can_add_security: bool):
+        """
+        Exchanges of shares of the sold securities (rows) for shares of every security (columns). The fewest shares
+        of the sold security that pay for a share of the other one are sold, and the amount of shares of the other
+        one that minimizes the deviation with the resulting cash is bought. The new security must fit in the limit,
+        unless it replaces all the shares of the sold one.
+        :return: The change of the deviation of every exchange, infinite if it is not feasible, and the amount of
+        shares sold and bought by it
+        """
+        prices, residuals = self.prices[sold_indices, np.newaxis], self.residuals[sold_indices, np.newaxis]
+        shares = self.shares[sold_indices, np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sold_shares = np.maximum(np.ceil((self.prices[np.newaxis, :] - self.cash) / prices), 1)
+            available_cash = self.cash + sold_shares * prices
+            bought_shares = self._best_shares_to_buy(self.residuals[np.newaxis, :], available_cash)
+
+            cash_after = available_cash - bought_shares * self.prices[np.newaxis, :]
+            sold_residuals = residuals + sold_shares * self.price_fractions[sold_indices, np.newaxis]
+            bought_residuals = self.residuals[np.newaxis, :] - bought_shares * self.price_fractions[np.newaxis, :]
+            changes = (sold_residuals ** 2 - residuals ** 2 + bought_residuals ** 2 - self.residuals ** 2 +
+                       (cash_after ** 2 - self.cash ** 2) / self.total_value ** 2)
+
+        fits_limit = (self.shares > 0)[np.newaxis, :] | can_add_security | (sold_shares == shares)
+        feasible = buyable[np.newaxis, :] & fits_limit & (sold_shares <= shares) & (cash_after >= 0)
+        feasible[np.arange(len(sold_indices)), sold_indices] = False
+
+        return np.where(feasible, changes, np.inf), sold_shares, bought_shares
+
+    def improve(self, deadline: float, excluded: Optional[int] = None):
+        """
+        Applies the best move that improves the deviation until there is none or the deadline is reached. The moves
+        are buying shares, selling back shares bought here, and exchanging bought shares of a security for shares
+        of another one.
+        :param excluded: Security that is not bought by the moves
+        """
+        buyable = self.buyable.copy()
+        if excluded is not None:
+            buyable[excluded] = False
+
+        while time.perf_counter() < deadline:
+            bought = self.shares > 0
+            can_add_security = bought.sum() < self.purchases_to_keep
+            can_buy = buyable & (bought | can_add_security)
+
+            # Change of the deviation when buying the best amount of shares of every security with the cash, or when
+            # selling back the best amount of its shares
+            added_shares = self._best_shares_to_buy(self.residuals, self.cash)
+            add = np.where(can_buy & (self.prices <= self.cash),
+                           (self.residuals - added_shares * self.price_fractions) ** 2 - self.residuals ** 2 +
+                           self._cash_change(-added_shares * self.prices), np.inf)
+            removed_shares = self._best_shares_to_sell()
+            remove = np.where(bought,
+                              (self.residuals + removed_shares * self.price_fractions) ** 2 - self.residuals ** 2 +
+                              self._cash_change(removed_shares * self.prices), np.inf)
+
+            sold_indices = np.flatnonzero(bought)
+            exchange, sold_shares, bought_shares = self._exchanges(sold_indices, buyable, can_add_security)
+
+            best_add, best_remove = np.argmin(add), np.argmin(remove)
+            best_exchange = np.unravel_index(np.argmin(exchange), exchange.shape) if exchange.size else None
+            changes = [add[best_add], remove[best_remove], exchange[best_exchange] if exchange.size else np.inf]
+            best_move = int(np.argmin(changes))
+            if changes[best_move] >= -_IMPROVEMENT_TOLERANCE:
+                return
+
+            if best_move == 0:
+                self._buy(best_add, int(added_shares[best_add]))
+            elif best_move == 1:
+                self._buy(best_remove, -int(removed_shares[best_remove]))
+            else:
+                self._buy(sold_indices[best_exchange[0]], -int(sold_shares[best_exchange]))
+                self._buy(best_exchange[1], int(bought_shares[best_exchange]))
+
+    def rebuild(self, deadline: float):
+        """
+        Moves of a few shares get stuck when shares are expensive compared to the amount to invest. For every
+        security with few shares bought, this sells back all its shares and improves again from there without buying
+        it, keeping the result if it is better.
+        """
+        for index in np.flatnonzero((self.shares > 0) & (self.shares <= _MAX_REBUILT_SHARES)):
+            if time.perf_counter() >= deadline:
+                return
+            if self.shares[index] == 0:
+                continue
+
+            saved_state = (self.shares.copy(), self.residuals.copy(), self.cash)
+            previous_deviation = self.deviation()
+
+            self._buy(index, -self.shares[index])
+            self.improve(deadline, excluded=index)
+            self.improve(deadline)
+            if self.deviation() >= previous_deviation - _IMPROVEMENT_TOLERANCE:
+                self.shares, self.residuals, self.cash = saved_state
+
+
+def calculate_whole_share_purchases(current_portfolio: Mapping[Security, Money],
+                                    desired_percentages: Mapping[Security, float], amount_to_invest: Money,
+                                    prices: Mapping[Security, float], purchases_to_keep: Optional[int] = None,
+                                    time_budget: float = DEFAULT_TIME_BUDGET) -> Portfolio:
+    """
+    Calculates the whole shares to buy that bring the portfolio closest to the desired allocation, spending at most
+    the amount to invest. Money that is left uninvested counts as a deviation from the allocation.
+
+    The search starts from the exact fractional purchases rounded down to whole shares, and then buys, sells back or
+    exchanges shares while that reduces the deviation. Local optima are escaped by selling back all the shares
+    of a security and searching again.
+    :param prices: Price of a share of every security that can be bought. Securities without a price are not bought.
+    :param purchases_to_keep: Maximum number of securities to buy, or None to buy any security
+    :param time_budget: Seconds after which the local search stops with the best shares found so far
+    :return: The amount of shares to buy of every security that is bought
+    """
+    deadline = time.perf_counter() + time_budget
+    objective = DeviationObjective(current_portfolio, desired_percentages)
+    if objective.current_total + amount_to_invest <= 0 or amount_to_invest <= 0:
+        return Portfolio.from_arrays([], [])
+
+    price_array = np.array([prices.get(security, np.nan) for security in objective.securities], dtype=np.float64)
+    if purchases_to_keep is None:
+        purchases_to_keep = len(objective.securities)
+
+    search = _WholeShareSearch(objective, amount_to_invest, price_array, purchases_to_keep)
+    search.start_from_rounded_optimum()
+    search.improve(deadline)
+    search.rebuild(deadline)
+
+    bought = np.flatnonzero(search.shares)
+    return Portfolio.from_arrays([objective.securities[index] for index in bought], search.shares[bought])
@@ -0,0 +1 @@
+from .batch_rebalancer import Account, read_manifest, find_accounts, rebalance_accounts
@@ -0,0 +1,204 @@
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, TypeVar
+
+import balance
+import persistence
+from data_types import intern_security
+from data_types.security_values import Allocation, Portfolio
+from price_fetcher import PriceProvider
+
+
+TRANSACTIONS_SUFFIX = '_transactions'
+ALLOCATIONS_SUFFIX = '_allocations'
+
+CHUNK_SIZE = 16
+
+Task = TypeVar('Task')
+Result = TypeVar('Result')
+
+
+@dataclass
+class Account:
+    name: str
+    transactions_file: str
+    allocations_file: str
+    # Amount to invest in the account, or None to use the amount of the batch
+    amount: Optional[float] = None
+
+
+@dataclass
+class AccountHoldings:
+    """
+    Shares and desired allocations of an account, by security identifier
+    """
+    account: Account
+    shares: Dict[str, float] = field(default_factory=dict)
+    allocations: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+@dataclass
+class RebalanceTask:
+    holdings: AccountHoldings
+    # Price of every security of the account, or None when it could not be fetched
+    prices: Dict[str, Optional[float]]
+    amount: Optional[float]
+    purchases_to_keep: Optional[int]
+    strategy: balance.LimitedPurchaseStrategy
+    # Budget of the brute-force search of every account
+    time_budget: Optional[float] = None
+    max_evaluations: Optional[int] = None
+
+
+def read_manifest(manifest_file: str) -> List[Account]:
+    """
+    Reads the accounts of a tab-separated manifest with the columns account, transactions_file, allocations_file and
+    optionally amount. Relative paths are relative to the manifest.
+    """
+    manifest_directory = Path(manifest_file).parent
+    accounts = []
+    with open(manifest_file, newline='') as manifest:
+        for row in csv.DictReader(manifest, delimiter='\t'):
+            amount = row.get('amount')
+            accounts.append(Account(name=row['account'],
+                                    transactions_file=str(manifest_directory / row['transactions_file']),
+                                    allocations_file=str(manifest_directory / row['allocations_file']),
+                                    amount=float(amount) if amount not in (None, '') else None))
+
+    return accounts
+
+
+def find_accounts(directory: str) -> List[Account]:
+    """
+    Finds the accounts of a directory, given by pairs of files named <account>_transactions.<extension> and
+    <account>_allocations.<extension>
+    """
+    accounts = []
+    for transactions_file in sorted(Path(directory).glob(f'*{TRANSACTIONS_SUFFIX}.*')):
+        name = transactions_file.stem[:-len(TRANSACTIONS_SUFFIX)]
+        allocations_file = transactions_file.with_name(f'{name}{ALLOCATIONS_SUFFIX}{transactions_file.suffix}')
+        if allocations_file.is_file():
+            accounts.append(Account(name, str(transactions_file), str(allocations_file)))
+
+    return accounts
+
+
+def _load_account(account: Account) -> AccountHoldings:
+    try:
+        shares = persistence.TransactionPersistence(
+            persistence.transactions_io_for_file(account.transactions_file)).read_portfolio()
+        allocations = persistence.AllocationPercentagesPersistence(
+            persistence.allocations_io_for_file(account.allocations_file)).read_allocation_percentages()
+    except Exception as error:
+        return AccountHoldings(account, error=f'Cannot read the account files: {error}')
+
+    return AccountHoldings(account,
+                           shares={security.identifier: amount for security, amount in shares.items()},
+                           allocations={security.identifier: value for security, value in allocations.items()})
+
+
+def _rebalance_account(task: RebalanceTask) -> dict:
+    holdings = task.holdings
+    result = {'account': holdings.account.name}
+    if holdings.error is not None:
+        return {**result, 'error': holdings.error}
+
+    missing_prices = sorted(identifier for identifier, price in task.prices.items() if price is None)
+    if missing_prices:
+        return {**result, 'error': f'Missing prices of {", ".join(missing_prices)}'}
+
+    amount = holdings.account.amount if holdings.account.amount is not None else task.amount
+    if amount is None:
+        return {**result, 'error': 'No amount to invest'}
+
+    values = Portfolio.from_identifiers(holdings.shares.keys(), [shares * task.prices[identifier]
+                                                                 for identifier, shares in holdings.shares.items()])
+    allocations = Allocation.from_identifiers(holdings.allocations.keys(), list(holdings.allocations.values()))
+    try:
+        purchases = balance.calculate_next_purchases(values, allocations, amount,
+                                                     purchases_to_keep=task.purchases_to_keep, strategy=task.strategy,
+                                                     time_budget=task.time_budget,
+                                                     max_evaluations=task.max_evaluations)
+        deviation = float(balance.get_deviation_from_ideal(values, purchases, allocations))
+    except Exception as error:
+        return {**result, 'error': str(error)}
+
+    return {
+        **result,
+        'amount': amount,
+        'portfolio_value': sum(values.values()),
+        'purchases': {security.identifier: purchase for security, purchase in purchases.items()},
+        'deviation': deviation
+    }
+
+
+def _fetch_prices(price_provider: PriceProvider, identifiers: Iterable[str],
+                  date: datetime) -> Dict[str, Optional[float]]:
+    """
+    Fetches the price of every security once. Prices that cannot be fetched are None, so that only the accounts that
+    hold those securities fail.
+    """
+    quotes = [(intern_security(identifier), date) for identifier in sorted(set(identifiers))]
+    try:
+        prices = price_provider.get_quotes(quotes)
+        return {security.identifier: price for (security, _), price in prices.items()}
+    except Exception:
+        prices = dict()
+        for security, quote_date in quotes:
+            try:
+                prices[security.identifier] = price_provider.get_price(security, quote_date)
+            except Exception:
+                prices[security.identifier] = None
+        return prices
+
+
+def _map(function: Callable[[Task], Result], tasks: Iterable[Task], executor: Optional[ProcessPoolExecutor],
+         chunk_size: int) -> Iterator[Result]:
+    if executor is None:
+        return map(function, tasks)
+
+    return executor.map(function, tasks, chunksize=chunk_size)
+
+
+def rebalance_accounts(accounts: List[Account], price_provider: PriceProvider, output: TextIO,
+                       amount: Optional[float] = None, purchases_to_keep: Optional[int] = None,
+                       strategy: balance.LimitedPurchaseStrategy = balance.LimitedPurchaseStrategy.EXACT,
+                       workers: int = 1, chunk_size: int = CHUNK_SIZE, date: Optional[datetime] = None,
+                       time_budget: Optional[float] = None, max_evaluations: Optional[int] = None) -> int:
+    """
+    Calculates the next purchases of many accounts. The account files are read across a process pool, the prices of
+    all the securities of all the accounts are fetched once, and the purchases are calculated across the same pool.
+    The result of every account is written to the output as a line of JSON as soon as it is available, in the order
+    of the accounts. Accounts that fail get a line with an error instead of stopping the batch.
+    :param amount: Amount to invest in the accounts that do not have their own amount
+    :param workers: Number of processes, or 1 to run everything in this process
+    :param date: Date of the prices. By default, now.
+    :param time_budget: Seconds of the brute-force search of every account, after which its best purchases are kept
+    :param max_evaluations: Maximum number of combinations optimized by the brute-force search of every account
+    :return: The amount of accounts that failed
+    """
+    date = date if date is not None else datetime.now()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        all_holdings = list(_map(_load_account, accounts, executor, chunk_size))
+        prices = _fetch_prices(price_provider,
+                               (identifier for holdings in all_holdings for identifier in holdings.shares.keys()),
+                               date)
+
+        tasks = (RebalanceTask(holdings, {identifier: prices[identifier] for identifier in holdings.shares.keys()},
+                               amount, purchases_to_keep, strategy, time_budget, max_evaluations)
+                 for holdings in all_holdings)
+        failed_accounts = 0
+        for result in _map(_rebalance_account, tasks, executor, chunk_size):
+            failed_accounts += 'error' in result
+            output.write(json.dumps(result) + '\n')
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return failed_accounts
@@ -0,0 +1,102 @@
+import io
+import json
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+import batch
+from price_fetcher import InMemoryPriceProvider
+
+PRICES = pd.DataFrame({
+    'AAPL': [10.0],
+    'TSLA': [20.0]
+}, index=pd.to_datetime(['2021-01-04']))
+
+TRANSACTIONS_HEADER = 'security_id\ttransaction_share_amount\ttransaction_date\n'
+ALLOCATIONS = 'security_id\tallocation_percentage\nAAPL\t0.5\nTSLA\t0.5\n'
+
+
+class CountingPriceProvider(InMemoryPriceProvider):
+    def __init__(self, prices: pd.DataFrame):
+        super().__init__(prices)
+        self.quoted_securities = []
+
+    def get_price(self, security, date):
+        self.quoted_securities.append(security.identifier)
+        return super().get_price(security, date)
+
+
+class BatchRebalancerTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self._directory.name)
+        for index in range(6):
+            (self.directory / f'account{index}_transactions.tsv').write_text(
+                TRANSACTIONS_HEADER + f'AAPL\t{index}\t2021-01-04\nTSLA\t1\t2021-01-04\n')
+            (self.directory / f'account{index}_allocations.tsv').write_text(ALLOCATIONS)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _rebalance(self, accounts, price_provider, **kwargs):
+        output = io.StringIO()
+        failed_accounts = batch.rebalance_accounts(accounts, price_provider, output, date=datetime(2021, 1, 5),
+                                                   **kwargs)
+        return failed_accounts, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_find_accounts(self):
+        accounts = batch.find_accounts(str(self.directory))
+
+        self.assertEqual([account.name for account in accounts], [f'account{index}' for index in range(6)])
+        self.assertTrue(accounts[0].allocations_file.endswith('account0_allocations.tsv'))
+
+    def test_read_manifest(self):
+        manifest_file = self.directory / 'manifest.tsv'
+        manifest_file.write_text('account\ttransactions_file\tallocations_file\tamount\n'
+                                 'first\taccount0_transactions.tsv\taccount0_allocations.tsv\t100\n'
+                                 'second\taccount1_transactions.tsv\taccount1_allocations.tsv\t\n')
+
+        accounts = batch.read_manifest(str(manifest_file))
+
+        self.assertEqual(accounts[0].amount, 100.0)
+        self.assertIsNone(accounts[1].amount)
+        self.assertEqual(Path(accounts[1].transactions_file), self.directory / 'account1_transactions.tsv')
+
+    def test_prices_are_fetched_once(self):
+        price_provider = CountingPriceProvider(PRICES)
+        failed_accounts, results = self._rebalance(batch.find_accounts(str(self.directory)), price_provider,
+                                                   amount=100.0)
+
+        self.assertEqual(failed_accounts, 0)
+        self.assertEqual(sorted(price_provider.quoted_securities), ['AAPL', 'TSLA'])
+        self.assertEqual(results[0]['portfolio_value'], 20.0)
+        self.assertAlmostEqual(results[0]['purchases']['AAPL'], 60.0)
+        self.assertAlmostEqual(results[0]['purchases']['TSLA'], 40.0)
+
+    def test_process_pool_matches_serial(self):
+        accounts = batch.find_accounts(str(self.directory))
+        _, serial = self._rebalance(accounts, InMemoryPriceProvider(PRICES), amount=100.0, purchases_to_keep=1)
+        _, parallel = self._rebalance(accounts, InMemoryPriceProvider(PRICES), amount=100.0, purchases_to_keep=1,
+                                      workers=2, chunk_size=2)
+
+        self.assertEqual(serial, parallel)
+
+    def test_failures_are_reported_per_account(self):
+        (self.directory / 'account0_transactions.tsv').write_text(TRANSACTIONS_HEADER + 'MSFT\t1\t2021-01-04\n')
+        accounts = batch.find_accounts(str(self.directory))
+        accounts.append(batch.Account('missing', str(self.directory / 'missing.parquet'),
+                                      str(self.directory / 'missing_allocations.parquet')))
+
+        failed_accounts, results = self._rebalance(accounts, InMemoryPriceProvider(PRICES), amount=100.0)
+
+        self.assertEqual(failed_accounts, 2)
+        self.assertIn('MSFT', results[0]['error'])
+        self.assertIn('error', results[-1])
+        self.assertTrue(all('purchases' in result for result in results[1:-1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,301 @@
+"""
+Benchmarks of balancing, persistence and portfolio history over synthetic data of increasing size.
+
+Run from the repository root with:
+
+    python -m benchmarks.run_benchmarks --output results.json
+
+The results are compared with benchmarks/baseline.json, and the command fails when any benchmark is slower than its
+baseline by more than the threshold.
+"""
+import argparse
+import datetime as dt
+import json
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import balance
+import persistence
+from benchmarks import synthetic
+from price_fetcher import InMemoryPriceProvider
+
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+
+DEFAULT_SECURITY_COUNTS = [10, 100, 1000]
+DEFAULT_TRANSACTION_COUNTS = [1000, 10000, 100000]
+QUICK_SECURITY_COUNTS = [10, 100]
+QUICK_TRANSACTION_COUNTS = [1000, 10000]
+
+# Securities of the portfolio used by the persistence and history benchmarks
+HISTORY_SECURITY_COUNT = 50
+SAVED_TRANSACTIONS_COUNT = 100
+AMOUNT_TO_INVEST = 10000.0
+PURCHASES_TO_KEEP = 3
+# Largest amount of candidates that the brute-force search is benchmarked with
+MAX_BRUTE_FORCE_CANDIDATES = 200
+
+# Appends shared by the writers of the concurrent append benchmarks, and latency added to every sync, as on a hard disk
+# or a network file system, where syncing dominates the cost of an append. With it, the appends took 2.9s with 1 writer,
+# 2.0s with 2, 1.8s with 4 and 1.0s with 8 on a single core, as the group commit shares the syncs between the writers.
+CONCURRENT_APPEND_COUNT = 160
+SYNC_LATENCY_SECONDS = 0.005
+DEFAULT_WRITER_COUNTS = [1, 4]
+
+START_DATE = dt.datetime(2010, 1, 1)
+END_DATE = dt.datetime(2020, 12, 31)
+
+DEFAULT_THRESHOLD = 1.5
+# Differences below this are timer noise, and are never reported as regressions
+DEFAULT_MIN_SECONDS = 0.005
+
+
+def _measure(function: Callable[[], object], repeats: int, setup: Optional[Callable[[], None]] = None) -> float:
+    """
+    :return: The fastest wall time of the repeats in seconds, which is the least affected by other processes
+    """
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+
+def _balance_benchmarks(security_counts: Sequence[int], repeats: int, rng: np.random.Generator) -> Dict[str, float]:
+    results = dict()
+    for security_count in security_counts:
+        securities = synthetic.synthetic_securities(security_count)
+        portfolio = synthetic.synthetic_portfolio_values(securities, rng)
+        allocations = synthetic.synthetic_allocations(securities, rng)
+        share_prices = synthetic.synthetic_share_prices(securities, rng)
+        purchases = balance.calculate_next_purchases(portfolio, allocations, AMOUNT_TO_INVEST)
+
+        results[f'calculate_next_purchases[securities={security_count}]'] = _measure(
+            lambda: balance.calculate_next_purchases(portfolio, allocations, AMOUNT_TO_INVEST), repeats)
+        results[f'calculate_next_purchases_limited[securities={security_count},k={PURCHASES_TO_KEEP}]'] = _measure(
+            lambda: balance.calculate_next_purchases(portfolio, allocations, AMOUNT_TO_INVEST,
+                                                     purchases_to_keep=PURCHASES_TO_KEEP), repeats)
+        if math.comb(security_count, PURCHASES_TO_KEEP) <= MAX_BRUTE_FORCE_CANDIDATES:
+            results[f'calculate_next_purchases_brute_force[securities={security_count},k={PURCHASES_TO_KEEP}]'] = \
+                _measure(lambda: balance.calculate_next_purchases(
+                    portfolio, allocations, AMOUNT_TO_INVEST, purchases_to_keep=PURCHASES_TO_KEEP,
+                    strategy=balance.LimitedPurchaseStrategy.BRUTE_FORCE), repeats)
+        results[f'calculate_whole_share_purchases[securities={security_count}]'] = _measure(
+            lambda: balance.calculate_whole_share_purchases(portfolio, allocations, AMOUNT_TO_INVEST, share_prices),
+            repeats)
+        results[f'get_deviation_from_ideal[securities={security_count}]'] = _measure(
+            lambda: balance.get_deviation_from_ideal(portfolio, purchases, allocations), repeats)
+
+    return results
+
+
+def _persistence_benchmarks(transaction_counts: Sequence[int], file_suffixes: Sequence[str], repeats: int,
+                            rng: np.random.Generator, directory: Path) -> Dict[str, float]:
+    securities = synthetic.synthetic_securities(HISTORY_SECURITY_COUNT)
+    prices = synthetic.synthetic_prices(securities, START_DATE, END_DATE, rng)
+    price_provider = InMemoryPriceProvider(prices)
+    new_transactions = synthetic.synthetic_transactions(securities, SAVED_TRANSACTIONS_COUNT, END_DATE,
+                                                        END_DATE + dt.timedelta(days=30), rng)
+
+    results = dict()
+    for transaction_count in transaction_counts:
+        transactions = synthetic.synthetic_transactions(securities, transaction_count, START_DATE, END_DATE, rng)
+        for suffix in file_suffixes:
+            source_file = directory / f'transactions_{transaction_count}{suffix}'
+            persistence.TransactionPersistence(persistence.transactions_io_for_file(str(source_file))) \
+                .save_transactions(transactions)
+
+            def open_persistence():
+                return persistence.TransactionPersistence(persistence.transactions_io_for_file(str(source_file)))
+
+            parameters = f'transactions={transaction_count},format={suffix.lstrip(".")}'
+            results[f'read_portfolio[{parameters}]'] = _measure(lambda: open_persistence().read_portfolio(), repeats)
+
+            target_file = directory / f'target{suffix}'
+            results[f'save_transactions[{parameters},saved={SAVED_TRANSACTIONS_COUNT}]'] = _measure(
+                lambda: persistence.TransactionPersistence(
+                    persistence.transactions_io_for_file(str(target_file))).save_transactions(new_transactions),
+                repeats, setup=lambda: shutil.copyfile(source_file, target_file))
+
+            results[f'read_portfolio_history[{parameters}]'] = _measure(
+                lambda: open_persistence().read_portfolio_history(range_price_provider=price_provider.get_prices),
+                repeats)
+            results[f'read_portfolio_history_daily[{parameters}]'] = _measure(
+                lambda: open_persistence().read_portfolio_history(range_price_provider=price_provider.get_prices,
+                                                                  frequency='daily', end=END_DATE),
+                repeats)
+
+    return results
+
+
+def _append_with_sync_latency(file_name: str, writer: int, append_count: int):
+    sync = os.fsync
+
+    def slow_sync(file_descriptor: int):
+        sync(file_descriptor)
+        time.sleep(SYNC_LATENCY_SECONDS)
+
+    os.fsync = slow_sync
+    dataframe_io = persistence.FileDataFrameIO(file_name)
+    for append in range(append_count):
+        dataframe_io.append_dataframe(pd.DataFrame({'writer': [writer], 'append': [append]}))
+
+
+def _concurrent_append_benchmarks(writer_counts: Sequence[int], repeats: int, directory: Path) -> Dict[str, float]:
+    results = dict()
+    for writer_count in writer_counts:
+        file_name = str(directory / f'appends_{writer_count}.tsv')
+
+        def append_concurrently():
+            processes = [multiprocessing.Process(target=_append_with_sync_latency,
+                                                 args=(file_name, writer, CONCURRENT_APPEND_COUNT // writer_count))
+                         for writer in range(writer_count)]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+                if process.exitcode != 0:
+                    raise RuntimeError(f'A writer of {file_name} failed with exit code {process.exitcode}')
+
+        results[f'append_dataframe_concurrent[writers={writer_count},appends={CONCURRENT_APPEND_COUNT}]'] = _measure(
+            append_concurrently, repeats, setup=lambda: Path(file_name).unlink(missing_ok=True))
+
+    return results
+
+
+def run_benchmarks(security_counts: Sequence[int] = DEFAULT_SECURITY_COUNTS,
+                   transaction_counts: Sequence[int] = DEFAULT_TRANSACTION_COUNTS,
+                   file_suffixes: Sequence[str] = ('.tsv',), repeats: int = 3, seed: int = 0,
+                   writer_counts: Sequence[int] = DEFAULT_WRITER_COUNTS) -> dict:
+    """
+    Runs every benchmark over synthetic data generated from the seed, so that the same data is used on every run.
+    :param file_suffixes: Extensions of the transaction files, which choose the persistence backend
+    :param writer_counts: Amounts of processes that append to the same file at once
+    :return: The benchmark results, with the fastest time of every benchmark in seconds
+    """
+    rng = np.random.default_rng(seed)
+    benchmarks = _balance_benchmarks(security_counts, repeats, rng)
+    with tempfile.TemporaryDirectory() as directory:
+        benchmarks.update(_persistence_benchmarks(transaction_counts, file_suffixes, repeats, rng, Path(directory)))
+        benchmarks.update(_concurrent_append_benchmarks(writer_counts, repeats, Path(directory)))
+
+    return {
+        'metadata': {
+            'date': dt.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'seed': seed,
+            'repeats': repeats
+        },
+        'benchmarks': benchmarks
+    }
+
+
+def compare_with_baseline(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD,
+                          min_seconds: float = DEFAULT_MIN_SECONDS) -> List[str]:
+    """
+    Compares the benchmarks that are in both the results and the baseline.
+    :param threshold: Ratio between the result and the baseline times above which a benchmark has regressed
+    :param min_seconds: Slowdowns smaller than this amount of seconds are not regressions
+    :return: A description of every regression
+    """
+    regressions = []
+    baseline_benchmarks = baseline['benchmarks']
+    for name, seconds in results['benchmarks'].items():
+        if name not in baseline_benchmarks:
+            continue
+
+        baseline_seconds = baseline_benchmarks[name]
+        if seconds > threshold * baseline_seconds and seconds - baseline_seconds > min_seconds:
+            regressions.append(f'{name}: {seconds:.4f}s against {baseline_seconds:.4f}s in the baseline '
+                               f'({seconds / baseline_seconds:.2f}x)')
+
+    return regressions
+
+
+def _print_results(results: dict, baseline: Optional[dict]):
+    baseline_benchmarks = baseline['benchmarks'] if baseline is not None else dict()
+    longest_name = max(len(name) for name in results['benchmarks'])
+    for name, seconds in results['benchmarks'].items():
+        line = f'{name.ljust(longest_name + 2)}{seconds:10.4f}s'
+        if name in baseline_benchmarks:
+            line += f'  ({seconds / baseline_benchmarks[name]:.2f}x baseline)'
+        print(line)
+
+
+def _set_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Benchmarks balancing, persistence and portfolio history',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-o', '--output', help='File where the results are written as JSON')
+    parser.add_argument('--baseline', help='Results the benchmarks are compared with', default=str(DEFAULT_BASELINE))
+    parser.add_argument('--save_baseline', help='Writes the results as the new baseline instead of comparing them',
+                        action='store_true')
+    parser.add_argument('--threshold', help='Slowdown ratio from the baseline that is reported as a regression',
+                        type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument('--min_seconds', help='Slowdowns below this amount of seconds are never regressions',
+                        type=float, default=DEFAULT_MIN_SECONDS)
+    parser.add_argument('--securities', help='Amounts of securities of the balancing benchmarks', type=int, nargs='+')
+    parser.add_argument('--transactions', help='Amounts of transactions of the persistence benchmarks', type=int,
+                        nargs='+')
+    parser.add_argument('--formats', help='Extensions of the transaction files', nargs='+', default=['.tsv'])
+    parser.add_argument('--writers', help='Amounts of processes of the concurrent append benchmarks', type=int,
+                        nargs='+', default=DEFAULT_WRITER_COUNTS)
+    parser.add_argument('--quick', help='Use smaller sizes, for a fast check', action='store_true')
+    parser.add_argument('--repeats', help='Times every benchmark is run, keeping the fastest', type=int, default=3)
+    parser.add_argument('--seed', help='Seed of the synthetic data', type=int, default=0)
+
+    return parser
+
+
+def _main() -> int:
+    args = _set_argument_parser().parse_args()
+    security_counts = args.securities or (QUICK_SECURITY_COUNTS if args.quick else DEFAULT_SECURITY_COUNTS)
+    transaction_counts = args.transactions or (QUICK_TRANSACTION_COUNTS if args.quick else DEFAULT_TRANSACTION_COUNTS)
+    results = run_benchmarks(security_counts, transaction_counts, args.formats, args.repeats, args.seed, args.writers)
+
+    if args.output is not None:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, indent=2))
+        _print_results(results, None)
+        return 0
+
+    baseline = None
+    if Path(args.baseline).is_file():
+        baseline = json.loads(Path(args.baseline).read_text())
+    _print_results(results, baseline)
+
+    if baseline is None:
+        print(f'No baseline found at {args.baseline}')
+        return 0
+
+    regressions = compare_with_baseline(results, baseline, args.threshold, args.min_seconds)
+    if regressions:
+        print()
+        print('Regressions')
+        print('--------------')
+        for regression in regressions:
+            print(regression)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main())
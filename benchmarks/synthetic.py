@@ -0,0 +1,56 @@
+import datetime as dt
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from data_types import Security
+from persistence import ShareTransaction
+
+
+def synthetic_securities(count: int) -> List[Security]:
+    return [Security(f'SEC{index:05d}') for index in range(count)]
+
+
+def synthetic_allocations(securities: Sequence[Security], rng: np.random.Generator) -> Dict[Security, float]:
+    """
+    :return: Random desired allocations that add up to 1
+    """
+    weights = rng.dirichlet(np.ones(len(securities)))
+    return {security: float(weight) for security, weight in zip(securities, weights)}
+
+
+def synthetic_portfolio_values(securities: Sequence[Security], rng: np.random.Generator) -> Dict[Security, float]:
+    return {security: float(value) for security, value in zip(securities, rng.uniform(100.0, 10000.0, len(securities)))}
+
+
+def synthetic_share_prices(securities: Sequence[Security], rng: np.random.Generator) -> Dict[Security, float]:
+    return {security: float(price) for security, price in zip(securities, rng.uniform(20.0, 150.0, len(securities)))}
+
+
+def synthetic_transactions(securities: Sequence[Security], count: int, start: dt.datetime, end: dt.datetime,
+                           rng: np.random.Generator) -> List[ShareTransaction]:
+    """
+    :return: Transactions sorted by date between start and end, mostly purchases with a few sales
+    """
+    days = pd.date_range(start, end, freq='D')
+    dates = np.sort(rng.choice(days.values, count))
+    security_indices = rng.integers(0, len(securities), count)
+    amounts = rng.integers(1, 50, count) * np.where(rng.random(count) < 0.1, -1, 1)
+
+    return [ShareTransaction(securities[security_index].identifier, int(amount), pd.Timestamp(date).to_pydatetime())
+            for security_index, amount, date in zip(security_indices, amounts, dates)]
+
+
+def synthetic_prices(securities: Sequence[Security], start: dt.datetime, end: dt.datetime,
+                     rng: np.random.Generator) -> pd.DataFrame:
+    """
+    :return: Daily prices on business days as a geometric random walk, indexed by day with a column per security
+    identifier
+    """
+    days = pd.bdate_range(start, end)
+    returns = rng.normal(0.0003, 0.01, (len(days), len(securities)))
+    initial_prices = rng.uniform(10.0, 500.0, len(securities))
+    prices = initial_prices * np.exp(np.cumsum(returns, axis=0))
+
+    return pd.DataFrame(prices, index=days, columns=[security.identifier for security in securities])
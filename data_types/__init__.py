@@ -1 +1,4 @@
-from .security import Security
\ No newline at end of file
+from .security import Security
+from .security_registry import SecurityRegistry, SECURITIES, intern_security
+# Portfolio and Allocation are imported from data_types.security_values, since they need numpy and the CLI imports
+# data_types before parsing its arguments
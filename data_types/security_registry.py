@@ -0,0 +1,37 @@
+from typing import Dict, Iterable, List
+
+from .security import Security
+
+
+class SecurityRegistry:
+    """
+    Interns securities by identifier, so that reading the same identifiers again returns the same Security objects
+    instead of creating new ones. Dictionaries of interned securities find their keys by identity before comparing
+    them.
+    """
+    __slots__ = ('_securities',)
+
+    def __init__(self):
+        self._securities: Dict[str, Security] = dict()
+
+    def __len__(self) -> int:
+        return len(self._securities)
+
+    def intern(self, identifier: str) -> Security:
+        security = self._securities.get(identifier)
+        if security is None:
+            security = self._securities.setdefault(identifier, Security(identifier))
+
+        return security
+
+    def intern_all(self, identifiers: Iterable[str]) -> List[Security]:
+        securities = self._securities
+        return [securities.get(identifier) or self.intern(identifier) for identifier in identifiers]
+
+
+# Registry shared by the whole process
+SECURITIES = SecurityRegistry()
+
+
+def intern_security(identifier: str) -> Security:
+    return SECURITIES.intern(identifier)
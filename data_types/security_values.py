@@ -0,0 +1,170 @@
+from collections.abc import ItemsView, Mapping, ValuesView
+from typing import Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from .security import Security
+from .security_registry import SECURITIES, SecurityRegistry
+
+
+class SecurityIndex:
+    """
+    Fixed order of securities, with the position of every security in it. Values of the same securities share their
+    index, so that they can be combined as arrays without looking up every security.
+    """
+    __slots__ = ('securities', 'positions', '_last_union')
+
+    def __init__(self, securities: Iterable[Security]):
+        self.securities: Tuple[Security, ...] = tuple(securities)
+        self.positions: Dict[Security, int] = {security: position for position, security in enumerate(self.securities)}
+        if len(self.positions) != len(self.securities):
+            raise ValueError('The securities of an index must be unique')
+
+        # The same portfolio is usually combined with the same allocation many times, so the last union is kept
+        self._last_union: Optional[Tuple[SecurityIndex, SecurityIndex]] = None
+
+    def __len__(self) -> int:
+        return len(self.securities)
+
+    def __reduce__(self):
+        return SecurityIndex, (self.securities,)
+
+    def union(self, other: 'SecurityIndex') -> 'SecurityIndex':
+        """
+        :return: The securities of this index followed by the ones of the other index that are not in it
+        """
+        if other is self:
+            return self
+
+        last_union = self._last_union
+        if last_union is not None and last_union[0] is other:
+            return last_union[1]
+
+        missing_securities = tuple(security for security in other.securities if security not in self.positions)
+        union = SecurityIndex(self.securities + missing_securities) if missing_securities else self
+        self._last_union = (other, union)
+        return union
+
+    def positions_of(self, securities: Iterable[Security]) -> np.ndarray:
+        positions = self.positions
+        return np.fromiter((positions[security] for security in securities), dtype=np.intp)
+
+
+_Values = TypeVar('_Values', bound='SecurityValues')
+
+
+class _ValuesView(ValuesView):
+    def __iter__(self):
+        return iter(self._mapping.array.tolist())
+
+
+class _ItemsView(ItemsView):
+    def __iter__(self):
+        return zip(self._mapping.index.securities, self._mapping.array.tolist())
+
+
+class SecurityValues(Mapping):
+    """
+    Read-only mapping from securities to numbers, stored as a SecurityIndex and a NumPy array with a value per security
+    of the index. It can be used wherever a dictionary of securities is read, and to_dict converts it to one.
+    """
+    __slots__ = ('index', 'array')
+
+    def __init__(self, index: SecurityIndex, array: np.ndarray):
+        array = np.asarray(array)
+        if array.shape != (len(index),):
+            raise ValueError(f'Expected {len(index)} values, got an array of shape {array.shape}')
+
+        self.index = index
+        self.array = array
+
+    @classmethod
+    def from_arrays(cls, securities: Iterable[Security], values) -> _Values:
+        index = SecurityIndex(securities)
+        return cls(index, np.asarray(values) if len(index) > 0 else np.zeros(0))
+
+    @classmethod
+    def from_identifiers(cls, identifiers: Iterable[str], values,
+                         registry: SecurityRegistry = SECURITIES) -> _Values:
+        """
+        Creates the values of the securities with the identifiers, interned in the registry
+        """
+        return cls.from_arrays(registry.intern_all(identifiers), values)
+
+    @classmethod
+    def from_mapping(cls, mapping: Mapping) -> _Values:
+        """
+        Converts a mapping from securities to numbers, such as a dictionary. Values that already are SecurityValues
+        keep their index and array.
+        """
+        if isinstance(mapping, SecurityValues):
+            return mapping if type(mapping) is cls else cls(mapping.index, mapping.array)
+
+        return cls.from_arrays(mapping.keys(), list(mapping.values()))
+
+    def with_values(self, values) -> _Values:
+        """
+        :return: Other values of the same securities, in the order of the index
+        """
+        return type(self)(self.index, values)
+
+    def aligned_to(self, index: SecurityIndex) -> np.ndarray:
+        """
+        :return: The values in the order of another index that contains all the securities of this one, with zeros for
+        the securities that are not in this one
+        """
+        # Comparing interned securities only compares their identities
+        if index is self.index or index.securities == self.index.securities:
+            return self.array
+
+        aligned = np.zeros(len(index), dtype=np.result_type(self.array, np.float64))
+        aligned[index.positions_of(self.index.securities)] = self.array
+        return aligned
+
+    def total(self) -> float:
+        return self.array.sum().item()
+
+    def to_dict(self) -> Dict[Security, float]:
+        return dict(zip(self.index.securities, self.array.tolist()))
+
+    def __getitem__(self, security: Security) -> float:
+        return self.array[self.index.positions[security]].item()
+
+    def get(self, security: Security, default: Optional[float] = None) -> Optional[float]:
+        position = self.index.positions.get(security)
+        return self.array[position].item() if position is not None else default
+
+    def __contains__(self, security) -> bool:
+        return security in self.index.positions
+
+    def __iter__(self) -> Iterator[Security]:
+        return iter(self.index.securities)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def values(self) -> ValuesView:
+        return _ValuesView(self)
+
+    def items(self) -> ItemsView:
+        return _ItemsView(self)
+
+    def __reduce__(self):
+        return type(self), (self.index, self.array)
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+
+class Portfolio(SecurityValues):
+    """
+    Shares, value or purchases of every security of a portfolio
+    """
+    __slots__ = ()
+
+
+class Allocation(SecurityValues):
+    """
+    Desired fraction of the portfolio of every security
+    """
+    __slots__ = ()
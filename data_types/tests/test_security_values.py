@@ -0,0 +1,74 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from data_types import Security, SecurityRegistry, intern_security
+from data_types.security_values import Allocation, Portfolio, SecurityIndex
+
+
+class SecurityRegistryTests(unittest.TestCase):
+    def test_identifiers_are_interned(self):
+        registry = SecurityRegistry()
+
+        securities = registry.intern_all(['AAPL', 'TSLA', 'AAPL'])
+
+        self.assertIs(securities[0], securities[2])
+        self.assertIs(securities[1], registry.intern('TSLA'))
+        self.assertEqual(Security('AAPL'), securities[0])
+        self.assertEqual(2, len(registry))
+        self.assertIs(intern_security('AAPL'), intern_security('AAPL'))
+
+
+class SecurityValuesTests(unittest.TestCase):
+    def test_behaves_as_dictionary(self):
+        portfolio = Portfolio.from_identifiers(['AAPL', 'TSLA'], np.array([10, 5]))
+
+        self.assertEqual({Security('AAPL'): 10, Security('TSLA'): 5}, portfolio)
+        self.assertEqual(portfolio, {Security('AAPL'): 10, Security('TSLA'): 5})
+        self.assertEqual(5, portfolio[Security('TSLA')])
+        self.assertIsInstance(portfolio[Security('TSLA')], int)
+        self.assertEqual([Security('AAPL'), Security('TSLA')], list(portfolio.keys()))
+        self.assertEqual([10, 5], list(portfolio.values()))
+        self.assertIn((Security('AAPL'), 10), portfolio.items())
+        self.assertIsNone(portfolio.get(Security('AMZN')))
+        self.assertNotIn(Security('AMZN'), portfolio)
+        with self.assertRaises(KeyError):
+            portfolio[Security('AMZN')]
+        self.assertEqual(dict, type(portfolio.to_dict()))
+
+    def test_from_mapping_keeps_values(self):
+        allocation = Allocation.from_mapping({Security('AAPL'): 0.25, Security('TSLA'): 0.75})
+
+        self.assertIs(allocation, Allocation.from_mapping(allocation))
+        self.assertEqual(1.0, allocation.total())
+        self.assertIs(allocation.index, Portfolio.from_mapping(allocation).index)
+
+    def test_aligned_to_union(self):
+        portfolio = Portfolio.from_identifiers(['AAPL', 'TSLA'], [10.0, 5.0])
+        allocation = Allocation.from_identifiers(['AMZN', 'TSLA'], [0.5, 0.5])
+
+        union = portfolio.index.union(allocation.index)
+
+        self.assertEqual((Security('AAPL'), Security('TSLA'), Security('AMZN')), union.securities)
+        self.assertIs(union, portfolio.index.union(allocation.index))
+        np.testing.assert_array_equal([10.0, 5.0, 0.0], portfolio.aligned_to(union))
+        np.testing.assert_array_equal([0.0, 0.5, 0.5], allocation.aligned_to(union))
+
+    def test_repeated_securities(self):
+        with self.assertRaises(ValueError):
+            SecurityIndex([Security('AAPL'), Security('AAPL')])
+        with self.assertRaises(ValueError):
+            Portfolio(SecurityIndex([Security('AAPL')]), np.array([1.0, 2.0]))
+
+    def test_pickle(self):
+        portfolio = Portfolio.from_identifiers(['AAPL', 'TSLA'], [10.0, 5.0])
+
+        unpickled = pickle.loads(pickle.dumps(portfolio))
+
+        self.assertIsInstance(unpickled, Portfolio)
+        self.assertEqual(portfolio, unpickled)
+
+
+if __name__ == '__main__':
+    unittest.main()
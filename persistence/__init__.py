@@ -1,4 +1,11 @@
-from .persistence_dataframe_io import PersistenceDataFrameIO
-from .transaction_persistence import ShareTransaction, TransactionPersistence
+from .persistence_dataframe_io import PersistenceDataFrameIO, QueryableDataFrameIO, AppendableDataFrameIO, RowPosition
+from .history_checkpoint import HistoryCheckpoint, HistoryCheckpointState
+from .holdings_snapshot import HoldingsSnapshot, HoldingsSnapshotState
+from .transaction_persistence import ShareTransaction, ImportSummary, TransactionPersistence
 from .file_dataframe_io import FileDataFrameIO
+from .columnar_dataframe_io import ParquetDataFrameIO, FeatherDataFrameIO
+from .sqlite_dataframe_io import SqliteDataFrameIO
 from .allocation_persistence import AllocationPercentagesPersistence
+from .dataframe_io_factory import dataframe_io_for_file, transactions_io_for_file, allocations_io_for_file, \
+    holdings_snapshot_for_file
+from .transaction_import import read_transaction_export
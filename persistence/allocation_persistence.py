@@ -1,9 +1,12 @@
-from typing import Dict
+from typing import Mapping
 
+import numpy as np
 import pandas as pd
 
+import profiling
 from persistence import PersistenceDataFrameIO
 from data_types import Security
+from data_types.security_values import Allocation
 
 
 SECURITY_ID = "security_id"
@@ -13,14 +16,26 @@ ALLOCATION = "allocation_percentage"
 class AllocationPercentagesPersistence:
     def __init__(self, dataframe_io: PersistenceDataFrameIO):
         self._dataframe_io = dataframe_io
-        self._allocations = self._dataframe_io.read_dataframe()
+        self._loaded_allocations = None
 
-    def read_allocation_percentages(self) -> Dict[Security, float]:
-        ids_to_allocations = self._allocations.set_index(SECURITY_ID)[ALLOCATION].to_dict()
-        return {Security(sec): value for sec, value in ids_to_allocations.items()}
+    @property
+    def _allocations(self) -> pd.DataFrame:
+        # The file is only read when the allocations are first needed
+        if self._loaded_allocations is None:
+            with profiling.phase('allocations load'):
+                self._loaded_allocations = self._dataframe_io.read_dataframe()
 
-    def write_allocation_percentages(self, allocations: Dict[Security, float]):
+        return self._loaded_allocations
+
+    def read_allocation_percentages(self) -> Allocation:
+        # The last allocation of a repeated security is kept, as when the rows were read into a dictionary
+        allocations = self._allocations.drop_duplicates(SECURITY_ID, keep='last')
+        return Allocation.from_identifiers(allocations[SECURITY_ID].astype(str),
+                                           allocations[ALLOCATION].to_numpy(dtype=np.float64))
+
+    def write_allocation_percentages(self, allocations: Mapping[Security, float]):
         dataframe = pd.Series({sec.identifier: value for sec, value in allocations.items()}).reset_index()
         dataframe.columns = [SECURITY_ID, ALLOCATION]
 
-        self._dataframe_io.save_dataframe(dataframe)
\ No newline at end of file
+        self._dataframe_io.save_dataframe(dataframe)
+        self._loaded_allocations = dataframe
\ No newline at end of file
@@ -0,0 +1,66 @@
+import abc
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from persistence import PersistenceDataFrameIO
+
+
+class ColumnarDataFrameIO(PersistenceDataFrameIO):
+    """
+    Base of the binary backends that keep the type of every column. Text columns are stored as categories, so that
+    repeated identifiers are only stored once, and dates are stored as datetime64 without having to be parsed again.
+
+    Columnar files cannot be appended to in place, so appending rewrites the whole file.
+    """
+    def __init__(self, file_name: str):
+        self._file_name = file_name
+
+    def read_dataframe(self) -> pd.DataFrame:
+        if Path(self._file_name).is_file():
+            return self._read_file()
+        else:
+            return pd.DataFrame()
+
+    def save_dataframe(self, dataframe: pd.DataFrame):
+        typed_dataframe = dataframe.reset_index(drop=True)
+        for column in typed_dataframe.columns:
+            if typed_dataframe[column].dtype == object or pd.api.types.is_string_dtype(typed_dataframe[column]):
+                typed_dataframe[column] = typed_dataframe[column].astype('category')
+
+        temporary_file_name = f'{self._file_name}.tmp'
+        self._write_file(typed_dataframe, temporary_file_name)
+        os.replace(temporary_file_name, self._file_name)
+
+    @abc.abstractmethod
+    def _read_file(self) -> pd.DataFrame:
+        pass
+
+    @abc.abstractmethod
+    def _write_file(self, dataframe: pd.DataFrame, file_name: str):
+        pass
+
+
+class ParquetDataFrameIO(ColumnarDataFrameIO):
+    def _read_file(self) -> pd.DataFrame:
+        return pd.read_parquet(self._file_name)
+
+    def _write_file(self, dataframe: pd.DataFrame, file_name: str):
+        dataframe.to_parquet(file_name, index=False)
+
+
+class FeatherDataFrameIO(ColumnarDataFrameIO):
+    """
+    Arrow IPC backend. The file is memory-mapped when read, so loading it does not copy the columns that are not
+    compressed.
+    """
+    def _read_file(self) -> pd.DataFrame:
+        import pyarrow.feather as feather
+
+        return feather.read_table(self._file_name, memory_map=True).to_pandas()
+
+    def _write_file(self, dataframe: pd.DataFrame, file_name: str):
+        import pyarrow.feather as feather
+
+        feather.write_feather(dataframe, file_name, compression='uncompressed')
@@ -0,0 +1,49 @@
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Iterable, List
+
+BATCH_SUFFIX = '.batch'
+
+
+class CommitQueue:
+    """
+    Directory of batches of rows that wait to be appended to a persistent source, already formatted by the writers
+    that queued them. A writer that finds the source locked adds its batch and waits, and the writer that holds the
+    lock appends all the waiting batches with a single write, so that concurrent writers share the cost of writing and
+    syncing the source.
+    """
+    def __init__(self, directory: str):
+        self._directory = Path(directory)
+
+    def put(self, content: bytes) -> Path:
+        """
+        :return: The file of the batch, which is removed once the batch is appended
+        """
+        self._directory.mkdir(parents=True, exist_ok=True)
+        # Batches are appended in the order of their names, which start with the time when they were queued
+        batch_name = f'{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex}'
+        temporary_path = self._directory / f'{batch_name}.tmp'
+        temporary_path.write_bytes(content)
+        batch_path = self._directory / f'{batch_name}{BATCH_SUFFIX}'
+        os.replace(temporary_path, batch_path)
+        return batch_path
+
+    def batches(self) -> List[Path]:
+        if not self._directory.is_dir():
+            return []
+
+        return sorted(self._directory.glob(f'*{BATCH_SUFFIX}'))
+
+    def batch_path(self, batch_name: str) -> Path:
+        return self._directory / batch_name
+
+    @staticmethod
+    def read(batches: Iterable[Path]) -> List[bytes]:
+        return [batch.read_bytes() for batch in batches]
+
+    @staticmethod
+    def remove(batches: Iterable[Path]):
+        for batch in batches:
+            batch.unlink(missing_ok=True)
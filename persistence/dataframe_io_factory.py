@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import Sequence
+
+from persistence import PersistenceDataFrameIO, FileDataFrameIO, ParquetDataFrameIO, FeatherDataFrameIO, \
+    SqliteDataFrameIO, HoldingsSnapshot
+from persistence import transaction_persistence, allocation_persistence
+
+
+PARQUET_SUFFIXES = ('.parquet', '.pq')
+FEATHER_SUFFIXES = ('.feather', '.arrow')
+SQLITE_SUFFIXES = ('.sqlite', '.sqlite3', '.db')
+
+HOLDINGS_SNAPSHOT_SUFFIX = '.holdings.json'
+
+TRANSACTIONS_TABLE = 'transactions'
+ALLOCATIONS_TABLE = 'allocations'
+
+
+def dataframe_io_for_file(file_name: str, table_name: str = 'data',
+                          indexed_columns: Sequence[str] = ()) -> PersistenceDataFrameIO:
+    """
+    Chooses the persistence backend from the extension of the file. Files without a known binary extension are
+    tab-separated values.
+    :param table_name: Table where the dataframe is stored, for database backends
+    :param indexed_columns: Columns that are indexed, for database backends
+    """
+    suffix = Path(file_name).suffix.lower()
+    if suffix in PARQUET_SUFFIXES:
+        return ParquetDataFrameIO(file_name)
+    elif suffix in FEATHER_SUFFIXES:
+        return FeatherDataFrameIO(file_name)
+    elif suffix in SQLITE_SUFFIXES:
+        return SqliteDataFrameIO(file_name, table_name, indexed_columns)
+    else:
+        return FileDataFrameIO(file_name)
+
+
+def transactions_io_for_file(file_name: str) -> PersistenceDataFrameIO:
+    return dataframe_io_for_file(file_name, TRANSACTIONS_TABLE,
+                                 [transaction_persistence.SECURITY_ID, transaction_persistence.TRANSACTION_DATE])
+
+
+def allocations_io_for_file(file_name: str) -> PersistenceDataFrameIO:
+    return dataframe_io_for_file(file_name, ALLOCATIONS_TABLE, [allocation_persistence.SECURITY_ID])
+
+
+def holdings_snapshot_for_file(transactions_file_name: str) -> HoldingsSnapshot:
+    """
+    :return: The holdings snapshot kept next to the transactions file
+    """
+    return HoldingsSnapshot(str(Path(transactions_file_name).with_suffix(HOLDINGS_SNAPSHOT_SUFFIX)))
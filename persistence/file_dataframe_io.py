@@ -1,21 +1,227 @@
+import contextlib
+import io
+import json
+import os
+import time
+import zlib
 from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple
 
 import pandas as pd
 
-from persistence import PersistenceDataFrameIO
+import profiling
+from persistence import AppendableDataFrameIO, RowPosition
+from .commit_queue import CommitQueue
+from .file_lock import FileLock
 
+# Bytes before a position whose checksum is kept, which cover the last rows before it. Rows edited in place before
+# them are not noticed, since checking the whole file would read it all on every read after a position.
+CHECKSUM_BYTES = 4096
 
-class FileDataFrameIO(PersistenceDataFrameIO):
+LOCK_SUFFIX = '.lock'
+QUEUE_SUFFIX = '.queue'
+JOURNAL_SUFFIX = '.journal'
+
+# Seconds between the checks of a queued writer for its rows being appended by another writer
+COMMIT_POLL_SECONDS = 0.001
+
+
+class FileDataFrameIO(AppendableDataFrameIO):
+    """
+    Stores a dataframe as a tab-separated text file, which several processes can write. Writes hold a lock file next
+    to the file, and the rows appended by concurrent writers are group committed: a writer that finds the lock busy
+    queues its rows already formatted, and the writer that holds the lock appends every queued row with a single
+    write and sync. Every append is recorded in a journal first, so that an append interrupted by a crash is undone
+    by the next writer. Reads without the lock only see complete rows.
+    """
     def __init__(self, file_name: str):
         self._file_name = file_name
+        self._lock = FileLock(f'{file_name}{LOCK_SUFFIX}')
+        self._queue = CommitQueue(f'{file_name}{QUEUE_SUFFIX}')
+        self._journal_name = f'{file_name}{JOURNAL_SUFFIX}'
+
+    @contextlib.contextmanager
+    def locked(self) -> Iterator[None]:
+        with self._lock.hold():
+            self._recover_append()
+            yield
 
     def read_dataframe(self) -> pd.DataFrame:
+        dataframe, _ = self.read_dataframe_after(None)
+        return dataframe
+
+    def read_dataframe_chunks(self, chunk_size: int) -> Iterator[pd.DataFrame]:
         file_path = Path(self._file_name)
+        if not file_path.is_file() or file_path.stat().st_size == 0:
+            return
 
-        if file_path.is_file():
-            return pd.read_csv(self._file_name, sep='\t')
-        else:
-            return pd.DataFrame()
+        with pd.read_csv(self._file_name, sep='\t', chunksize=chunk_size) as chunks:
+            for chunk in chunks:
+                yield _without_index_column(chunk)
 
     def save_dataframe(self, dataframe: pd.DataFrame):
-        dataframe.to_csv(self._file_name, sep='\t')
+        with self.locked():
+            self._replace_content(dataframe.to_csv(sep='\t', index=False).encode())
+
+    def _replace_content(self, content: bytes):
+        temporary_file_name = f'{self._file_name}.tmp'
+        with open(temporary_file_name, 'wb') as temporary_file:
+            temporary_file.write(content)
+            temporary_file.flush()
+            os.fsync(temporary_file.fileno())
+
+        os.replace(temporary_file_name, self._file_name)
+
+    def append_dataframe(self, dataframe: pd.DataFrame):
+        """
+        Writes only the new rows at the end of the file, in the column order of its header, and makes sure that they
+        reach the disk before returning. When another writer holds the lock, the rows are queued, and this writer
+        waits until the leader appends them or until it gets the lock and becomes the leader itself.
+        """
+        with self._lock.hold(blocking=False) as is_held:
+            if is_held:
+                self._commit_queued_rows(_batch_content(dataframe))
+                return
+
+        batch = self._queue.put(_batch_content(dataframe))
+        while True:
+            time.sleep(COMMIT_POLL_SECONDS)
+            if not batch.exists():
+                # The leader appended the batch
+                return
+
+            with self._lock.hold(blocking=False) as is_held:
+                if is_held:
+                    self._commit_queued_rows()
+                    return
+
+    def _commit_queued_rows(self, content: Optional[bytes] = None):
+        """
+        Appends the queued batches, followed by the given batch, while holding the lock, and then removes the queued
+        batches. Batches are formatted as a header line followed by their rows.
+        """
+        self._recover_append()
+        batches = self._queue.batches()
+        contents = self._queue.read(batches)
+        if content is not None:
+            contents.append(content)
+        if not contents:
+            return
+
+        file_path = Path(self._file_name)
+        offset = file_path.stat().st_size if file_path.is_file() else 0
+        if offset == 0:
+            header_line = contents[0].partition(b'\n')[0]
+            prefix = header_line + b'\n'
+        else:
+            with open(self._file_name, 'rb') as existing_file:
+                header_line = existing_file.readline().rstrip(b'\r\n')
+                existing_file.seek(-1, os.SEEK_END)
+                prefix = b'' if existing_file.read(1) == b'\n' else b'\n'
+
+        header = header_line.decode().rstrip('\r').split('\t')
+        content = prefix + b''.join(_rows_in_columns(batch_content, header) for batch_content in contents)
+
+        with open(self._journal_name, 'w') as journal_file:
+            json.dump({'offset': offset, 'length': len(content), 'batches': [batch.name for batch in batches]},
+                      journal_file)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+        if offset == 0:
+            self._replace_content(content)
+        else:
+            with open(self._file_name, 'ab') as appended_file:
+                appended_file.write(content)
+                appended_file.flush()
+                os.fsync(appended_file.fileno())
+
+        CommitQueue.remove(batches)
+        os.remove(self._journal_name)
+        profiling.count('group commits', len(contents))
+
+    def _recover_append(self):
+        """
+        Finishes or undoes the append of a writer that stopped in the middle of it. Appends that did not reach the
+        disk completely are truncated, and their batches stay in the queue to be appended again.
+        """
+        try:
+            with open(self._journal_name) as journal_file:
+                journal = json.load(journal_file)
+        except FileNotFoundError:
+            return
+        except ValueError:
+            # The writer stopped while writing the journal, before appending anything
+            os.remove(self._journal_name)
+            return
+
+        file_path = Path(self._file_name)
+        size = file_path.stat().st_size if file_path.is_file() else 0
+        if size >= journal['offset'] + journal['length']:
+            CommitQueue.remove(self._queue.batch_path(batch_name) for batch_name in journal['batches'])
+        elif size > journal['offset']:
+            os.truncate(self._file_name, journal['offset'])
+
+        profiling.count('recovered appends')
+        os.remove(self._journal_name)
+
+    def read_dataframe_after(self, position: Optional[RowPosition]) \
+            -> Optional[Tuple[pd.DataFrame, Optional[RowPosition]]]:
+        """
+        Positions are byte offsets of the file. Saving the file replaces it with a new one, so the identity of the file
+        tells whether it was saved after the position was read.
+        """
+        file_path = Path(self._file_name)
+        if not file_path.is_file() or file_path.stat().st_size == 0:
+            return (pd.DataFrame(), None) if position is None else None
+
+        with open(self._file_name, 'rb') as ledger_file:
+            file_stat = os.fstat(ledger_file.fileno())
+            identity = f'{file_stat.st_dev}:{file_stat.st_ino}'
+            header = ledger_file.readline()
+            if position is not None:
+                if position.identity != identity or position.offset > file_stat.st_size or \
+                        _checksum_before(ledger_file, position.offset) != position.checksum:
+                    return None
+                ledger_file.seek(max(position.offset, len(header)))
+
+            start = ledger_file.tell()
+            content = ledger_file.read()
+            # A row that is being appended is only read once it is complete
+            content = content[:content.rfind(b'\n') + 1]
+            end = start + len(content)
+            end_position = RowPosition(identity, end, _checksum_before(ledger_file, end))
+
+        if not content.strip():
+            columns = header.decode().rstrip('\r\n').split('\t')
+            return _without_index_column(pd.DataFrame(columns=columns)), end_position
+
+        return _without_index_column(pd.read_csv(io.BytesIO(header + content), sep='\t')), end_position
+
+
+def _batch_content(dataframe: pd.DataFrame) -> bytes:
+    return dataframe.to_csv(sep='\t', index=False).encode()
+
+
+def _rows_in_columns(batch_content: bytes, header: List[str]) -> bytes:
+    """
+    :return: The rows of a batch in the order of the columns of the header, without the header of the batch
+    """
+    batch_header, _, rows = batch_content.partition(b'\n')
+    if batch_header.decode().rstrip('\r').split('\t') == header:
+        return rows
+
+    # The values are kept as they were written, only moved to the columns of the header
+    dataframe = pd.read_csv(io.BytesIO(batch_content), sep='\t', dtype=str, keep_default_na=False)
+    return dataframe.reindex(columns=header).to_csv(sep='\t', index=False, header=False).encode()
+
+
+def _without_index_column(dataframe: pd.DataFrame) -> pd.DataFrame:
+    # Files saved by older versions have the index as an unnamed first column
+    return dataframe.loc[:, ~dataframe.columns.str.startswith('Unnamed:')]
+
+
+def _checksum_before(ledger_file: BinaryIO, offset: int) -> str:
+    start = max(offset - CHECKSUM_BYTES, 0)
+    ledger_file.seek(start)
+    return f'{zlib.crc32(ledger_file.read(offset - start)):08x}'
@@ -0,0 +1,92 @@
+import contextlib
+import threading
+from typing import BinaryIO, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl, but it can lock a byte of the lock file instead
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Exclusive advisory lock shared by every process that uses the same lock file. The lock is held on a separate
+    file, so that it is kept while the locked file is replaced. It is reentrant within a thread, and other threads of
+    the same process wait for it as other processes do.
+    """
+    def __init__(self, file_name: str):
+        self._file_name = file_name
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._lock_file: Optional[BinaryIO] = None
+
+    def __getstate__(self):
+        return {'_file_name': self._file_name}
+
+    def __setstate__(self, state):
+        self.__init__(state['_file_name'])
+
+    @contextlib.contextmanager
+    def hold(self, blocking: bool = True) -> Iterator[bool]:
+        """
+        :param blocking: Whether to wait for the lock, instead of not holding it when another thread or process does
+        :return: Whether the lock is held inside the context, which is always the case when blocking
+        """
+        if not self._thread_lock.acquire(blocking=blocking):
+            yield False
+            return
+
+        try:
+            if self._depth == 0:
+                lock_file = open(self._file_name, 'a+b')
+                try:
+                    is_locked = _lock(lock_file, blocking)
+                except BaseException:
+                    lock_file.close()
+                    raise
+                if not is_locked:
+                    lock_file.close()
+                    yield False
+                    return
+                self._lock_file = lock_file
+
+            self._depth += 1
+            try:
+                yield True
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    _unlock(self._lock_file)
+                    self._lock_file.close()
+                    self._lock_file = None
+        finally:
+            self._thread_lock.release()
+
+
+def _lock(lock_file: BinaryIO, blocking: bool) -> bool:
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    lock_file.seek(0)
+    while True:
+        try:
+            # Waits for about 10 seconds before failing
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+
+
+def _unlock(lock_file: BinaryIO):
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
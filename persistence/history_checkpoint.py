@@ -0,0 +1,65 @@
+import datetime as dt
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+
+@dataclass
+class HistoryCheckpointState:
+    """
+    Portfolio history computed up to a cutoff date. The holdings are the total shares of every security over the
+    transaction_count transactions dated before the cutoff, whose digest is transactions_digest, and the history only
+    has dates before the cutoff.
+    """
+    frequency: Optional[str]
+    cutoff: dt.datetime
+    transaction_count: int
+    holdings: Dict[str, float]
+    transactions_digest: Optional[str]
+    history: Dict[dt.datetime, float]
+
+
+class HistoryCheckpoint:
+    """
+    Stores the last computed portfolio history in a JSON file, so that it does not need to be computed again from the
+    first transaction.
+    """
+    def __init__(self, file_name: str):
+        self._file_name = file_name
+
+    def read(self) -> Optional[HistoryCheckpointState]:
+        file_path = Path(self._file_name)
+        if not file_path.is_file():
+            return None
+
+        with open(file_path) as checkpoint_file:
+            content = json.load(checkpoint_file)
+
+        return HistoryCheckpointState(
+            frequency=content['frequency'],
+            cutoff=dt.datetime.fromisoformat(content['cutoff']),
+            transaction_count=content['transaction_count'],
+            holdings=content['holdings'],
+            # Checkpoints saved before the digest was kept have none, and are computed again
+            transactions_digest=content.get('transactions_digest'),
+            history={dt.datetime.fromisoformat(date): value for date, value in content['history']}
+        )
+
+    def save(self, state: HistoryCheckpointState):
+        content = {
+            'frequency': state.frequency,
+            'cutoff': state.cutoff.isoformat(),
+            'transaction_count': state.transaction_count,
+            'holdings': state.holdings,
+            'transactions_digest': state.transactions_digest,
+            'history': [[date.isoformat(), value] for date, value in state.history.items()]
+        }
+
+        # Every process writes its own temporary file, and the last one to replace the file wins
+        temporary_file_name = f'{self._file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_file_name, 'w') as checkpoint_file:
+            json.dump(content, checkpoint_file)
+        os.replace(temporary_file_name, self._file_name)
@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from persistence import RowPosition
+
+
+@dataclass
+class HoldingsSnapshotState:
+    """
+    Total shares of every security over the transaction_count transactions before the position, which is right after
+    the last transaction processed.
+    """
+    position: RowPosition
+    transaction_count: int
+    holdings: Dict[str, float]
+
+
+class HoldingsSnapshot:
+    """
+    Stores the current holdings in a JSON file, so that they do not need to be summed again from all the transactions.
+
+    The snapshot is built again when the transactions it processed are saved again or their last rows change, which
+    the position of the snapshot tells. For text files, the position only checks the last CHECKSUM_BYTES bytes before
+    it, so that reading the new transactions does not read the whole file. Editing an earlier transaction in place,
+    keeping the size of the file, is not noticed, and the snapshot file has to be deleted after such an edit.
+    """
+    def __init__(self, file_name: str):
+        self._file_name = file_name
+
+    def read(self) -> Optional[HoldingsSnapshotState]:
+        file_path = Path(self._file_name)
+        if not file_path.is_file():
+            return None
+
+        try:
+            with open(file_path) as snapshot_file:
+                content = json.load(snapshot_file)
+
+            return HoldingsSnapshotState(
+                position=RowPosition(**content['position']),
+                transaction_count=content['transaction_count'],
+                holdings=content['holdings']
+            )
+        except (ValueError, KeyError, TypeError):
+            # A damaged snapshot is built again from the transactions
+            return None
+
+    def save(self, state: HoldingsSnapshotState):
+        content = {
+            'position': {
+                'identity': state.position.identity,
+                'offset': state.position.offset,
+                'checksum': state.position.checksum
+            },
+            'transaction_count': state.transaction_count,
+            'holdings': state.holdings
+        }
+
+        # Every process writes its own temporary file, and the last one to replace the file wins
+        temporary_file_name = f'{self._file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_file_name, 'w') as snapshot_file:
+            json.dump(content, snapshot_file)
+        os.replace(temporary_file_name, self._file_name)
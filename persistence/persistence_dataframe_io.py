@@ -1,4 +1,8 @@
 import abc
+import contextlib
+import datetime as dt
+from dataclasses import dataclass
+from typing import ContextManager, Iterator, Optional, Tuple
 
 import pandas as pd
 
@@ -14,3 +18,88 @@ class PersistenceDataFrameIO(abc.ABC):
     @abc.abstractmethod
     def save_dataframe(self, dataframe: pd.DataFrame):
         pass
+
+    def append_dataframe(self, dataframe: pd.DataFrame):
+        """
+        Adds rows to the persistent source. Sources that can append in place should override this method, since by
+        default the whole source is read and saved back.
+        """
+        current_dataframe = self.read_dataframe()
+        if current_dataframe.empty:
+            self.save_dataframe(dataframe)
+        else:
+            self.save_dataframe(pd.concat([current_dataframe, dataframe], ignore_index=True))
+
+    def read_dataframe_chunks(self, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """
+        Reads the rows of the persistent source in dataframes of at most chunk_size rows. Sources that can read part of
+        their rows should override this method, since by default the whole source is read as a single chunk.
+        """
+        dataframe = self.read_dataframe()
+        if not dataframe.empty:
+            yield dataframe
+
+    def locked(self) -> ContextManager:
+        """
+        Keeps other writers of the persistent source out while reading it and then writing it back, so that their rows
+        are not lost. Sources that several processes can write should override this method, since by default nothing
+        is locked.
+        """
+        return contextlib.nullcontext()
+
+
+class QueryableDataFrameIO(PersistenceDataFrameIO):
+    """
+    Persistent source that can aggregate and filter its rows by itself, without reading the whole dataframe.
+    """
+    @abc.abstractmethod
+    def sum_by(self, group_column: str, value_column: str, date_column: Optional[str] = None,
+               before: Optional[dt.datetime] = None) -> pd.Series:
+        """
+        :return: The sum of value_column for every value of group_column, only over the rows whose date_column is
+        before the given date if it is not None
+        """
+        pass
+
+    @abc.abstractmethod
+    def count(self, date_column: Optional[str] = None, before: Optional[dt.datetime] = None) -> int:
+        """
+        :return: The amount of rows, only counting the rows whose date_column is before the given date if it is not
+        None
+        """
+        pass
+
+    @abc.abstractmethod
+    def read_dataframe_between(self, date_column: str, start: Optional[dt.datetime] = None,
+                               end: Optional[dt.datetime] = None) -> pd.DataFrame:
+        """
+        :return: The rows whose date_column is between start and end, both included. None means no bound.
+        """
+        pass
+
+
+@dataclass
+class RowPosition:
+    """
+    Position right after a row of a persistent source. The identity and the checksum of the rows before the position
+    tell whether the rows up to the position are still the same ones.
+    """
+    identity: str
+    offset: int
+    checksum: str
+
+
+class AppendableDataFrameIO(PersistenceDataFrameIO):
+    """
+    Persistent source that appends rows at its end, and can read only the rows appended after a position.
+    """
+    @abc.abstractmethod
+    def read_dataframe_after(self, position: Optional[RowPosition]) \
+            -> Optional[Tuple[pd.DataFrame, Optional[RowPosition]]]:
+        """
+        :param position: Position after which the rows are read, or None to read all the rows
+        :return: The rows after the position and the position after the last row, which is None if there are no rows.
+        None if the rows before the position changed since the position was read, for example because the source was
+        saved again.
+        """
+        pass
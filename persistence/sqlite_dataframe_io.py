@@ -0,0 +1,163 @@
+import contextlib
+import datetime as dt
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import ContextManager, Iterator, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from persistence import QueryableDataFrameIO, AppendableDataFrameIO, RowPosition
+from .file_lock import FileLock
+
+ROWID_COLUMN = '_rowid'
+
+
+class SqliteDataFrameIO(QueryableDataFrameIO, AppendableDataFrameIO):
+    """
+    Stores a dataframe as a table of a SQLite database, which several processes can share safely. Aggregations and
+    date-bounded reads run inside the database, using indexes on the given columns. Positions are row identifiers,
+    which grow with every appended row. SQLite already serializes the transactions of concurrent writers, and writes
+    also hold a lock file so that reading and then replacing the table does not lose the rows appended meanwhile.
+    """
+    def __init__(self, file_name: str, table_name: str, indexed_columns: Sequence[str] = (),
+                 timeout: float = 30.0):
+        self._file_name = file_name
+        self._table_name = table_name
+        self._indexed_columns = list(indexed_columns)
+        self._timeout = timeout
+        self._lock = FileLock(f'{file_name}.lock')
+
+    def locked(self) -> ContextManager:
+        return self._lock.hold()
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self._file_name, timeout=self._timeout)
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _table_exists(self, connection: sqlite3.Connection) -> bool:
+        row = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                 (self._table_name,)).fetchone()
+        return row is not None
+
+    def _create_indexes(self, connection: sqlite3.Connection):
+        for column in self._indexed_columns:
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{self._table_name}_{column}" '
+                               f'ON "{self._table_name}" ("{column}")')
+
+    def read_dataframe(self) -> pd.DataFrame:
+        if not Path(self._file_name).is_file():
+            return pd.DataFrame()
+
+        with self._connect() as connection:
+            if not self._table_exists(connection):
+                return pd.DataFrame()
+
+            return pd.read_sql_query(f'SELECT * FROM "{self._table_name}"', connection)
+
+    def read_dataframe_chunks(self, chunk_size: int) -> Iterator[pd.DataFrame]:
+        if not Path(self._file_name).is_file():
+            return
+
+        with self._connect() as connection:
+            if not self._table_exists(connection):
+                return
+
+            yield from pd.read_sql_query(f'SELECT * FROM "{self._table_name}"', connection, chunksize=chunk_size)
+
+    def save_dataframe(self, dataframe: pd.DataFrame):
+        with self.locked(), self._connect() as connection:
+            dataframe.to_sql(self._table_name, connection, if_exists='replace', index=False)
+            self._create_indexes(connection)
+
+    def append_dataframe(self, dataframe: pd.DataFrame):
+        with self.locked(), self._connect() as connection:
+            dataframe.to_sql(self._table_name, connection, if_exists='append', index=False)
+            self._create_indexes(connection)
+
+    def read_dataframe_after(self, position: Optional[RowPosition]) \
+            -> Optional[Tuple[pd.DataFrame, Optional[RowPosition]]]:
+        if not Path(self._file_name).is_file():
+            return (pd.DataFrame(), None) if position is None else None
+
+        with self._connect() as connection:
+            if not self._table_exists(connection):
+                return (pd.DataFrame(), None) if position is None else None
+
+            if position is not None and self._row_position(connection, position.offset) != position:
+                return None
+
+            dataframe = pd.read_sql_query(f'SELECT rowid AS "{ROWID_COLUMN}", * FROM "{self._table_name}" '
+                                          f'WHERE rowid > ? ORDER BY rowid', connection,
+                                          params=[position.offset if position is not None else 0])
+            if not dataframe.empty:
+                position = self._row_position(connection, int(dataframe[ROWID_COLUMN].iloc[-1]))
+
+            return dataframe.drop(columns=ROWID_COLUMN), position
+
+    def _row_position(self, connection: sqlite3.Connection, rowid: int) -> Optional[RowPosition]:
+        # Saving the table creates it again, so the checksum of the row tells whether it is still the same row
+        row = connection.execute(f'SELECT * FROM "{self._table_name}" WHERE rowid = ?', (rowid,)).fetchone()
+        if row is None:
+            return None
+
+        return RowPosition(self._table_name, rowid, f'{zlib.crc32(repr(row).encode()):08x}')
+
+    def sum_by(self, group_column: str, value_column: str, date_column: Optional[str] = None,
+               before: Optional[dt.datetime] = None) -> pd.Series:
+        where_clause, parameters = _before_clause(date_column, before)
+        query = (f'SELECT "{group_column}", SUM("{value_column}") AS "{value_column}" FROM "{self._table_name}" '
+                 f'{where_clause} GROUP BY "{group_column}"')
+
+        dataframe = self._query(query, parameters)
+        if dataframe.empty:
+            return pd.Series(dtype=float, name=value_column)
+
+        return dataframe.set_index(group_column)[value_column]
+
+    def count(self, date_column: Optional[str] = None, before: Optional[dt.datetime] = None) -> int:
+        where_clause, parameters = _before_clause(date_column, before)
+        dataframe = self._query(f'SELECT COUNT(*) AS row_count FROM "{self._table_name}" {where_clause}', parameters)
+
+        return int(dataframe['row_count'].iloc[0]) if not dataframe.empty else 0
+
+    def read_dataframe_between(self, date_column: str, start: Optional[dt.datetime] = None,
+                               end: Optional[dt.datetime] = None) -> pd.DataFrame:
+        conditions, parameters = [], []
+        if start is not None:
+            conditions.append(f'"{date_column}" >= ?')
+            parameters.append(_format_date(start))
+        if end is not None:
+            conditions.append(f'"{date_column}" <= ?')
+            parameters.append(_format_date(end))
+
+        where_clause = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        return self._query(f'SELECT * FROM "{self._table_name}" {where_clause}', parameters)
+
+    def _query(self, query: str, parameters: Sequence) -> pd.DataFrame:
+        if not Path(self._file_name).is_file():
+            return pd.DataFrame()
+
+        with self._connect() as connection:
+            if not self._table_exists(connection):
+                return pd.DataFrame()
+
+            return pd.read_sql_query(query, connection, params=list(parameters))
+
+
+def _format_date(date: dt.datetime) -> str:
+    # Same text format as the one used by pandas to store datetimes in SQLite, so that dates compare as strings
+    return pd.Timestamp(date).isoformat(sep=' ')
+
+
+def _before_clause(date_column: Optional[str], before: Optional[dt.datetime]):
+    if date_column is None or before is None:
+        return '', []
+
+    return f'WHERE "{date_column}" < ?', [_format_date(before)]
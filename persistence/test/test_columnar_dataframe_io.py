@@ -0,0 +1,48 @@
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from data_types import Security
+from persistence import FileDataFrameIO, ParquetDataFrameIO, FeatherDataFrameIO, TransactionPersistence, \
+    dataframe_io_for_file
+from persistence import transaction_persistence as tr
+
+
+class ColumnarDataFrameIOTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = Path(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_backend_is_chosen_from_extension(self):
+        self.assertIsInstance(dataframe_io_for_file(str(self.directory / 'a.parquet')), ParquetDataFrameIO)
+        self.assertIsInstance(dataframe_io_for_file(str(self.directory / 'a.feather')), FeatherDataFrameIO)
+        self.assertIsInstance(dataframe_io_for_file(str(self.directory / 'a.arrow')), FeatherDataFrameIO)
+        self.assertIsInstance(dataframe_io_for_file(str(self.directory / 'a.tsv')), FileDataFrameIO)
+
+    def test_migrate_transactions_keeps_column_types(self):
+        source_file = self.directory / 'transactions.tsv'
+        source_file.write_text('security_id\ttransaction_share_amount\ttransaction_date\n'
+                               'AAPL\t10\t2020-01-01\n'
+                               'TSLA\t5\t2020-01-02\n'
+                               'AAPL\t-3\t2020-01-05\n')
+
+        for target_name in ['transactions.parquet', 'transactions.feather']:
+            target_io = dataframe_io_for_file(str(self.directory / target_name))
+            TransactionPersistence(FileDataFrameIO(str(source_file))).copy_transactions_to(target_io)
+
+            transactions = target_io.read_dataframe()
+            self.assertIsInstance(transactions[tr.SECURITY_ID].dtype, pd.CategoricalDtype)
+            self.assertTrue(pd.api.types.is_integer_dtype(transactions[tr.TRANSACTION_SHARE_AMOUNT]))
+            self.assertTrue(pd.api.types.is_datetime64_any_dtype(transactions[tr.TRANSACTION_DATE]))
+
+            persistence = TransactionPersistence(target_io)
+            self.assertEqual(persistence.read_portfolio(), {Security('AAPL'): 7, Security('TSLA'): 5})
+
+            persistence.save_transactions([tr.ShareTransaction('GE', 2, datetime(2020, 2, 1))])
+            self.assertEqual(TransactionPersistence(target_io).read_portfolio()[Security('GE')], 2)
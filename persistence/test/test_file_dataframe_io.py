@@ -0,0 +1,69 @@
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from data_types import Security
+from persistence import FileDataFrameIO, TransactionPersistence, ShareTransaction
+from persistence import transaction_persistence as tr
+
+
+class FileDataFrameIOTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.file_name = str(Path(self._directory.name) / 'transactions.tsv')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_save_does_not_write_the_index(self):
+        dataframe_io = FileDataFrameIO(self.file_name)
+        dataframe_io.save_dataframe(pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']}))
+
+        self.assertEqual(Path(self.file_name).read_text().splitlines(), ['a\tb', '1\tx', '2\ty'])
+        self.assertEqual(list(dataframe_io.read_dataframe().columns), ['a', 'b'])
+
+    def test_append_writes_only_new_rows(self):
+        dataframe_io = FileDataFrameIO(self.file_name)
+        dataframe_io.append_dataframe(pd.DataFrame({'a': [1], 'b': ['x']}))
+        dataframe_io.append_dataframe(pd.DataFrame({'b': ['y', 'z'], 'a': [2, 3]}))
+
+        self.assertEqual(Path(self.file_name).read_text().splitlines(), ['a\tb', '1\tx', '2\ty', '3\tz'])
+
+    def test_append_to_file_with_index_column(self):
+        Path(self.file_name).write_text('\ta\tb\n0\t1\tx')
+        dataframe_io = FileDataFrameIO(self.file_name)
+        dataframe_io.append_dataframe(pd.DataFrame({'a': [2], 'b': ['y']}))
+
+        dataframe = dataframe_io.read_dataframe()
+        self.assertEqual(list(dataframe.columns), ['a', 'b'])
+        self.assertEqual(list(dataframe['a']), [1, 2])
+        self.assertEqual(list(dataframe['b']), ['x', 'y'])
+
+    def test_save_and_compact_transactions(self):
+        persistence = TransactionPersistence(FileDataFrameIO(self.file_name))
+        persistence.save_transactions([ShareTransaction('AAPL', 5, datetime(2020, 1, 2))])
+        persistence.save_transactions([ShareTransaction('TSLA', 2, datetime(2020, 1, 1)),
+                                       ShareTransaction('AAPL', 5, datetime(2020, 1, 2))])
+
+        self.assertEqual(len(Path(self.file_name).read_text().splitlines()), 4)
+        self.assertEqual(persistence.read_portfolio()[Security('AAPL')], 10)
+
+        # Identical transactions are kept, since they can be two purchases of the same day
+        removed_transactions = persistence.compact_transactions()
+        reloaded_transactions = TransactionPersistence(FileDataFrameIO(self.file_name))
+
+        self.assertTrue(removed_transactions.empty)
+        self.assertEqual(reloaded_transactions.read_portfolio()[Security('AAPL')], 10)
+        self.assertEqual(list(FileDataFrameIO(self.file_name).read_dataframe()[tr.SECURITY_ID]),
+                         ['TSLA', 'AAPL', 'AAPL'])
+
+        removed_transactions = persistence.compact_transactions(remove_duplicates=True)
+        reloaded_transactions = TransactionPersistence(FileDataFrameIO(self.file_name))
+
+        self.assertEqual([('AAPL', 5, pd.Timestamp(2020, 1, 2))],
+                         list(removed_transactions.itertuples(index=False, name=None)))
+        self.assertEqual(reloaded_transactions.read_portfolio()[Security('AAPL')], 5)
+        self.assertEqual(list(FileDataFrameIO(self.file_name).read_dataframe()[tr.SECURITY_ID]), ['TSLA', 'AAPL'])
@@ -0,0 +1,96 @@
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+from data_types import Security
+from persistence import FileDataFrameIO, RowPosition, TransactionPersistence, \
+    transactions_io_for_file, holdings_snapshot_for_file
+from persistence import transaction_persistence as tr
+
+TRANSACTIONS = [
+    tr.ShareTransaction(security_id='AAPL', transaction_share_amount=10, transaction_date=datetime(2020, 1, 1)),
+    tr.ShareTransaction(security_id='TSLA', transaction_share_amount=10, transaction_date=datetime(2020, 1, 1)),
+    tr.ShareTransaction(security_id='AAPL', transaction_share_amount=-5, transaction_date=datetime(2020, 1, 4)),
+]
+NEW_TRANSACTIONS = [
+    tr.ShareTransaction(security_id='AMZN', transaction_share_amount=3, transaction_date=datetime(2020, 2, 1)),
+    tr.ShareTransaction(security_id='AAPL', transaction_share_amount=1, transaction_date=datetime(2020, 2, 1)),
+]
+
+
+class RecordingFileDataFrameIO(FileDataFrameIO):
+    def __init__(self, file_name: str):
+        super().__init__(file_name)
+        self.positions = []
+
+    def read_dataframe_after(self, position: Optional[RowPosition]):
+        self.positions.append(position)
+        return super().read_dataframe_after(position)
+
+
+class HoldingsSnapshotTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _check_snapshot(self, file_name: str, recording_io_class):
+        def snapshot_persistence():
+            return TransactionPersistence(recording_io_class(file_name), holdings_snapshot_for_file(file_name))
+
+        persistence = snapshot_persistence()
+        persistence.save_transactions(TRANSACTIONS)
+        self.assertEqual({Security('AAPL'): 5, Security('TSLA'): 10}, persistence.read_portfolio())
+        self.assertTrue(Path(file_name).with_suffix('.holdings.json').is_file())
+
+        # Transactions saved by another writer are added to the snapshot, without reading the ones before them
+        TransactionPersistence(transactions_io_for_file(file_name)).save_transactions(NEW_TRANSACTIONS)
+        persistence = snapshot_persistence()
+        self.assertEqual({Security('AAPL'): 6, Security('TSLA'): 10, Security('AMZN'): 3},
+                         persistence.read_portfolio())
+        self.assertEqual(1, len(persistence._dataframe_io.positions))
+        self.assertIsNotNone(persistence._dataframe_io.positions[0])
+
+        # Saving other transactions invalidates the snapshot, which is built again
+        transactions_io_for_file(file_name).save_dataframe(pd.DataFrame(TRANSACTIONS[:2]))
+        persistence = snapshot_persistence()
+        self.assertEqual({Security('AAPL'): 10, Security('TSLA'): 10}, persistence.read_portfolio())
+        self.assertIsNone(persistence._dataframe_io.positions[-1])
+
+        TransactionPersistence(transactions_io_for_file(file_name)).save_transactions(NEW_TRANSACTIONS[:1])
+        TransactionPersistence(transactions_io_for_file(file_name)).compact_transactions()
+
+        without_snapshot = TransactionPersistence(transactions_io_for_file(file_name)).read_portfolio()
+        self.assertEqual(without_snapshot, snapshot_persistence().read_portfolio())
+
+    def test_snapshot_of_text_file(self):
+        self._check_snapshot(str(Path(self._directory.name) / 'ledger.tsv'), RecordingFileDataFrameIO)
+
+    def test_damaged_snapshot_is_built_again(self):
+        file_name = str(Path(self._directory.name) / 'ledger.tsv')
+        TransactionPersistence(transactions_io_for_file(file_name),
+                               holdings_snapshot_for_file(file_name)).save_transactions(TRANSACTIONS)
+        Path(file_name).with_suffix('.holdings.json').write_text('{"position": ')
+
+        portfolio = TransactionPersistence(transactions_io_for_file(file_name),
+                                           holdings_snapshot_for_file(file_name)).read_portfolio()
+
+        self.assertEqual({Security('AAPL'): 5, Security('TSLA'): 10}, portfolio)
+
+    def test_empty_ledger_has_no_holdings(self):
+        file_name = str(Path(self._directory.name) / 'ledger.tsv')
+
+        portfolio = TransactionPersistence(transactions_io_for_file(file_name),
+                                           holdings_snapshot_for_file(file_name)).read_portfolio()
+
+        self.assertEqual(dict(), portfolio)
+        self.assertFalse(Path(file_name).with_suffix('.holdings.json').exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import json
+import multiprocessing
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from data_types import Security
+from persistence import FileDataFrameIO, SqliteDataFrameIO, TransactionPersistence, ShareTransaction
+from persistence import transaction_persistence as tr
+from persistence.commit_queue import CommitQueue
+from persistence.file_dataframe_io import JOURNAL_SUFFIX, QUEUE_SUFFIX
+
+WRITER_COUNT = 4
+SAVE_COUNT = 50
+
+
+def _save_transactions(file_name: str, writer: int):
+    persistence = TransactionPersistence(FileDataFrameIO(file_name))
+    for save in range(SAVE_COUNT):
+        date = datetime(2021, 1, 1) + timedelta(minutes=writer * SAVE_COUNT + save)
+        persistence.save_transactions([ShareTransaction(f'W{writer}', save + 1, date)])
+
+
+def _append_rows(file_name: str, writer: int):
+    dataframe_io = SqliteDataFrameIO(file_name, 'rows')
+    for save in range(SAVE_COUNT):
+        dataframe_io.append_dataframe(pd.DataFrame({'writer': [writer], 'save': [save]}))
+
+
+class LedgerLockTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.file_name = str(Path(self._directory.name) / 'transactions.tsv')
+
+        self.queue = CommitQueue(f'{self.file_name}{QUEUE_SUFFIX}')
+        self.journal_path = Path(f'{self.file_name}{JOURNAL_SUFFIX}')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _run_writers(self, target):
+        processes = [multiprocessing.Process(target=target, args=(self.file_name, writer))
+                     for writer in range(WRITER_COUNT)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(0, process.exitcode)
+
+    def test_concurrent_writers_save_every_transaction_once(self):
+        self._run_writers(_save_transactions)
+
+        transactions = FileDataFrameIO(self.file_name).read_dataframe()
+        self.assertEqual(WRITER_COUNT * SAVE_COUNT, len(transactions))
+        self.assertFalse(transactions.duplicated().any())
+        holdings = TransactionPersistence(FileDataFrameIO(self.file_name)).read_portfolio().to_dict()
+        self.assertEqual({Security(f'W{writer}'): SAVE_COUNT * (SAVE_COUNT + 1) / 2 for writer in range(WRITER_COUNT)},
+                         holdings)
+        self.assertEqual([], self.queue.batches())
+        self.assertFalse(self.journal_path.exists())
+
+    def test_concurrent_sqlite_writers(self):
+        self.file_name = str(Path(self._directory.name) / 'rows.sqlite')
+        self._run_writers(_append_rows)
+
+        rows = SqliteDataFrameIO(self.file_name, 'rows').read_dataframe()
+        self.assertEqual(WRITER_COUNT * SAVE_COUNT, len(rows.drop_duplicates()))
+
+    def test_reads_only_complete_rows(self):
+        dataframe_io = FileDataFrameIO(self.file_name)
+        dataframe_io.save_dataframe(pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']}))
+        with open(self.file_name, 'a') as ledger_file:
+            ledger_file.write('3\t')
+
+        self.assertEqual([1, 2], dataframe_io.read_dataframe()['a'].tolist())
+        rows, position = dataframe_io.read_dataframe_after(None)
+        self.assertEqual(2, len(rows))
+
+        with open(self.file_name, 'a') as ledger_file:
+            ledger_file.write('z\n')
+        new_rows, _ = dataframe_io.read_dataframe_after(position)
+        self.assertEqual([(3, 'z')], list(new_rows.itertuples(index=False, name=None)))
+
+    def test_interrupted_append_is_undone(self):
+        dataframe_io = FileDataFrameIO(self.file_name)
+        dataframe_io.save_dataframe(pd.DataFrame({'a': [1], 'b': ['x']}))
+        offset = Path(self.file_name).stat().st_size
+        batch = self.queue.put(b'a\tb\n2\ty\n')
+
+        # The writer stopped after appending part of the batch
+        self.journal_path.write_text(json.dumps({'offset': offset, 'length': 4, 'batches': [batch.name]}))
+        with open(self.file_name, 'a') as ledger_file:
+            ledger_file.write('2\t')
+
+        dataframe_io.append_dataframe(pd.DataFrame({'a': [3], 'b': ['z']}))
+
+        self.assertEqual(['a\tb', '1\tx', '2\ty', '3\tz'], Path(self.file_name).read_text().splitlines())
+        self.assertFalse(self.journal_path.exists())
+        self.assertEqual([], self.queue.batches())
+
+    def test_completed_append_removes_its_batches(self):
+        dataframe_io = FileDataFrameIO(self.file_name)
+        dataframe_io.save_dataframe(pd.DataFrame({'a': [1], 'b': ['x']}))
+        offset = Path(self.file_name).stat().st_size
+        batch = self.queue.put(b'a\tb\n2\ty\n')
+
+        # The writer stopped after appending the batch, before removing it from the queue
+        self.journal_path.write_text(json.dumps({'offset': offset, 'length': 4, 'batches': [batch.name]}))
+        with open(self.file_name, 'a') as ledger_file:
+            ledger_file.write('2\ty\n')
+
+        dataframe_io.append_dataframe(pd.DataFrame({'a': [3], 'b': ['z']}))
+
+        self.assertEqual(['a\tb', '1\tx', '2\ty', '3\tz'], Path(self.file_name).read_text().splitlines())
+        self.assertEqual([], self.queue.batches())
+
+    def test_compaction_keeps_transactions_of_other_writers(self):
+        persistence = TransactionPersistence(FileDataFrameIO(self.file_name))
+        other_persistence = TransactionPersistence(FileDataFrameIO(self.file_name))
+        persistence.save_transactions([ShareTransaction('AAPL', 1, datetime(2021, 1, 2))])
+        self.assertEqual(1, len(persistence.read_holdings_history()))
+
+        other_persistence.save_transactions([ShareTransaction('TSLA', 2, datetime(2021, 1, 1))])
+        persistence.compact_transactions()
+
+        transactions = FileDataFrameIO(self.file_name).read_dataframe()
+        self.assertEqual(['TSLA', 'AAPL'], transactions[tr.SECURITY_ID].tolist())
+
+    def test_reads_after_compaction_count_every_transaction_once(self):
+        persistence = TransactionPersistence(FileDataFrameIO(self.file_name))
+        persistence.save_transactions([ShareTransaction('AAPL', 10, datetime(2021, 1, 2)),
+                                       ShareTransaction('TSLA', 5, datetime(2021, 1, 1))])
+        persistence.read_portfolio()
+
+        persistence.compact_transactions()
+        persistence.save_transactions([ShareTransaction('AAPL', 1, datetime(2021, 1, 3))])
+
+        expected_portfolio = {Security('AAPL'): 11, Security('TSLA'): 5}
+        self.assertEqual(expected_portfolio, persistence.read_portfolio().to_dict())
+        self.assertEqual(expected_portfolio,
+                         TransactionPersistence(FileDataFrameIO(self.file_name)).read_portfolio().to_dict())
+        self.assertEqual(3, len(persistence.read_holdings_history()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import contextlib
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from data_types import Security
+from persistence import SqliteDataFrameIO, TransactionPersistence, AllocationPercentagesPersistence, \
+    transactions_io_for_file, allocations_io_for_file, holdings_snapshot_for_file
+from persistence import transaction_persistence as tr
+
+TRANSACTIONS = [
+    tr.ShareTransaction(security_id='AAPL', transaction_share_amount=10, transaction_date=datetime(2020, 1, 1)),
+    tr.ShareTransaction(security_id='TSLA', transaction_share_amount=10, transaction_date=datetime(2020, 1, 1)),
+    tr.ShareTransaction(security_id='AMZN', transaction_share_amount=10, transaction_date=datetime(2020, 1, 1)),
+    tr.ShareTransaction(security_id='AAPL', transaction_share_amount=-5, transaction_date=datetime(2020, 1, 4)),
+    tr.ShareTransaction(security_id='TSLA', transaction_share_amount=5, transaction_date=datetime(2020, 1, 5)),
+]
+
+
+class UnreadableSqliteDataFrameIO(SqliteDataFrameIO):
+    def read_dataframe(self) -> pd.DataFrame:
+        raise AssertionError('The whole table should not be read')
+
+    def read_dataframe_after(self, position):
+        raise AssertionError('The whole table should not be read')
+
+
+class SqliteDataFrameIOTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.file_name = str(Path(self._directory.name) / 'ledger.sqlite')
+        TransactionPersistence(transactions_io_for_file(self.file_name)).save_transactions(TRANSACTIONS)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_read_portfolio_is_aggregated_in_the_database(self):
+        dataframe_io = UnreadableSqliteDataFrameIO(self.file_name, 'transactions')
+        portfolio = TransactionPersistence(dataframe_io).read_portfolio()
+
+        self.assertEqual(portfolio, {Security('AAPL'): 5, Security('TSLA'): 15, Security('AMZN'): 10})
+
+    def test_read_portfolio_with_snapshot_is_aggregated_in_the_database(self):
+        dataframe_io = UnreadableSqliteDataFrameIO(self.file_name, 'transactions')
+        portfolio = TransactionPersistence(dataframe_io, holdings_snapshot_for_file(self.file_name)).read_portfolio()
+
+        self.assertEqual(portfolio, {Security('AAPL'): 5, Security('TSLA'): 15, Security('AMZN'): 10})
+        self.assertFalse(Path(self.file_name).with_suffix('.holdings.json').exists())
+
+    def test_read_bounded_history(self):
+        dataframe_io = UnreadableSqliteDataFrameIO(self.file_name, 'transactions')
+        prices = pd.DataFrame({'AAPL': [1.0], 'AMZN': [2.0], 'TSLA': [3.0]}, index=pd.to_datetime(['2019-12-31']))
+
+        history = TransactionPersistence(dataframe_io).read_portfolio_history(
+            range_price_provider=lambda *_: prices, start=datetime(2020, 1, 2), end=datetime(2020, 1, 4))
+
+        self.assertEqual(history, {datetime(2020, 1, 4): 5 + 20 + 30})
+
+    def test_indexes_are_created(self):
+        dataframe_io = transactions_io_for_file(self.file_name)
+        dataframe_io.save_dataframe(dataframe_io.read_dataframe())
+
+        with contextlib.closing(sqlite3.connect(self.file_name)) as connection:
+            indexes = pd.read_sql_query("SELECT name FROM sqlite_master WHERE type = 'index'", connection)
+        self.assertEqual(set(indexes['name']), {'transactions_security_id', 'transactions_transaction_date'})
+
+    def test_allocations_share_the_ledger_file(self):
+        allocations = {Security('AAPL'): 0.25, Security('TSLA'): 0.75}
+        AllocationPercentagesPersistence(allocations_io_for_file(self.file_name)).write_allocation_percentages(
+            allocations)
+
+        read_allocations = AllocationPercentagesPersistence(allocations_io_for_file(self.file_name)) \
+            .read_allocation_percentages()
+
+        self.assertEqual(read_allocations, allocations)
+        self.assertEqual(len(TransactionPersistence(transactions_io_for_file(self.file_name)).read_portfolio()), 3)
+
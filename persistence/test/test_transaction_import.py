@@ -0,0 +1,91 @@
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from data_types import Security
+from persistence import FileDataFrameIO, TransactionPersistence, read_transaction_export, transactions_io_for_file
+from persistence import transaction_persistence as tr
+
+TRANSACTIONS = [
+    tr.ShareTransaction(security_id='AAPL', transaction_share_amount=10, transaction_date=datetime(2020, 1, 1)),
+    tr.ShareTransaction(security_id='TSLA', transaction_share_amount=10, transaction_date=datetime(2020, 1, 1)),
+]
+
+EXPORT = '''Date;Symbol;Quantity;Price
+2020-01-01;AAPL;10;300.5
+2020-01-02;AMZN;3;1900
+2020-01-02;AMZN;3;1900
+2020-01-04;AAPL;-5;310
+2020-01-05; TSLA ;2.5;420
+'''
+
+
+class TransactionImportTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.export_file = str(Path(self._directory.name) / 'export.csv')
+        Path(self.export_file).write_text(EXPORT)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _read_export(self, chunk_size: int = 2):
+        columns = {tr.SECURITY_ID: 'Symbol', tr.TRANSACTION_SHARE_AMOUNT: 'Quantity', tr.TRANSACTION_DATE: 'Date'}
+        return read_transaction_export(self.export_file, columns, chunk_size=chunk_size, delimiter=';')
+
+    def test_export_is_read_in_chunks(self):
+        chunks = list(self._read_export())
+
+        self.assertEqual([2, 2, 1], [len(chunk) for chunk in chunks])
+        self.assertEqual(tr.TRANSACTION_COLUMNS, list(chunks[0].columns))
+        self.assertEqual('TSLA', chunks[2][tr.SECURITY_ID].iloc[0])
+        self.assertEqual(pd.Timestamp(2020, 1, 5), chunks[2][tr.TRANSACTION_DATE].iloc[0])
+
+    def test_missing_values_are_reported(self):
+        Path(self.export_file).write_text(EXPORT + '2020-01-06;;1;10\n')
+
+        with self.assertRaisesRegex(ValueError, 'Row 6 .* has no security_id'):
+            list(self._read_export())
+
+    def _assert_import_skips_duplicates(self, ledger_file: str):
+        persistence = TransactionPersistence(transactions_io_for_file(ledger_file))
+        persistence.save_transactions(TRANSACTIONS)
+
+        summary = persistence.import_transactions(self._read_export(), chunk_size=1)
+        self.assertEqual(tr.ImportSummary(read_count=5, imported_count=4, duplicate_count=1), summary)
+
+        # Both purchases of AMZN on the same day are imported
+        portfolio = TransactionPersistence(transactions_io_for_file(ledger_file)).read_portfolio()
+        self.assertEqual({Security('AAPL'): 5, Security('TSLA'): 12.5, Security('AMZN'): 6}, portfolio)
+
+        summary = TransactionPersistence(transactions_io_for_file(ledger_file)).import_transactions(self._read_export())
+        self.assertEqual(tr.ImportSummary(read_count=5, imported_count=0, duplicate_count=5), summary)
+
+    def test_import_into_text_file(self):
+        ledger_file = str(Path(self._directory.name) / 'ledger.tsv')
+        self._assert_import_skips_duplicates(ledger_file)
+
+        ledger = FileDataFrameIO(ledger_file).read_dataframe()
+        self.assertEqual(6, len(ledger))
+        self.assertEqual(['2020-01-02', '2020-01-02', '2020-01-04', '2020-01-05'],
+                         list(ledger[tr.TRANSACTION_DATE].iloc[2:]))
+
+    def test_import_into_sqlite(self):
+        self._assert_import_skips_duplicates(str(Path(self._directory.name) / 'ledger.sqlite'))
+
+    def test_imported_transactions_are_visible_after_loading(self):
+        persistence = TransactionPersistence(transactions_io_for_file(str(Path(self._directory.name) / 'ledger.tsv')))
+        persistence.save_transactions(TRANSACTIONS)
+        persistence.read_holdings_history()
+
+        persistence.import_transactions(self._read_export())
+
+        self.assertEqual(5, persistence.read_portfolio()[Security('AAPL')])
+        self.assertEqual(4, len(persistence.read_holdings_history()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,12 @@
+import tempfile
 import unittest
 from datetime import datetime
+from pathlib import Path
 
 import pandas as pd
 
 from persistence import transaction_persistence as tr
-from persistence import PersistenceDataFrameIO
+from persistence import PersistenceDataFrameIO, HistoryCheckpoint
 from data_types import Security
 
 TRANSACTIONS = [
@@ -17,11 +19,14 @@ TRANSACTIONS = [
 
 
 class TestDataFrameIO(PersistenceDataFrameIO):
-    def __init__(self):
+    def __init__(self, transactions=TRANSACTIONS):
         self.saved_dataframes = []
+        self.read_count = 0
+        self._transactions = transactions
 
     def read_dataframe(self) -> pd.DataFrame:
-        return pd.DataFrame(TRANSACTIONS)
+        self.read_count += 1
+        return pd.DataFrame(self._transactions)
 
     def save_dataframe(self, dataframe: pd.DataFrame):
         self.saved_dataframes.append(dataframe)
@@ -45,6 +50,15 @@ class TransactionPersistenceTests(unittest.TestCase):
         self.assertEqual(portfolio[Security('TSLA')], 15)
         self.assertEqual(portfolio[Security('AMZN')], 10)
 
+    def test_transactions_are_read_on_first_access(self):
+        test_io = TestDataFrameIO()
+        persistence = tr.TransactionPersistence(test_io)
+        self.assertEqual(test_io.read_count, 0)
+
+        persistence.read_portfolio()
+        persistence.read_portfolio()
+        self.assertEqual(test_io.read_count, 1)
+
     def test_save_transactions(self):
         test_io = TestDataFrameIO()
         persistence = tr.TransactionPersistence(test_io)
@@ -102,6 +116,108 @@ class TransactionPersistenceTests(unittest.TestCase):
         for date, price in portfolio_history.items():
             self.assertAlmostEqual(price, expected_history.get(date, -1))
 
+    def test_read_history_with_range_prices(self):
+        prices = pd.DataFrame({
+            'AAPL': [10, 50, 1],
+            'AMZN': [20, 20, 2],
+            'TSLA': [30, 30, 3]
+        }, index=pd.to_datetime(['2019-12-31', '2020-01-03', '2020-01-05']))
+        requested_ranges = []
+
+        def get_prices(securities, start, end) -> pd.DataFrame:
+            requested_ranges.append((sorted(sec.identifier for sec in securities), start, end))
+            return prices
+
+        test_io = TestDataFrameIO()
+        persistence = tr.TransactionPersistence(test_io)
+
+        portfolio_history = persistence.read_portfolio_history(range_price_provider=get_prices)
+        expected_history = {
+            datetime(2020, 1, 1): 100+200+300,
+            datetime(2020, 1, 4): 250+200+300,
+            datetime(2020, 1, 5): 5+20+45
+        }
+
+        self.assertEqual(requested_ranges, [(['AAPL', 'AMZN', 'TSLA'], datetime(2020, 1, 1), datetime(2020, 1, 5))])
+        self.assertEqual(set(portfolio_history.keys()), set(expected_history.keys()))
+        for date, price in portfolio_history.items():
+            self.assertAlmostEqual(price, expected_history[date])
+
+    def test_read_holdings_history(self):
+        persistence = tr.TransactionPersistence(TestDataFrameIO())
+
+        holdings = persistence.read_holdings_history()
+        self.assertEqual(list(holdings.index), [datetime(2020, 1, 1), datetime(2020, 1, 4), datetime(2020, 1, 5)])
+        self.assertEqual(list(holdings['AAPL']), [10, 5, 5])
+        self.assertEqual(list(holdings['TSLA']), [10, 10, 15])
+
+        daily_holdings = persistence.read_holdings_history('daily', end=datetime(2020, 1, 6))
+        self.assertEqual(len(daily_holdings.index), 6)
+        self.assertEqual(list(daily_holdings['AAPL']), [10, 10, 10, 5, 5, 5])
+        self.assertEqual(list(daily_holdings['AMZN']), [10] * 6)
+
+    def test_read_monthly_history(self):
+        persistence = tr.TransactionPersistence(TestDataFrameIO())
+        prices = pd.DataFrame({'AAPL': [1.0], 'AMZN': [2.0], 'TSLA': [3.0]}, index=pd.to_datetime(['2019-12-31']))
+
+        history = persistence.read_portfolio_history(range_price_provider=lambda *_: prices, frequency='monthly')
+
+        self.assertEqual(next(iter(history.keys())), datetime(2020, 1, 31))
+        self.assertEqual(history[datetime(2020, 1, 31)], 5 + 20 + 45)
+        self.assertEqual(history[datetime(2020, 3, 31)], 5 + 20 + 45)
+
+    def test_read_incremental_history(self):
+        requested_ranges = []
+        prices = pd.DataFrame({'AAPL': [1.0], 'AMZN': [2.0], 'TSLA': [3.0], 'SPY': [4.0]},
+                              index=pd.to_datetime(['2019-12-31']))
+
+        def get_prices(securities, start, end) -> pd.DataFrame:
+            requested_ranges.append((sorted(sec.identifier for sec in securities), start, end))
+            return prices
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = HistoryCheckpoint(str(Path(directory) / 'transactions.history.json'))
+            history = tr.TransactionPersistence(TestDataFrameIO()).read_portfolio_history(
+                range_price_provider=get_prices, checkpoint=checkpoint)
+            cached_history = tr.TransactionPersistence(TestDataFrameIO()).read_portfolio_history(
+                range_price_provider=get_prices, checkpoint=checkpoint)
+
+            self.assertEqual(history, cached_history)
+            self.assertEqual(len(requested_ranges), 1)
+
+            new_transaction = tr.ShareTransaction('SPY', 2, datetime.combine(datetime.today(), datetime.min.time()))
+            appended_history = tr.TransactionPersistence(TestDataFrameIO(TRANSACTIONS + [new_transaction])) \
+                .read_portfolio_history(range_price_provider=get_prices, checkpoint=checkpoint)
+
+            self.assertEqual(requested_ranges[-1][0], ['AAPL', 'AMZN', 'SPY', 'TSLA'])
+            self.assertEqual(requested_ranges[-1][1], new_transaction.transaction_date)
+            self.assertEqual(appended_history[new_transaction.transaction_date], 5 + 20 + 45 + 8)
+
+            old_transaction = tr.ShareTransaction('AAPL', 1, datetime(2020, 1, 2))
+            rebuilt_history = tr.TransactionPersistence(TestDataFrameIO(TRANSACTIONS + [old_transaction])) \
+                .read_portfolio_history(range_price_provider=get_prices, checkpoint=checkpoint)
+
+            self.assertEqual(requested_ranges[-1][1], datetime(2020, 1, 1))
+            self.assertEqual(rebuilt_history[datetime(2020, 1, 2)], 11 + 20 + 30)
+
+    def test_incremental_history_with_redated_transaction(self):
+        prices = pd.DataFrame({'AAPL': [1.0], 'AMZN': [2.0], 'TSLA': [3.0]}, index=pd.to_datetime(['2019-12-31']))
+        # Same count and total shares of every security as TRANSACTIONS, but AAPL shares are sold a day earlier
+        redated_transactions = TRANSACTIONS[:3] + [
+            tr.ShareTransaction(security_id='AAPL', transaction_share_amount=-5, transaction_date=datetime(2020, 1, 3)),
+            TRANSACTIONS[4]
+        ]
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = HistoryCheckpoint(str(Path(directory) / 'transactions.history.json'))
+            tr.TransactionPersistence(TestDataFrameIO()).read_portfolio_history(
+                range_price_provider=lambda *_: prices, checkpoint=checkpoint)
+            history = tr.TransactionPersistence(TestDataFrameIO(redated_transactions)).read_portfolio_history(
+                range_price_provider=lambda *_: prices, checkpoint=checkpoint)
+
+        self.assertEqual(list(history.keys()), [datetime(2020, 1, 1), datetime(2020, 1, 3), datetime(2020, 1, 5)])
+        self.assertEqual(history[datetime(2020, 1, 3)], 5 + 20 + 30)
+
     def test_read_empty_portfolio(self):
         test_io = EmptyDataFrameIO()
         persistence = tr.TransactionPersistence(test_io)
@@ -0,0 +1,51 @@
+from typing import Dict, Iterator, Mapping, Optional
+
+import pandas as pd
+
+from persistence.transaction_persistence import SECURITY_ID, TRANSACTION_SHARE_AMOUNT, TRANSACTION_DATE, \
+    TRANSACTION_COLUMNS, DEFAULT_CHUNK_SIZE
+
+
+def read_transaction_export(file_name: str, columns: Optional[Mapping[str, str]] = None,
+                            chunk_size: int = DEFAULT_CHUNK_SIZE, delimiter: str = ',',
+                            date_format: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Reads the transactions of a file exported by a broker in chunks of at most chunk_size rows, so that the file is
+    never read completely into memory. Columns that are not transaction columns are not read.
+    :param columns: Column of the file for every transaction column, for the transaction columns that are named
+    differently in the file
+    :param date_format: strftime format of the dates, or None to infer it
+    :return: Dataframes with the transaction columns
+    """
+    file_columns: Dict[str, str] = {column: column for column in TRANSACTION_COLUMNS}
+    file_columns.update(columns or dict())
+    renamed_columns = {file_column: column for column, file_column in file_columns.items()}
+
+    with pd.read_csv(file_name, sep=delimiter, usecols=list(renamed_columns.keys()),
+                     dtype={file_columns[SECURITY_ID]: str}, chunksize=chunk_size) as chunks:
+        first_row = 0
+        for chunk in chunks:
+            chunk = chunk.rename(columns=renamed_columns)[TRANSACTION_COLUMNS]
+            _check_missing_values(chunk, first_row, file_name)
+
+            try:
+                dates = pd.to_datetime(chunk[TRANSACTION_DATE], format=date_format)
+                if dates.dt.tz is not None:
+                    dates = dates.dt.tz_convert(None)
+                amounts = pd.to_numeric(chunk[TRANSACTION_SHARE_AMOUNT])
+            except (ValueError, TypeError) as error:
+                raise ValueError(f'Invalid transaction between rows {first_row + 1} and {first_row + len(chunk)} '
+                                 f'of {file_name}: {error}') from error
+
+            yield pd.DataFrame({SECURITY_ID: chunk[SECURITY_ID].str.strip(), TRANSACTION_SHARE_AMOUNT: amounts,
+                                TRANSACTION_DATE: dates})
+            first_row += len(chunk)
+
+
+def _check_missing_values(chunk: pd.DataFrame, first_row: int, file_name: str):
+    missing_values = chunk.isna()
+    incomplete_rows = missing_values.any(axis=1).to_numpy()
+    if incomplete_rows.any():
+        position = int(incomplete_rows.argmax())
+        missing_columns = chunk.columns[missing_values.iloc[position].to_numpy()]
+        raise ValueError(f'Row {first_row + position + 1} of {file_name} has no {", ".join(missing_columns)}')
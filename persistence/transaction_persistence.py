@@ -1,17 +1,31 @@
+import hashlib
 from dataclasses import dataclass
-from typing import Dict, Sequence, Callable
+from typing import Dict, Iterable, Sequence, Callable, Optional, Tuple
 import datetime as dt
 
 import pandas as pd
 import numpy as np
 
-from data_types import Security
-from persistence import PersistenceDataFrameIO
+import profiling
+from data_types import Security, SECURITIES, intern_security
+from data_types.security_values import Portfolio
+from persistence import PersistenceDataFrameIO, QueryableDataFrameIO, AppendableDataFrameIO, HistoryCheckpoint, \
+    HistoryCheckpointState, HoldingsSnapshot, HoldingsSnapshotState
 
 SECURITY_ID = 'security_id'
 TRANSACTION_SHARE_AMOUNT = 'transaction_share_amount'
 TRANSACTION_DATE = 'transaction_date'
 
+# pandas 2.2 renamed the month end frequency from 'M' to 'ME', and deprecated the old name
+_MONTH_END = 'ME' if tuple(int(part) for part in pd.__version__.split('.')[:2]) >= (2, 2) else 'M'
+HISTORY_FREQUENCIES = {'daily': 'D', 'weekly': 'W', 'monthly': _MONTH_END}
+
+TRANSACTION_COLUMNS = [SECURITY_ID, TRANSACTION_SHARE_AMOUNT, TRANSACTION_DATE]
+DEFAULT_CHUNK_SIZE = 100_000
+
+PriceProvider = Callable[[Security, dt.datetime], float]
+RangePriceProvider = Callable[[Sequence[Security], dt.datetime, dt.datetime], pd.DataFrame]
+
 
 @dataclass
 class ShareTransaction:
@@ -20,64 +34,513 @@ class ShareTransaction:
     transaction_date: dt.datetime
 
 
+@dataclass
+class ImportSummary:
+    read_count: int = 0
+    imported_count: int = 0
+    duplicate_count: int = 0
+
+
+class _TransactionHashIndex:
+    """
+    Sorted 64-bit hashes of the transactions, which take 8 bytes per transaction instead of the transactions
+    themselves. Two different transactions with the same hash are unlikely enough to be ignored.
+    """
+    def __init__(self, hashes: np.ndarray):
+        hashes = np.sort(hashes)
+        is_first = np.ones(len(hashes), dtype=bool)
+        is_first[1:] = hashes[1:] != hashes[:-1]
+        self._hashes = hashes[is_first]
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        :return: Whether every hash is in the index
+        """
+        if len(self._hashes) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+
+        positions = np.minimum(np.searchsorted(self._hashes, hashes), len(self._hashes) - 1)
+        return self._hashes[positions] == hashes
+
+
 class TransactionPersistence:
-    def __init__(self, dataframe_io: PersistenceDataFrameIO):
+    def __init__(self, dataframe_io: PersistenceDataFrameIO, holdings_snapshot: Optional[HoldingsSnapshot] = None):
+        """
+        :param holdings_snapshot: Where the current holdings are kept, so that reading the portfolio only processes the
+        transactions saved after them. It is only used with sources that can read their rows after a position, and
+        that cannot sum them with a query, which is faster than loading the rows to build the snapshot.
+        """
         self._dataframe_io = dataframe_io
+        self._holdings_snapshot = holdings_snapshot \
+            if isinstance(dataframe_io, AppendableDataFrameIO) and not isinstance(dataframe_io, QueryableDataFrameIO) \
+            else None
+
+        # Transactions are only read when they are first needed, and backends that can query their rows are only read
+        # completely when all the transactions are needed
+        self._loaded_transactions = None
+        self._pending_transactions = []
+        # Position after the loaded transactions, from which the rows saved since then by any writer are read
+        self._loaded_position = None
+
+    def _read_transactions(self) -> pd.DataFrame:
+        with profiling.phase('transactions load'):
+            return _parse_dates(self._dataframe_io.read_dataframe())
+
+    @property
+    def _transactions_dataframe(self) -> pd.DataFrame:
+        if isinstance(self._dataframe_io, AppendableDataFrameIO):
+            return self._refreshed_transactions()
+
+        if self._loaded_transactions is None:
+            self._loaded_transactions = self._read_transactions()
+
+        # Saved transactions are only merged into the in-memory dataframe when it is read, so that saving does not
+        # copy the whole history
+        if self._pending_transactions:
+            dataframes = [self._loaded_transactions] if not self._loaded_transactions.empty else []
+            self._loaded_transactions = pd.concat(dataframes + self._pending_transactions, ignore_index=True)
+            self._pending_transactions = []
+
+        return self._loaded_transactions
 
-        self._transactions_dataframe = self._dataframe_io.read_dataframe()
+    def _refreshed_transactions(self) -> pd.DataFrame:
+        """
+        Adds the rows saved after the loaded transactions, including the ones saved by other processes, and reads all
+        of them again when the source was replaced since they were loaded
+        """
+        new_rows = self._dataframe_io.read_dataframe_after(self._loaded_position) \
+            if self._loaded_transactions is not None else None
+        if new_rows is None:
+            with profiling.phase('transactions load'):
+                transactions, self._loaded_position = self._dataframe_io.read_dataframe_after(None)
+                self._loaded_transactions = _parse_dates(transactions)
+            return self._loaded_transactions
 
-        if not self._transactions_dataframe.empty:
-            self._transactions_dataframe[TRANSACTION_DATE] = pd.to_datetime(self._transactions_dataframe[TRANSACTION_DATE])
+        new_transactions, self._loaded_position = new_rows
+        if not new_transactions.empty:
+            dataframes = [self._loaded_transactions] if not self._loaded_transactions.empty else []
+            self._loaded_transactions = pd.concat(dataframes + [_parse_dates(new_transactions)], ignore_index=True)
 
-    def read_portfolio(self) -> Dict[Security, int]:
+        return self._loaded_transactions
+
+    def _holdings_before(self, date: Optional[dt.datetime]) -> Tuple[int, pd.Series]:
+        """
+        :return: The amount of transactions dated before the date, and the total shares of every security over them.
+        If the date is None, all the transactions are used.
+        """
+        if isinstance(self._dataframe_io, QueryableDataFrameIO):
+            date_column = TRANSACTION_DATE if date is not None else None
+            with profiling.phase('transactions query'):
+                return (self._dataframe_io.count(date_column, date),
+                        self._dataframe_io.sum_by(SECURITY_ID, TRANSACTION_SHARE_AMOUNT, date_column, date))
+
+        transactions = self._transactions_dataframe
+        if transactions.empty:
+            return 0, pd.Series(dtype=float)
+        if date is not None:
+            transactions = transactions[transactions[TRANSACTION_DATE] < date]
+
+        return len(transactions), transactions.groupby(SECURITY_ID, observed=True)[TRANSACTION_SHARE_AMOUNT].sum()
+
+    def _transactions_digest_before(self, date: dt.datetime) -> str:
+        """
+        :return: A digest of the transactions dated before the date, whatever their order, which changes when any of
+        them is added, removed, dated differently or changes its amount
+        """
+        if isinstance(self._dataframe_io, QueryableDataFrameIO):
+            with profiling.phase('transactions query'):
+                transactions = _parse_dates(self._dataframe_io.read_dataframe_between(TRANSACTION_DATE, None, date))
+        else:
+            transactions = self._transactions_dataframe
+
+        hashes = np.array([], dtype=np.uint64)
+        if not transactions.empty:
+            transactions = transactions[transactions[TRANSACTION_DATE] < date]
+            hashes = np.sort(_transaction_hashes(_normalized_transactions(transactions)))
+
+        return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+    def _transactions_between(self, start: Optional[dt.datetime], end: Optional[dt.datetime]) -> pd.DataFrame:
+        if isinstance(self._dataframe_io, QueryableDataFrameIO):
+            with profiling.phase('transactions query'):
+                return _parse_dates(self._dataframe_io.read_dataframe_between(TRANSACTION_DATE, start, end))
+
+        transactions = self._transactions_dataframe
+        if transactions.empty:
+            return transactions
+        if start is not None:
+            transactions = transactions[transactions[TRANSACTION_DATE] >= start]
+        if end is not None:
+            transactions = transactions[transactions[TRANSACTION_DATE] <= end]
+
+        return transactions
+
+    def read_portfolio(self) -> Portfolio:
         """
         Reads the amount of shares that are in the portfolio from the file
         that records all the transactions.
         :return: The portfolio in amount of shares
         """
-        if self._transactions_dataframe.empty:
-            return dict()
+        if self._holdings_snapshot is not None:
+            holdings = self._update_holdings_snapshot()
+            return Portfolio.from_identifiers(holdings.keys(), list(holdings.values()))
+
+        _, security_to_amount = self._holdings_before(None)
+        return Portfolio.from_identifiers(security_to_amount.index.astype(str), security_to_amount.to_numpy())
+
+    def _update_holdings_snapshot(self) -> Dict[str, float]:
+        """
+        Adds the transactions saved after the holdings snapshot to it. The whole snapshot is built again if it does not
+        exist, or if the transactions it processed changed.
+        :return: The current holdings
+        """
+        with profiling.phase('holdings snapshot'):
+            state = self._holdings_snapshot.read()
+            new_rows = self._dataframe_io.read_dataframe_after(state.position) if state is not None else None
+            if new_rows is None:
+                profiling.count('holdings snapshot rebuilds')
+                state = None
+                new_rows = self._dataframe_io.read_dataframe_after(None)
 
-        transactions_df = self._transactions_dataframe[[SECURITY_ID, TRANSACTION_SHARE_AMOUNT]]
-        aggregated_portfolio = transactions_df.groupby(SECURITY_ID).sum()
+            new_transactions, position = new_rows
+            holdings = dict(state.holdings) if state is not None else dict()
+            if new_transactions.empty:
+                if state is None and position is not None:
+                    self._holdings_snapshot.save(HoldingsSnapshotState(position, 0, holdings))
+                return holdings
 
-        security_to_amount = aggregated_portfolio[TRANSACTION_SHARE_AMOUNT].to_dict()
-        return {Security(sec_id): amount for sec_id, amount in security_to_amount.items()}
+            new_holdings = new_transactions.groupby(SECURITY_ID)[TRANSACTION_SHARE_AMOUNT].sum()
+            for sec_id, amount in new_holdings.to_dict().items():
+                holdings[str(sec_id)] = holdings.get(str(sec_id), 0) + amount
+
+            transaction_count = (state.transaction_count if state is not None else 0) + len(new_transactions)
+            self._holdings_snapshot.save(HoldingsSnapshotState(position, transaction_count, holdings))
+            return holdings
 
     def save_transactions(self, new_transactions: Sequence[ShareTransaction]):
         """
-        Appends new transactions to the file that persists the transactions.
+        Appends new transactions to the file that persists the transactions. Only the new transactions are written,
+        so the cost does not depend on the amount of transactions already saved.
         :param new_transactions: Transactions to save.
         """
-        new_transactions = pd.DataFrame(new_transactions)
-        self._transactions_dataframe = self._transactions_dataframe.append(new_transactions)
+        new_transactions = pd.DataFrame(new_transactions, columns=[SECURITY_ID, TRANSACTION_SHARE_AMOUNT,
+                                                                   TRANSACTION_DATE])
+        if new_transactions.empty:
+            return
+
+        self._dataframe_io.append_dataframe(new_transactions)
+
+        if self._loaded_transactions is not None and not isinstance(self._dataframe_io, AppendableDataFrameIO):
+            self._pending_transactions.append(_parse_dates(new_transactions))
+        if self._holdings_snapshot is not None:
+            self._update_holdings_snapshot()
+
+    def import_transactions(self, chunks: Iterable[pd.DataFrame],
+                            chunk_size: int = DEFAULT_CHUNK_SIZE) -> ImportSummary:
+        """
+        Appends transactions given as dataframes with the transaction columns, one chunk at a time, skipping the
+        transactions that were already saved. Only the chunk being imported and a hash of
+        every transaction are kept in memory, so the chunks can come from a file of any size. Transactions are only
+        compared with the ones saved before the import, so identical transactions of the chunks, such as two equal
+        purchases on the same day, are all imported. Importing the same file
+        again, for example after a failure in the middle of it, only appends the transactions that are missing. Other
+        processes wait for the import to end before saving, so that the transactions they save are not imported again.
+        :param chunk_size: Amount of saved transactions that are read at once to build the hashes
+        :return: The amount of transactions that were read, imported and skipped as duplicates
+        """
+        with self._dataframe_io.locked():
+            summary = self._import_locked_transactions(chunks, chunk_size)
+
+        if self._holdings_snapshot is not None:
+            self._update_holdings_snapshot()
+
+        return summary
+
+    def _import_locked_transactions(self, chunks: Iterable[pd.DataFrame], chunk_size: int) -> ImportSummary:
+        with profiling.phase('transactions hash index'):
+            saved_hashes = [_transaction_hashes(_normalized_transactions(chunk))
+                            for chunk in self._dataframe_io.read_dataframe_chunks(chunk_size) if not chunk.empty]
+            index = _TransactionHashIndex(np.concatenate(saved_hashes) if saved_hashes else np.array([], np.uint64))
+
+        summary = ImportSummary()
+        for chunk in chunks:
+            with profiling.phase('transactions import'):
+                chunk = _normalized_transactions(chunk)
+                new_transactions = chunk[~index.contains(_transaction_hashes(chunk))]
+                summary.read_count += len(chunk)
+                summary.imported_count += len(new_transactions)
+                summary.duplicate_count += len(chunk) - len(new_transactions)
+                if new_transactions.empty:
+                    continue
+
+                new_transactions = _with_whole_amounts(new_transactions.reset_index(drop=True))
+                self._dataframe_io.append_dataframe(new_transactions)
+
+            if self._loaded_transactions is not None and not isinstance(self._dataframe_io, AppendableDataFrameIO):
+                self._pending_transactions.append(new_transactions)
+
+        return summary
+
+    def compact_transactions(self, remove_duplicates: bool = False) -> pd.DataFrame:
+        """
+        Rewrites the file that persists the transactions sorted by date. Other processes wait for the file to be
+        rewritten before saving, so that their transactions are not lost.
+        :param remove_duplicates: Whether to keep only the first of identical transactions. They are kept by default,
+        since buying the same amount of a security twice on the same day gives identical transactions.
+        :return: The transactions that were removed
+        """
+        with self._dataframe_io.locked():
+            transactions = self._transactions_dataframe
+            if transactions.empty:
+                return pd.DataFrame(columns=TRANSACTION_COLUMNS)
+
+            transactions = transactions[TRANSACTION_COLUMNS]
+            is_removed = transactions.duplicated() if remove_duplicates else np.zeros(len(transactions), dtype=bool)
+            compacted_transactions = transactions[~is_removed] \
+                .sort_values(TRANSACTION_DATE, kind='stable') \
+                .reset_index(drop=True)
+
+            self._dataframe_io.save_dataframe(compacted_transactions)
+            if isinstance(self._dataframe_io, AppendableDataFrameIO):
+                # The positions of the rewritten source changed, so it is read again with its new positions when needed
+                self._loaded_transactions = None
+                self._loaded_position = None
+            else:
+                self._loaded_transactions = compacted_transactions
+
+        return transactions[is_removed].reset_index(drop=True)
+
+    def copy_transactions_to(self, dataframe_io: PersistenceDataFrameIO):
+        """
+        Saves all the transactions in another persistence source, with integer share amounts when all of them are
+        whole numbers.
+        """
+        transactions = self._transactions_dataframe
+        if transactions.empty:
+            transactions = pd.DataFrame(columns=TRANSACTION_COLUMNS)
+
+        dataframe_io.save_dataframe(_with_whole_amounts(transactions.copy()))
+
+    def read_holdings_history(self, frequency: Optional[str] = None,
+                              end: Optional[dt.datetime] = None) -> pd.DataFrame:
+        """
+        Reads the amount of shares of every security over time
+        :param frequency: One of HISTORY_FREQUENCIES to sample the holdings on a calendar, or None to get the holdings
+        after every transaction date
+        :param end: Last date of the calendar when sampling with a frequency. By default, today.
+        :return: A dataframe indexed by date with a column per security identifier
+        """
+        if self._transactions_dataframe.empty:
+            return pd.DataFrame()
 
-        self._dataframe_io.save_dataframe(self._transactions_dataframe)
+        holdings = _cumulative_holdings(self._transactions_dataframe, pd.Series(dtype=float))
+        if frequency is None:
+            return holdings
 
-    def read_portfolio_history(self, price_provider: Callable[[Security, dt.datetime], float]) -> Dict[dt.datetime, float]:
+        calendar = _history_calendar(frequency, holdings.index.min(), end)
+        return _sample_holdings(holdings, pd.Series(0, index=holdings.columns), calendar)
+
+    def read_portfolio_history(self, price_provider: Optional[PriceProvider] = None,
+                               range_price_provider: Optional[RangePriceProvider] = None,
+                               frequency: Optional[str] = None,
+                               checkpoint: Optional[HistoryCheckpoint] = None,
+                               start: Optional[dt.datetime] = None,
+                               end: Optional[dt.datetime] = None) -> Dict[dt.datetime, float]:
         """
         Reads the history of the portfolio
+        :param price_provider: Provides the price of a security at a date, and is called for every security and date
+        :param range_price_provider: Provides the prices of several securities between two dates as a dataframe
+        indexed by date with a column per security identifier. It is called once, and takes precedence over
+        price_provider.
+        :param frequency: One of HISTORY_FREQUENCIES to get the value on a calendar until today, or None to get the
+        value after every transaction date
+        :param checkpoint: Where the history computed before today is kept, so that only the transactions after it
+        are processed on the next call
+        :param start: First date of the history. By default, the date of the first transaction.
+        :param end: Last date of the history. By default, the date of the last transaction, or today when sampling
+        with a frequency.
         :return: A dictionary whose key is a date, and whose value is the value of the portfolio at that time
         """
-        if self._transactions_dataframe.empty:
-            return dict()
+        if price_provider is None and range_price_provider is None:
+            raise ValueError('Either a price provider or a range price provider is needed')
+
+        if frequency is not None and frequency not in HISTORY_FREQUENCIES:
+            raise ValueError(f'Unknown history frequency {frequency}')
+
+        if checkpoint is not None and (start is not None or end is not None):
+            raise ValueError('A checkpoint can only be used for the whole history')
+
+        initial_holdings = pd.Series(dtype=float)
+        previous_history = dict()
+        if start is not None:
+            _, initial_holdings = self._holdings_before(start)
+
+        state = checkpoint.read() if checkpoint is not None else None
+        if state is not None and self._is_checkpoint_valid(state, frequency):
+            initial_holdings = pd.Series(state.holdings, dtype=float)
+            previous_history = state.history
+            start = state.cutoff
+
+        transactions = self._transactions_between(start, end)
+        if start is None:
+            if transactions.empty:
+                return dict()
+            start = transactions[TRANSACTION_DATE].min().normalize()
+
+        holdings = _cumulative_holdings(transactions, initial_holdings)
+        if frequency is not None:
+            calendar = _history_calendar(frequency, pd.Timestamp(start), end)
+            holdings = _sample_holdings(holdings, initial_holdings.reindex(holdings.columns, fill_value=0), calendar)
+        holdings = holdings.loc[:, (holdings != 0).any(axis=0)]
+
+        if len(holdings.index) > 0 and len(holdings.columns) > 0:
+            share_prices = _read_share_prices(holdings, price_provider, range_price_provider)
+            portfolio = (share_prices * holdings).sum(axis=1)
+        else:
+            portfolio = pd.Series(0.0, index=holdings.index)
+        new_history = {date.to_pydatetime(): value for date, value in portfolio.items()}
+
+        history = {**previous_history, **new_history}
+        if checkpoint is not None:
+            checkpoint.save(self._history_checkpoint_state(frequency, history))
+
+        return history
+
+    def _is_checkpoint_valid(self, state: HistoryCheckpointState, frequency: Optional[str]) -> bool:
+        """
+        The checkpoint is valid if the transactions dated before its cutoff are still the ones it processed. This is
+        checked with their count, their total shares per security and a digest of all of them, without needing any
+        price.
+        """
+        if state.frequency != frequency:
+            return False
+
+        transaction_count, holdings = self._holdings_before(state.cutoff)
+        if transaction_count != state.transaction_count:
+            return False
+
+        expected_holdings = pd.Series(state.holdings, dtype=float)
+        all_ids = holdings.index.union(expected_holdings.index)
+
+        if not np.allclose(holdings.reindex(all_ids, fill_value=0).to_numpy(dtype=float),
+                           expected_holdings.reindex(all_ids, fill_value=0).to_numpy(dtype=float)):
+            return False
+
+        # Transactions dated differently before the cutoff, or shares moved between their dates, keep the same totals
+        return self._transactions_digest_before(state.cutoff) == state.transactions_digest
+
+    def _history_checkpoint_state(self, frequency: Optional[str],
+                                  history: Dict[dt.datetime, float]) -> HistoryCheckpointState:
+        # Values from today on may still change with the prices of the day, so they are not kept
+        cutoff = dt.datetime.combine(dt.date.today(), dt.time())
+        transaction_count, holdings = self._holdings_before(cutoff)
+
+        return HistoryCheckpointState(
+            frequency=frequency,
+            cutoff=cutoff,
+            transaction_count=transaction_count,
+            holdings={sec_id: float(amount) for sec_id, amount in holdings.items()},
+            transactions_digest=self._transactions_digest_before(cutoff),
+            history={date: value for date, value in history.items() if date < cutoff}
+        )
+
+
+def _parse_dates(transactions: pd.DataFrame) -> pd.DataFrame:
+    # Binary backends already store the dates as datetime64, so they only need to be parsed from text backends
+    dates = transactions.get(TRANSACTION_DATE)
+    if dates is not None and not pd.api.types.is_datetime64_any_dtype(dates):
+        # Appended rows may be written with times after rows that were written as dates only
+        transactions[TRANSACTION_DATE] = pd.to_datetime(dates, format='ISO8601')
+
+    return transactions
+
+
+def _normalized_transactions(transactions: pd.DataFrame) -> pd.DataFrame:
+    # Same types whatever the backend or the file the transactions come from, so that equal transactions hash equally
+    return pd.DataFrame({
+        SECURITY_ID: transactions[SECURITY_ID].astype(str),
+        TRANSACTION_SHARE_AMOUNT: pd.to_numeric(transactions[TRANSACTION_SHARE_AMOUNT]).astype(np.float64),
+        TRANSACTION_DATE: pd.to_datetime(transactions[TRANSACTION_DATE]).astype('datetime64[ns]')
+    })
+
+
+def _transaction_hashes(normalized_transactions: pd.DataFrame) -> np.ndarray:
+    return pd.util.hash_pandas_object(normalized_transactions, index=False).to_numpy()
+
+
+def _with_whole_amounts(transactions: pd.DataFrame) -> pd.DataFrame:
+    # Share amounts are integers when all of them are whole numbers, so that they are not written as decimals
+    amounts = transactions[TRANSACTION_SHARE_AMOUNT]
+    if pd.api.types.is_float_dtype(amounts) and (amounts == amounts.round()).all():
+        transactions[TRANSACTION_SHARE_AMOUNT] = amounts.astype(np.int64)
+
+    return transactions
+
+
+def _cumulative_holdings(transactions: pd.DataFrame, initial_holdings: pd.Series) -> pd.DataFrame:
+    """
+    :return: The shares of every security after each transaction date, starting from the initial holdings
+    """
+    if transactions.empty:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name=TRANSACTION_DATE), columns=initial_holdings.index,
+                            dtype=float)
+
+    share_changes = transactions.pivot_table(index=TRANSACTION_DATE, columns=SECURITY_ID,
+                                             values=TRANSACTION_SHARE_AMOUNT, aggfunc='sum', fill_value=0,
+                                             observed=True)
+    holdings = share_changes.sort_index().cumsum()
+    holdings.columns = pd.Index(holdings.columns.astype(object), name=None)
+
+    all_ids = holdings.columns.union(initial_holdings.index, sort=False)
+    return holdings.reindex(columns=all_ids, fill_value=0) + initial_holdings.reindex(all_ids, fill_value=0)
+
+
+def _history_calendar(frequency: str, start: pd.Timestamp, end: Optional[dt.datetime]) -> pd.DatetimeIndex:
+    end = pd.Timestamp(end if end is not None else dt.date.today())
+    return pd.date_range(start.normalize(), end, freq=HISTORY_FREQUENCIES[frequency])
+
+
+def _sample_holdings(holdings: pd.DataFrame, initial_holdings: pd.Series,
+                     calendar: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    :return: The holdings at the end of every day of the calendar, which are the initial holdings for days before the
+    first transaction
+    """
+    all_holdings = np.vstack([initial_holdings.reindex(holdings.columns, fill_value=0).to_numpy(dtype=float),
+                              holdings.to_numpy(dtype=float)])
+    positions = holdings.index.searchsorted(calendar + pd.Timedelta(days=1), side='left')
+
+    return pd.DataFrame(all_holdings[positions], index=calendar, columns=holdings.columns)
+
+
+def _read_share_prices(holdings: pd.DataFrame, price_provider: Optional[PriceProvider],
+                       range_price_provider: Optional[RangePriceProvider]) -> pd.DataFrame:
+    date_index = holdings.index
+    all_share_ids = holdings.columns
+    if range_price_provider is not None:
+        securities = SECURITIES.intern_all(all_share_ids)
+        prices = range_price_provider(securities, date_index.min().to_pydatetime(), date_index.max().to_pydatetime())
+        return _prices_as_of(prices[all_share_ids], date_index)
 
-        dated_transactions = self._transactions_dataframe.set_index(TRANSACTION_DATE).sort_index()
-        all_share_ids = dated_transactions[SECURITY_ID].unique()
+    share_prices = pd.DataFrame(0.0, index=date_index, columns=all_share_ids)
+    for share_id in all_share_ids:
+        security = intern_security(share_id)
+        date_to_price = lambda date: price_provider(security, date)
+        share_prices[share_id] = np.vectorize(date_to_price, otypes=[float])(date_index.to_pydatetime())
 
-        date_index = dated_transactions.index.unique()
-        share_history = pd.DataFrame(0, index=date_index, columns=all_share_ids)
-        for share_id in all_share_ids:
-            relevant_rows = dated_transactions[SECURITY_ID] == share_id
-            transactions = dated_transactions.loc[relevant_rows, TRANSACTION_SHARE_AMOUNT]
-            share_history.loc[dated_transactions.index[relevant_rows], share_id] = transactions
-            share_history[share_id] = share_history[share_id].cumsum()
+    return share_prices
 
-        share_prices = pd.DataFrame(0, index=date_index, columns=all_share_ids)
-        for share_id in all_share_ids:
-            date_to_price = lambda date: price_provider(Security(share_id), date)
-            share_prices[share_id] = np.vectorize(date_to_price)(date_index.to_pydatetime())
 
-        portfolio = (share_prices * share_history).apply(np.sum, axis=1)
+def _prices_as_of(prices: pd.DataFrame, dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """
+    Looks up the prices at every date as the last known price on or before it, with a binary search over the price
+    index. Dates before the first known price take the first known price.
+    """
+    prices = prices.set_axis(pd.to_datetime(prices.index), axis=0).sort_index().ffill().bfill()
+    positions = prices.index.searchsorted(dates, side='right') - 1
+    positions = np.clip(positions, 0, len(prices.index) - 1)
 
-        return {date.to_pydatetime(): price for date, price in portfolio.to_dict().items()}
+    return pd.DataFrame(prices.to_numpy()[positions], index=dates, columns=prices.columns)
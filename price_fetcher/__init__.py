@@ -1 +1,4 @@
-from .yahoo_finance_fetcher import get_price
\ No newline at end of file
+from .yahoo_finance_fetcher import get_price, get_prices
+from .price_cache import PriceCache, CachedPriceFetcher, CacheMode
+from .price_provider import PriceProvider, ConcurrentPriceProvider, InMemoryPriceProvider
+from .price_store import PriceStore
@@ -0,0 +1,228 @@
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Optional, Sequence, Tuple
+
+import pandas as pd
+
+import profiling
+from data_types import Security
+
+
+PriceFetcher = Callable[[Security, datetime], float]
+RangePriceFetcher = Callable[[Sequence[Security], datetime, datetime], pd.DataFrame]
+
+
+class CacheMode(Enum):
+    """
+    NORMAL reads the cache and fetches missing or expired prices, OFFLINE never fetches and fails on missing prices,
+    and REFRESH always fetches and overwrites the cached prices.
+    """
+    NORMAL = 'normal'
+    OFFLINE = 'offline'
+    REFRESH = 'refresh'
+
+
+class PriceCache:
+    """
+    Local SQLite store of security prices, keyed by security and trading day. Every price keeps the time at which it
+    was fetched, so that prices fetched while the day was not over yet can be told apart from final ones.
+    """
+    def __init__(self, file_name: str):
+        self._file_name = file_name
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            Path(self._file_name).parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self._file_name, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS prices ('
+                                     'security_id TEXT NOT NULL, '
+                                     'trading_day TEXT NOT NULL, '
+                                     'price REAL NOT NULL, '
+                                     'fetched_at TEXT NOT NULL, '
+                                     'PRIMARY KEY (security_id, trading_day))')
+            self._connection.execute('CREATE TABLE IF NOT EXISTS fetched_ranges ('
+                                     'security_id TEXT NOT NULL, '
+                                     'start_day TEXT NOT NULL, '
+                                     'end_day TEXT NOT NULL, '
+                                     'fetched_at TEXT NOT NULL)')
+            self._connection.commit()
+
+        return self._connection
+
+    def read_price(self, security: Security, day: date) -> Optional[Tuple[float, datetime]]:
+        """
+        :return: The cached price and the time when it was fetched, or None if the price is not cached
+        """
+        with self._lock:
+            row = self._get_connection().execute(
+                'SELECT price, fetched_at FROM prices WHERE security_id = ? AND trading_day = ?',
+                (security.identifier, day.isoformat())).fetchone()
+
+        if row is None:
+            return None
+
+        price, fetched_at = row
+        return price, datetime.fromisoformat(fetched_at)
+
+    def write_price(self, security: Security, day: date, price: float, fetched_at: datetime):
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute('INSERT OR REPLACE INTO prices (security_id, trading_day, price, fetched_at) '
+                               'VALUES (?, ?, ?, ?)',
+                               (security.identifier, day.isoformat(), float(price), fetched_at.isoformat()))
+            connection.commit()
+
+    def read_prices(self, security: Security, start_day: Optional[date], end_day: date) -> pd.Series:
+        """
+        :return: The cached prices of the security between both days, included, indexed by day. If start_day is None,
+        all the prices until end_day are returned.
+        """
+        start = start_day.isoformat() if start_day is not None else ''
+        with self._lock:
+            rows = self._get_connection().execute(
+                'SELECT trading_day, price FROM prices WHERE security_id = ? AND trading_day BETWEEN ? AND ? '
+                'ORDER BY trading_day',
+                (security.identifier, start, end_day.isoformat())).fetchall()
+
+        days = pd.to_datetime([day for day, _ in rows])
+        return pd.Series([price for _, price in rows], index=days, dtype=float)
+
+    def write_prices(self, security: Security, prices: pd.Series, fetched_at: datetime):
+        rows = [(security.identifier, pd.Timestamp(day).date().isoformat(), float(price), fetched_at.isoformat())
+                for day, price in prices.dropna().items()]
+        with self._lock:
+            connection = self._get_connection()
+            connection.executemany('INSERT OR REPLACE INTO prices (security_id, trading_day, price, fetched_at) '
+                                   'VALUES (?, ?, ?, ?)', rows)
+            connection.commit()
+
+    def read_fetched_range(self, security: Security, start_day: date,
+                           end_day: date) -> Optional[Tuple[date, datetime]]:
+        """
+        :return: The first day and the fetch time of the latest fetched range that covers both days, or None if no
+        fetched range covers them
+        """
+        with self._lock:
+            row = self._get_connection().execute(
+                'SELECT start_day, fetched_at FROM fetched_ranges '
+                'WHERE security_id = ? AND start_day <= ? AND end_day >= ? ORDER BY fetched_at DESC LIMIT 1',
+                (security.identifier, start_day.isoformat(), end_day.isoformat())).fetchone()
+
+        if row is None:
+            return None
+
+        range_start, fetched_at = row
+        return date.fromisoformat(range_start), datetime.fromisoformat(fetched_at)
+
+    def write_fetched_range(self, security: Security, start_day: date, end_day: date, fetched_at: datetime):
+        with self._lock:
+            connection = self._get_connection()
+            connection.execute('INSERT INTO fetched_ranges (security_id, start_day, end_day, fetched_at) '
+                               'VALUES (?, ?, ?, ?)',
+                               (security.identifier, start_day.isoformat(), end_day.isoformat(),
+                                fetched_at.isoformat()))
+            connection.commit()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class CachedPriceFetcher:
+    """
+    Price fetcher that stores the prices of another fetcher in a PriceCache. Prices fetched after their day was over
+    are kept permanently, while prices of the current day expire after a time to live.
+    """
+    def __init__(self, fetcher: PriceFetcher, cache: PriceCache, today_ttl: timedelta = timedelta(minutes=15),
+                 mode: CacheMode = CacheMode.NORMAL, clock: Callable[[], datetime] = datetime.now,
+                 range_fetcher: Optional[RangePriceFetcher] = None):
+        self._fetcher = fetcher
+        self._range_fetcher = range_fetcher
+        self._cache = cache
+        self._today_ttl = today_ttl
+        self._mode = mode
+        self._clock = clock
+
+    def _is_fresh(self, day: date, fetched_at: datetime, now: datetime) -> bool:
+        if fetched_at.date() > day:
+            return True
+
+        return now - fetched_at <= self._today_ttl
+
+    def get_price(self, security: Security, date: datetime) -> float:
+        day = date.date()
+        now = self._clock()
+
+        cached = self._cache.read_price(security, day) if self._mode != CacheMode.REFRESH else None
+        if cached is not None:
+            price, fetched_at = cached
+            if self._mode == CacheMode.OFFLINE or self._is_fresh(day, fetched_at, now):
+                profiling.count('price cache hits')
+                return price
+
+        if self._mode == CacheMode.OFFLINE:
+            raise LookupError(f'Price of security {security.identifier} at the date {day} is not cached')
+
+        with profiling.phase(f'price fetch {security.identifier}'):
+            price = self._fetcher(security, date)
+        self._cache.write_price(security, day, price, now)
+        return price
+
+    def get_prices(self, securities: Sequence[Security], start: datetime, end: datetime) -> pd.DataFrame:
+        """
+        Gets the daily prices of several securities between two dates. The securities whose range is not cached are
+        fetched together with a single call to the range fetcher.
+        :return: A dataframe indexed by day, with the identifier of every security as column
+        """
+        if self._range_fetcher is None:
+            raise ValueError('A range fetcher is needed to get the prices of a range of dates')
+
+        start_day, end_day = start.date(), end.date()
+        now = self._clock()
+
+        prices = dict()
+        securities_to_fetch = []
+        for security in securities:
+            fetched_range = None
+            if self._mode != CacheMode.REFRESH:
+                fetched_range = self._cache.read_fetched_range(security, start_day, end_day)
+
+            if fetched_range is not None:
+                range_start, fetched_at = fetched_range
+                if self._mode == CacheMode.OFFLINE or self._is_fresh(end_day, fetched_at, now):
+                    prices[security.identifier] = self._cache.read_prices(security, range_start, end_day)
+                    profiling.count('price cache hits')
+                    continue
+
+            if self._mode == CacheMode.OFFLINE:
+                cached_prices = self._cache.read_prices(security, None, end_day)
+                # Prices cached only before the range would be forward filled over the whole range
+                if cached_prices.empty or cached_prices.index.max().date() < start_day:
+                    raise LookupError(f'Prices of security {security.identifier} between {start_day} and {end_day} '
+                                      f'are not cached')
+                prices[security.identifier] = cached_prices
+            else:
+                securities_to_fetch.append(security)
+
+        if securities_to_fetch:
+            with profiling.phase('price range fetch'):
+                fetched_prices = self._range_fetcher(securities_to_fetch, start, end)
+            for security in securities_to_fetch:
+                security_prices = fetched_prices[security.identifier].dropna()
+                range_start = min([start_day, *(day.date() for day in security_prices.index[:1])])
+
+                self._cache.write_prices(security, security_prices, now)
+                self._cache.write_fetched_range(security, range_start, end_day, now)
+                prices[security.identifier] = security_prices
+
+        return pd.DataFrame(prices).sort_index()
+
+    def __call__(self, security: Security, date: datetime) -> float:
+        return self.get_price(security, date)
@@ -0,0 +1,155 @@
+import abc
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_types import Security
+
+
+PriceFetcher = Callable[[Security, datetime], float]
+RangePriceFetcher = Callable[[Sequence[Security], datetime, datetime], pd.DataFrame]
+Quote = Tuple[Security, datetime]
+
+
+class PriceProvider(abc.ABC):
+    """
+    Interface that provides the prices of securities, either at given dates or over a range of dates.
+    """
+    @abc.abstractmethod
+    def get_price(self, security: Security, date: datetime) -> float:
+        pass
+
+    @abc.abstractmethod
+    def get_prices(self, securities: Sequence[Security], start: datetime, end: datetime) -> pd.DataFrame:
+        """
+        :return: A dataframe indexed by day, with the identifier of every security as column
+        """
+        pass
+
+    def get_quotes(self, quotes: Sequence[Quote]) -> Dict[Quote, float]:
+        """
+        :return: The price of every security at its date
+        """
+        return {(security, date): self.get_price(security, date) for security, date in quotes}
+
+    def get_available_quotes(self, quotes: Sequence[Quote]) -> Dict[Quote, float]:
+        """
+        :return: The price of every security at its date, without the quotes whose price is not found, which fail with
+        a LookupError. Any other error, such as a network error, is raised.
+        """
+        prices = dict()
+        for security, date in quotes:
+            try:
+                prices[(security, date)] = self.get_price(security, date)
+            except LookupError:
+                continue
+        return prices
+
+    def __call__(self, security: Security, date: datetime) -> float:
+        return self.get_price(security, date)
+
+    def close(self):
+        """
+        Releases the resources of the provider, such as its threads
+        """
+        pass
+
+    def __enter__(self) -> 'PriceProvider':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ConcurrentPriceProvider(PriceProvider):
+    """
+    Price provider that runs the requests of a price fetcher concurrently on a thread pool, with a bounded number of
+    requests at the same time. Requests for the same security and date (or range) that are already in flight are
+    merged, so that the fetcher is called once for all of them.
+    """
+    def __init__(self, price_fetcher: PriceFetcher, range_fetcher: Optional[RangePriceFetcher] = None,
+                 max_concurrency: int = 8):
+        self._price_fetcher = price_fetcher
+        self._range_fetcher = range_fetcher
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._in_flight: Dict[Hashable, Future] = dict()
+        self._lock = threading.Lock()
+
+    def _submit(self, key: Hashable, function: Callable, *args) -> Future:
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+
+            future = self._executor.submit(function, *args)
+            self._in_flight[key] = future
+
+        # The callback runs right away if the request is already done, so it must be added without holding the lock
+        future.add_done_callback(lambda done_future: self._forget(key, done_future))
+        return future
+
+    def _forget(self, key: Hashable, future: Future):
+        with self._lock:
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def get_price(self, security: Security, date: datetime) -> float:
+        return self._submit((security, date), self._price_fetcher, security, date).result()
+
+    def get_quotes(self, quotes: Sequence[Quote]) -> Dict[Quote, float]:
+        futures = {(security, date): self._submit((security, date), self._price_fetcher, security, date)
+                   for security, date in quotes}
+        return {quote: future.result() for quote, future in futures.items()}
+
+    def get_available_quotes(self, quotes: Sequence[Quote]) -> Dict[Quote, float]:
+        futures = {(security, date): self._submit((security, date), self._price_fetcher, security, date)
+                   for security, date in quotes}
+        prices = dict()
+        for quote, future in futures.items():
+            try:
+                prices[quote] = future.result()
+            except LookupError:
+                continue
+        return prices
+
+    def get_prices(self, securities: Sequence[Security], start: datetime, end: datetime) -> pd.DataFrame:
+        if self._range_fetcher is None:
+            raise ValueError('A range fetcher is needed to get the prices of a range of dates')
+
+        futures = {security: self._submit((security, start, end), self._range_fetcher, [security], start, end)
+                   for security in dict.fromkeys(securities)}
+        prices = {security.identifier: future.result()[security.identifier] for security, future in futures.items()}
+
+        return pd.DataFrame(prices).sort_index()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class InMemoryPriceProvider(PriceProvider):
+    """
+    Deterministic price provider that looks up the prices from a dataframe indexed by day, with a column per security
+    identifier. The price at a date is the last known price on or before it, or the first known price for dates
+    before it.
+    """
+    def __init__(self, prices: pd.DataFrame):
+        self._prices = prices.set_axis(pd.to_datetime(prices.index), axis=0).sort_index()
+
+    def get_price(self, security: Security, date: datetime) -> float:
+        security_prices = self._prices[security.identifier].dropna()
+        if security_prices.empty:
+            raise LookupError(f'There are no prices for security {security.identifier}')
+
+        position = security_prices.index.searchsorted(pd.Timestamp(date), side='right') - 1
+        return float(security_prices.iloc[np.clip(position, 0, len(security_prices) - 1)])
+
+    def get_prices(self, securities: Sequence[Security], start: datetime, end: datetime) -> pd.DataFrame:
+        identifiers = [security.identifier for security in securities]
+        previous_days = self._prices.index[self._prices.index <= pd.Timestamp(start)]
+        first_day = previous_days[-1] if len(previous_days) > 0 else pd.Timestamp(start)
+
+        return self._prices.loc[first_day:pd.Timestamp(end), identifiers]
@@ -0,0 +1,213 @@
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+import profiling
+from data_types import Security
+from .price_provider import PriceProvider, Quote, RangePriceFetcher
+
+
+RESOLUTIONS = {'daily': 'D', 'hourly': 'h'}
+
+# Every row of a security file is the start of a day (or hour) and the price in it, sorted by time
+PRICE_DTYPE = np.dtype([('time', '<i8'), ('price', '<f8')])
+FILE_SUFFIX = '.npy'
+# Days without prices at the start of a range, for weekends and market holidays, that do not need to be fetched again
+MARKET_CLOSED_DAYS = timedelta(days=4)
+
+
+class PriceStore(PriceProvider):
+    """
+    Local time series of the prices of every security, stored as a NumPy file per security that is memory-mapped when
+    read. The price at a date is the last known price on or before it, so that weekends and market holidays take the
+    price of the previous trading day, or the first known price for dates before it. The store never fetches prices by
+    itself: they are added with sync.
+    """
+    def __init__(self, directory: str, resolution: str = 'daily'):
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f'Unknown price resolution {resolution}')
+
+        self._directory = Path(directory) / resolution
+        self._unit = RESOLUTIONS[resolution]
+        # Times of every security, by file modification time and size, since searching needs all of them anyway
+        self._series: Dict[str, Tuple[Tuple[int, int], np.ndarray, np.ndarray]] = dict()
+
+    def _file_path(self, identifier: str) -> Path:
+        return self._directory / f'{quote(identifier, safe="")}{FILE_SUFFIX}'
+
+    def _to_times(self, dates) -> np.ndarray:
+        return pd.DatetimeIndex(pd.to_datetime(dates)).tz_localize(None).to_numpy() \
+            .astype(f'datetime64[{self._unit}]').astype(np.int64)
+
+    def _read_series(self, identifier: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        :return: The times and the prices of the security, or None if the store does not have them. The prices are
+        memory-mapped, so only the pages of the looked up prices are read.
+        """
+        file_path = self._file_path(identifier)
+        try:
+            file_stat = file_path.stat()
+        except FileNotFoundError:
+            return None
+
+        file_state = (file_stat.st_mtime_ns, file_stat.st_size)
+        cached_series = self._series.get(identifier)
+        if cached_series is None or cached_series[0] != file_state:
+            rows = np.load(file_path, mmap_mode='r')
+            cached_series = (file_state, np.ascontiguousarray(rows['time']), rows['price'])
+            self._series[identifier] = cached_series
+
+        return cached_series[1], cached_series[2]
+
+    def _require_series(self, identifier: str) -> Tuple[np.ndarray, np.ndarray]:
+        series = self._read_series(identifier)
+        if series is None or len(series[0]) == 0:
+            raise LookupError(f'There are no stored prices for security {identifier}')
+
+        return series
+
+    def securities(self) -> List[Security]:
+        if not self._directory.is_dir():
+            return []
+
+        return sorted((Security(unquote(path.name[:-len(FILE_SUFFIX)]))
+                       for path in self._directory.glob(f'*{FILE_SUFFIX}')), key=lambda security: security.identifier)
+
+    def stored_range(self, security: Security) -> Optional[Tuple[datetime, datetime]]:
+        """
+        :return: The times of the first and the last stored prices of the security, or None if there are none
+        """
+        series = self._read_series(security.identifier)
+        if series is None or len(series[0]) == 0:
+            return None
+
+        first_time, last_time = np.array([series[0][0], series[0][-1]]).astype(f'datetime64[{self._unit}]')
+        return pd.Timestamp(first_time).to_pydatetime(), pd.Timestamp(last_time).to_pydatetime()
+
+    def read_prices(self, security: Security) -> pd.Series:
+        """
+        :return: All the stored prices of the security, indexed by time
+        """
+        series = self._read_series(security.identifier)
+        if series is None:
+            return pd.Series(dtype=float)
+
+        times, prices = series
+        # Indexed in nanoseconds, so that the index can be compared with any time, such as now
+        index = pd.DatetimeIndex(times.astype(f'datetime64[{self._unit}]').astype('datetime64[ns]'))
+        return pd.Series(np.array(prices), index=index)
+
+    def write_prices(self, security: Security, prices: pd.Series):
+        """
+        Adds prices to the stored ones. Prices at times that are already stored replace them.
+        """
+        prices = prices.dropna()
+        new_times = self._to_times(prices.index)
+        new_prices = prices.to_numpy(dtype=np.float64)
+
+        series = self._read_series(security.identifier)
+        if series is not None:
+            stored_times, stored_prices = series
+            kept = ~np.isin(stored_times, new_times)
+            new_times = np.concatenate([stored_times[kept], new_times])
+            new_prices = np.concatenate([stored_prices[kept], new_prices])
+            # The file cannot be replaced while it is memory-mapped on some platforms
+            del series, stored_times, stored_prices
+            self._series.pop(security.identifier, None)
+
+        # Prices of the same time in the new ones are reduced to the last one
+        order = np.argsort(new_times, kind='stable')
+        new_times, new_prices = new_times[order], new_prices[order]
+        is_last = np.append(new_times[1:] != new_times[:-1], True)
+
+        rows = np.empty(int(is_last.sum()), dtype=PRICE_DTYPE)
+        rows['time'], rows['price'] = new_times[is_last], new_prices[is_last]
+
+        self._directory.mkdir(parents=True, exist_ok=True)
+        file_path = self._file_path(security.identifier)
+        temporary_file_path = file_path.with_name(f'{file_path.name}.tmp')
+        with open(temporary_file_path, 'wb') as temporary_file:
+            np.save(temporary_file, rows)
+        os.replace(temporary_file_path, file_path)
+
+    def sync(self, securities: Sequence[Security], range_fetcher: RangePriceFetcher, start: datetime,
+             end: Optional[datetime] = None) -> int:
+        """
+        Fetches the prices of the securities that are not stored yet, from the last stored price of every security until
+        end, with a single call to the range fetcher for the securities that start at the same date. The last stored
+        price is fetched again, since it may have been stored before its day was over. Securities without stored prices
+        since start are fetched from start.
+        :param end: By default, now
+        :return: The amount of prices that were fetched
+        """
+        end = end if end is not None else datetime.now()
+        securities_by_start: Dict[datetime, List[Security]] = dict()
+        for security in dict.fromkeys(securities):
+            stored_range = self.stored_range(security)
+            security_start = start
+            if stored_range is not None and stored_range[0] <= start + MARKET_CLOSED_DAYS:
+                security_start = max(stored_range[1], start)
+            if security_start <= end:
+                securities_by_start.setdefault(security_start, []).append(security)
+
+        fetched_count = 0
+        for security_start, start_securities in securities_by_start.items():
+            with profiling.phase('price store sync'):
+                prices = range_fetcher(start_securities, security_start, end)
+            for security in start_securities:
+                security_prices = prices[security.identifier].dropna()
+                self.write_prices(security, security_prices)
+                fetched_count += len(security_prices)
+
+        return fetched_count
+
+    def price_at(self, securities: Sequence[Security], dates) -> np.ndarray:
+        """
+        Looks up the prices of several securities at several dates, with a binary search over the times of every
+        security for all the dates at once.
+        :return: An array with a row per date and a column per security
+        """
+        times = self._to_times(dates)
+        prices = np.empty((len(times), len(securities)))
+        for column, security in enumerate(securities):
+            security_times, security_prices = self._require_series(security.identifier)
+            positions = np.clip(np.searchsorted(security_times, times, side='right') - 1, 0, len(security_times) - 1)
+            prices[:, column] = security_prices[positions]
+
+        return prices
+
+    def get_price(self, security: Security, date: datetime) -> float:
+        return float(self.price_at([security], [date])[0, 0])
+
+    def get_quotes(self, quotes: Sequence[Quote]) -> Dict[Quote, float]:
+        quotes_by_security: Dict[Security, List[datetime]] = dict()
+        for security, date in quotes:
+            quotes_by_security.setdefault(security, []).append(date)
+
+        prices = dict()
+        for security, dates in quotes_by_security.items():
+            for date, price in zip(dates, self.price_at([security], dates)[:, 0]):
+                prices[(security, date)] = float(price)
+
+        return prices
+
+    def get_prices(self, securities: Sequence[Security], start: datetime, end: datetime) -> pd.DataFrame:
+        """
+        :return: The stored prices between start and end, and the last one before start so that start has a price
+        """
+        prices = dict()
+        for security in securities:
+            security_prices = self.read_prices(security)
+            if security_prices.empty:
+                raise LookupError(f'There are no stored prices for security {security.identifier}')
+
+            first = max(security_prices.index.searchsorted(pd.Timestamp(start), side='right') - 1, 0)
+            last = security_prices.index.searchsorted(pd.Timestamp(end), side='right')
+            prices[security.identifier] = security_prices.iloc[first:last]
+
+        return pd.DataFrame(prices).sort_index()
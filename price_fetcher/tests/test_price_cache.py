@@ -0,0 +1,138 @@
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from data_types import Security
+from price_fetcher import PriceCache, CachedPriceFetcher, CacheMode
+
+
+class FakeFetcher:
+    def __init__(self):
+        self.calls = []
+        self.price = 10.0
+
+    def __call__(self, security: Security, date: datetime) -> float:
+        self.calls.append((security, date))
+        return self.price
+
+
+class FakeRangeFetcher:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, securities, start: datetime, end: datetime) -> pd.DataFrame:
+        self.calls.append(([sec.identifier for sec in securities], start, end))
+        days = pd.date_range(start - timedelta(days=3), end, freq='B')
+        return pd.DataFrame({sec.identifier: range(len(days)) for sec in securities}, index=days, dtype=float)
+
+
+class FakeClock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+class CachedPriceFetcherTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.cache = PriceCache(str(Path(self._directory.name) / 'prices.sqlite'))
+        self.fetcher = FakeFetcher()
+        self.range_fetcher = FakeRangeFetcher()
+        self.clock = FakeClock(datetime(2021, 3, 10, 12, 0))
+
+    def tearDown(self):
+        self.cache.close()
+        self._directory.cleanup()
+
+    def _cached_fetcher(self, mode: CacheMode = CacheMode.NORMAL) -> CachedPriceFetcher:
+        return CachedPriceFetcher(self.fetcher, self.cache, today_ttl=timedelta(minutes=10), mode=mode,
+                                  clock=self.clock, range_fetcher=self.range_fetcher)
+
+    def test_past_prices_are_cached_permanently(self):
+        cached_fetcher = self._cached_fetcher()
+        past_date = datetime(2021, 2, 1)
+
+        self.assertEqual(cached_fetcher.get_price(Security('AAPL'), past_date), 10.0)
+        self.clock.now += timedelta(days=365)
+        self.assertEqual(cached_fetcher.get_price(Security('AAPL'), past_date), 10.0)
+
+        self.assertEqual(len(self.fetcher.calls), 1)
+
+    def test_todays_price_expires(self):
+        cached_fetcher = self._cached_fetcher()
+
+        cached_fetcher.get_price(Security('AAPL'), self.clock.now)
+        self.clock.now += timedelta(minutes=5)
+        cached_fetcher.get_price(Security('AAPL'), self.clock.now)
+        self.assertEqual(len(self.fetcher.calls), 1)
+
+        self.fetcher.price = 12.0
+        self.clock.now += timedelta(minutes=10)
+        self.assertEqual(cached_fetcher.get_price(Security('AAPL'), self.clock.now), 12.0)
+        self.assertEqual(len(self.fetcher.calls), 2)
+
+    def test_intraday_price_is_refetched_after_the_day(self):
+        cached_fetcher = self._cached_fetcher()
+        day = self.clock.now
+
+        cached_fetcher.get_price(Security('AAPL'), day)
+        self.clock.now += timedelta(days=1)
+        cached_fetcher.get_price(Security('AAPL'), day)
+        cached_fetcher.get_price(Security('AAPL'), day)
+
+        self.assertEqual(len(self.fetcher.calls), 2)
+
+    def test_offline_mode(self):
+        self._cached_fetcher().get_price(Security('AAPL'), datetime(2021, 2, 1))
+        self.clock.now += timedelta(days=1)
+        offline_fetcher = self._cached_fetcher(CacheMode.OFFLINE)
+
+        self.assertEqual(offline_fetcher.get_price(Security('AAPL'), datetime(2021, 2, 1)), 10.0)
+        with self.assertRaises(LookupError):
+            offline_fetcher.get_price(Security('TSLA'), datetime(2021, 2, 1))
+
+        self.assertEqual(len(self.fetcher.calls), 1)
+
+    def test_refresh_mode(self):
+        self._cached_fetcher().get_price(Security('AAPL'), datetime(2021, 2, 1))
+        self.fetcher.price = 11.0
+
+        refresh_fetcher = self._cached_fetcher(CacheMode.REFRESH)
+        self.assertEqual(refresh_fetcher.get_price(Security('AAPL'), datetime(2021, 2, 1)), 11.0)
+        self.assertEqual(self._cached_fetcher().get_price(Security('AAPL'), datetime(2021, 2, 1)), 11.0)
+
+        self.assertEqual(len(self.fetcher.calls), 2)
+
+    def test_past_price_ranges_are_cached(self):
+        securities = [Security('AAPL'), Security('TSLA')]
+        start, end = datetime(2021, 1, 4), datetime(2021, 2, 26)
+
+        fetched_prices = self._cached_fetcher().get_prices(securities, start, end)
+        self.clock.now += timedelta(days=30)
+        cached_prices = self._cached_fetcher().get_prices(securities, datetime(2021, 1, 10), datetime(2021, 2, 1))
+        offline_prices = self._cached_fetcher(CacheMode.OFFLINE).get_prices(securities, start, end)
+
+        self.assertEqual(len(self.range_fetcher.calls), 1)
+        pd.testing.assert_frame_equal(offline_prices, fetched_prices, check_freq=False)
+        self.assertEqual(list(cached_prices.columns), ['AAPL', 'TSLA'])
+        self.assertLessEqual(cached_prices.index.min(), pd.Timestamp(2021, 1, 10))
+
+    def test_offline_ranges_fail_on_prices_cached_only_before_them(self):
+        self._cached_fetcher().get_prices([Security('AAPL')], datetime(2019, 1, 2), datetime(2019, 12, 31))
+        offline_fetcher = self._cached_fetcher(CacheMode.OFFLINE)
+
+        with self.assertRaises(LookupError):
+            offline_fetcher.get_prices([Security('AAPL')], datetime(2020, 1, 2), datetime(2020, 12, 31))
+        self.assertEqual(len(self.range_fetcher.calls), 1)
+
+    def test_only_missing_price_ranges_are_fetched(self):
+        start, end = datetime(2021, 1, 4), datetime(2021, 2, 26)
+        self._cached_fetcher().get_prices([Security('AAPL')], start, end)
+        self._cached_fetcher().get_prices([Security('AAPL'), Security('TSLA')], start, end)
+
+        self.assertEqual([securities for securities, _, _ in self.range_fetcher.calls], [['AAPL'], ['TSLA']])
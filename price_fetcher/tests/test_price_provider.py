@@ -0,0 +1,112 @@
+import threading
+import time
+import unittest
+from datetime import datetime
+
+import pandas as pd
+
+from data_types import Security
+from price_fetcher import ConcurrentPriceProvider, InMemoryPriceProvider
+
+PRICES = pd.DataFrame({
+    'AAPL': [10.0, 11.0, 12.0],
+    'TSLA': [20.0, 21.0, 22.0]
+}, index=pd.to_datetime(['2021-01-04', '2021-01-05', '2021-01-08']))
+
+
+class SlowFetcher:
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = []
+        self.concurrent_calls = 0
+        self.max_concurrent_calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, security: Security, date: datetime) -> float:
+        with self._lock:
+            self.calls.append((security, date))
+            self.concurrent_calls += 1
+            self.max_concurrent_calls = max(self.max_concurrent_calls, self.concurrent_calls)
+
+        time.sleep(self.delay)
+
+        with self._lock:
+            self.concurrent_calls -= 1
+        return float(len(security.identifier))
+
+
+class PriceProviderTests(unittest.TestCase):
+    def test_quotes_are_fetched_concurrently_with_bounded_concurrency(self):
+        fetcher = SlowFetcher()
+        provider = ConcurrentPriceProvider(fetcher, max_concurrency=4)
+        quotes = [(Security(f'SEC{index}'), datetime(2021, 1, 4)) for index in range(12)]
+
+        prices = provider.get_quotes(quotes)
+        provider.close()
+
+        self.assertEqual(len(prices), 12)
+        self.assertEqual(len(fetcher.calls), 12)
+        self.assertEqual(fetcher.max_concurrent_calls, 4)
+
+    def test_duplicate_requests_are_merged(self):
+        fetcher = SlowFetcher(delay=0.2)
+        provider = ConcurrentPriceProvider(fetcher, max_concurrency=4)
+        quote = (Security('AAPL'), datetime(2021, 1, 4))
+
+        threads = [threading.Thread(target=provider.get_price, args=quote) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        prices = provider.get_quotes([quote, quote])
+        provider.close()
+
+        self.assertEqual(prices[quote], 4.0)
+        self.assertEqual(len(fetcher.calls), 2)
+
+    def test_available_quotes_skip_failed_requests(self):
+        in_memory_provider = InMemoryPriceProvider(PRICES)
+        provider = ConcurrentPriceProvider(in_memory_provider.get_price)
+        quotes = [(Security(identifier), datetime(2021, 1, 5)) for identifier in ('AAPL', 'MISSING', 'TSLA')]
+
+        prices = provider.get_available_quotes(quotes)
+        provider.close()
+
+        self.assertEqual(prices, {quotes[0]: 11.0, quotes[2]: 21.0})
+        self.assertEqual(in_memory_provider.get_available_quotes(quotes), prices)
+
+    def test_available_quotes_raise_other_errors(self):
+        def failing_fetcher(security: Security, date: datetime) -> float:
+            raise ConnectionError('The price server cannot be reached')
+
+        with ConcurrentPriceProvider(failing_fetcher) as provider:
+            with self.assertRaises(ConnectionError):
+                provider.get_available_quotes([(Security('AAPL'), datetime(2021, 1, 5))])
+
+    def test_threads_are_released_when_leaving_the_provider(self):
+        with ConcurrentPriceProvider(InMemoryPriceProvider(PRICES).get_price) as provider:
+            self.assertEqual(provider.get_price(Security('AAPL'), datetime(2021, 1, 5)), 11.0)
+
+        with self.assertRaises(RuntimeError):
+            provider.get_price(Security('AAPL'), datetime(2021, 1, 5))
+
+    def test_concurrent_price_ranges(self):
+        in_memory_provider = InMemoryPriceProvider(PRICES)
+        provider = ConcurrentPriceProvider(in_memory_provider.get_price, in_memory_provider.get_prices)
+
+        prices = provider.get_prices([Security('TSLA'), Security('AAPL')], datetime(2021, 1, 5), datetime(2021, 1, 8))
+        provider.close()
+
+        self.assertEqual(list(prices.columns), ['TSLA', 'AAPL'])
+        self.assertEqual(list(prices['AAPL']), [11.0, 12.0])
+
+    def test_in_memory_prices_are_looked_up_as_of_date(self):
+        provider = InMemoryPriceProvider(PRICES)
+
+        self.assertEqual(provider.get_price(Security('AAPL'), datetime(2021, 1, 5)), 11.0)
+        self.assertEqual(provider.get_price(Security('AAPL'), datetime(2021, 1, 7, 15)), 11.0)
+        self.assertEqual(provider.get_price(Security('TSLA'), datetime(2021, 1, 1)), 20.0)
+        self.assertEqual(provider.get_price(Security('TSLA'), datetime(2021, 2, 1)), 22.0)
+
+        prices = provider.get_prices([Security('AAPL')], datetime(2021, 1, 6), datetime(2021, 1, 8))
+        self.assertEqual(list(prices['AAPL']), [11.0, 12.0])
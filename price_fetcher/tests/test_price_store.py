@@ -0,0 +1,109 @@
+import tempfile
+import unittest
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_types import Security
+from price_fetcher import InMemoryPriceProvider, PriceStore
+
+PRICES = pd.DataFrame({
+    'AAPL': [10.0, 11.0, 12.0],
+    'TSLA': [20.0, 21.0, 22.0]
+}, index=pd.to_datetime(['2021-01-04', '2021-01-05', '2021-01-08']))
+
+
+class RangeFetcher:
+    def __init__(self, prices: pd.DataFrame):
+        self.prices = prices
+        self.calls = []
+
+    def __call__(self, securities, start: datetime, end: datetime) -> pd.DataFrame:
+        self.calls.append(([security.identifier for security in securities], start, end))
+        return self.prices.loc[start:end, [security.identifier for security in securities]]
+
+
+class PriceStoreTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.store = PriceStore(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_prices_are_looked_up_as_of_date(self):
+        self.store.sync([Security('AAPL'), Security('TSLA')], RangeFetcher(PRICES), datetime(2021, 1, 1),
+                        datetime(2021, 1, 10))
+        dates = [datetime(2021, 1, 1), datetime(2021, 1, 5, 15), datetime(2021, 1, 7), datetime(2021, 1, 10)]
+
+        prices = self.store.price_at([Security('TSLA'), Security('AAPL')], dates)
+
+        np.testing.assert_array_equal([[20.0, 10.0], [21.0, 11.0], [21.0, 11.0], [22.0, 12.0]], prices)
+        self.assertEqual(21.0, self.store.get_price(Security('TSLA'), datetime(2021, 1, 6)))
+
+    def test_lookup_matches_in_memory_provider(self):
+        rng = np.random.default_rng(2)
+        days = pd.bdate_range('2015-01-01', '2020-12-31')
+        prices = pd.DataFrame(rng.uniform(10, 100, (len(days), 3)), index=days, columns=['A', 'B', 'C'])
+        securities = [Security(identifier) for identifier in prices.columns]
+        self.store.sync(securities, RangeFetcher(prices), datetime(2015, 1, 1), datetime(2020, 12, 31))
+        dates = pd.Timestamp('2014-12-01') + pd.to_timedelta(rng.integers(0, 2300, 500), unit='D')
+
+        stored_prices = self.store.price_at(securities, dates)
+
+        expected_provider = InMemoryPriceProvider(prices)
+        expected_prices = [[expected_provider.get_price(security, date) for security in securities] for date in dates]
+        np.testing.assert_array_equal(expected_prices, stored_prices)
+
+    def test_sync_only_fetches_new_prices(self):
+        fetcher = RangeFetcher(PRICES)
+        self.store.sync([Security('AAPL')], fetcher, datetime(2021, 1, 1), datetime(2021, 1, 5))
+        self.store.sync([Security('AAPL'), Security('TSLA')], fetcher, datetime(2021, 1, 1), datetime(2021, 1, 10))
+
+        self.assertEqual([(['AAPL'], datetime(2021, 1, 1), datetime(2021, 1, 5)),
+                          (['AAPL'], datetime(2021, 1, 5), datetime(2021, 1, 10)),
+                          (['TSLA'], datetime(2021, 1, 1), datetime(2021, 1, 10))], fetcher.calls)
+        pd.testing.assert_series_equal(PRICES['AAPL'], self.store.read_prices(Security('AAPL')), check_names=False,
+                                       check_freq=False, check_index_type=False)
+
+    def test_written_prices_replace_stored_ones(self):
+        self.store.write_prices(Security('AAPL'), PRICES['AAPL'])
+        self.store.write_prices(Security('AAPL'), pd.Series([15.0, 13.0], index=pd.to_datetime(['2021-01-05',
+                                                                                                 '2021-01-09'])))
+
+        self.assertEqual([10.0, 15.0, 12.0, 13.0], self.store.read_prices(Security('AAPL')).tolist())
+        self.assertEqual((datetime(2021, 1, 4), datetime(2021, 1, 9)), self.store.stored_range(Security('AAPL')))
+
+    def test_range_starts_with_previous_price(self):
+        self.store.sync([Security('AAPL')], RangeFetcher(PRICES), datetime(2021, 1, 1), datetime(2021, 1, 10))
+
+        prices = self.store.get_prices([Security('AAPL')], datetime(2021, 1, 6), datetime(2021, 1, 8))
+
+        self.assertEqual([11.0, 12.0], prices['AAPL'].tolist())
+
+    def test_range_ends_with_sub_second_precision(self):
+        self.store.sync([Security('AAPL')], RangeFetcher(PRICES), datetime(2021, 1, 1), datetime(2021, 1, 10))
+
+        # Ends such as datetime.today() have microseconds, which are finer than the stored days
+        prices = self.store.get_prices([Security('AAPL')], datetime(2021, 1, 6), datetime(2021, 1, 8, 15, 30, 0, 5))
+
+        self.assertEqual([11.0, 12.0], prices['AAPL'].tolist())
+
+    def test_missing_security(self):
+        with self.assertRaises(LookupError):
+            self.store.get_price(Security('AAPL'), datetime(2021, 1, 4))
+
+    def test_hourly_resolution(self):
+        store = PriceStore(self._directory.name, resolution='hourly')
+        store.write_prices(Security('AAPL'), pd.Series([1.0, 2.0], index=pd.to_datetime(['2021-01-04 10:00',
+                                                                                         '2021-01-04 11:00'])))
+
+        self.assertEqual(1.0, store.get_price(Security('AAPL'), datetime(2021, 1, 4, 10, 59)))
+        self.assertEqual(2.0, store.get_price(Security('AAPL'), datetime(2021, 1, 4, 11)))
+        self.assertEqual([], self.store.securities())
+        self.assertEqual([Security('AAPL')], store.securities())
+
+
+if __name__ == '__main__':
+    unittest.main()
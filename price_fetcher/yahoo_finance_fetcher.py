@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta
+from typing import Sequence
 
 import pandas as pd
-import yfinance as yf
 
+import profiling
 from data_types import Security
 
 
@@ -11,6 +12,9 @@ def get_price(security: Security, date: datetime) -> float:
     Fetches the price of a given security on a given date using the Yahoo Finance API. The accuracy of this function
     is at the day level, and returns the average between the highs and lows of the day.
     """
+    # yfinance is slow to import, and is not needed when every price is already cached
+    import yfinance as yf
+
     symbol = yf.Ticker(security.identifier)
 
     # Note: There is no data on weekends, so we have to look for data all the way until friday. The reason why
@@ -26,7 +30,7 @@ def get_price(security: Security, date: datetime) -> float:
         dataframe = symbol.history(interval='1d', start=start_date, end=end_date)
 
     if dataframe.empty:
-        raise Exception(f'Cannot find price data for security {security.identifier} at the date {date}')
+        raise LookupError(f'Cannot find price data for security {security.identifier} at the date {date}')
 
     df_unique_dates = dataframe.groupby(dataframe.index).median()
 
@@ -36,3 +40,30 @@ def get_price(security: Security, date: datetime) -> float:
     data_at_date = df_unique_dates.loc[closest_date]
 
     return (data_at_date['High'] + data_at_date['Low']) / 2.0
+
+
+def get_prices(securities: Sequence[Security], start: datetime, end: datetime) -> pd.DataFrame:
+    """
+    Fetches the daily prices of several securities between two dates using the Yahoo Finance API, with a single
+    request per security. As in get_price, the price of a day is the average between its highs and lows.
+    :return: A dataframe indexed by day, with the identifier of every security as column
+    """
+    import yfinance as yf
+
+    # Note: As in get_price, the range starts 3 days before so that a start date on a weekend or on a market holiday
+    # still has a previous price, and the end date is extended by 1 day since it is not included in the result.
+    start_date = start - timedelta(days=3)
+    end_date = end + timedelta(days=1)
+
+    prices = dict()
+    for security in securities:
+        with profiling.phase(f'price fetch {security.identifier}'):
+            dataframe = yf.Ticker(security.identifier).history(interval='1d', start=start_date, end=end_date)
+        if dataframe.empty:
+            raise LookupError(f'Cannot find price data for security {security.identifier} between {start} and {end}')
+
+        days = pd.to_datetime(dataframe.index).tz_localize(None).normalize()
+        daily_prices = pd.Series(((dataframe['High'] + dataframe['Low']) / 2.0).to_numpy(), index=days)
+        prices[security.identifier] = daily_prices.groupby(level=0).median()
+
+    return pd.DataFrame(prices).sort_index()
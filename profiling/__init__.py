@@ -0,0 +1 @@
+from .timing_recorder import PhaseTiming, TimingRecorder, get_recorder, set_recorder, recording, phase, count
@@ -0,0 +1,57 @@
+import json
+import threading
+import unittest
+
+import profiling
+
+
+class TimingRecorderTests(unittest.TestCase):
+    def test_phases_accumulate(self):
+        recorder = profiling.TimingRecorder()
+        with recorder.phase('load'):
+            pass
+        with recorder.phase('load'):
+            pass
+        recorder.add('evaluations', calls=10)
+
+        timings = recorder.timings
+        self.assertEqual(list(timings.keys()), ['load', 'evaluations'])
+        self.assertEqual(timings['load'].calls, 2)
+        self.assertGreaterEqual(timings['load'].seconds, 0.0)
+        self.assertEqual(timings['evaluations'].calls, 10)
+        self.assertEqual(json.loads(recorder.to_json())['evaluations'], {'calls': 10, 'seconds': 0.0})
+        self.assertIn('evaluations', recorder.format_table())
+
+    def test_phases_from_several_threads(self):
+        recorder = profiling.TimingRecorder()
+
+        def record():
+            for _ in range(1000):
+                recorder.add('fetch', 0.001)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(recorder.timings['fetch'].calls, 4000)
+
+    def test_module_hook_records_only_while_recording(self):
+        with profiling.phase('ignored'):
+            pass
+        profiling.count('ignored')
+
+        with profiling.recording() as recorder:
+            with profiling.phase('recorded'):
+                pass
+            profiling.count('counted', 3)
+
+        profiling.count('ignored')
+        self.assertIsNone(profiling.get_recorder())
+        self.assertEqual(set(recorder.timings.keys()), {'recorded', 'counted'})
+        self.assertEqual(recorder.timings['counted'].calls, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import contextlib
+import json
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterator, Optional
+
+
+@dataclass
+class PhaseTiming:
+    calls: int = 0
+    seconds: float = 0.0
+
+
+class TimingRecorder:
+    """
+    Accumulates the wall time and the amount of calls of named phases. Phases can be recorded from several threads.
+    """
+    def __init__(self):
+        self._timings: Dict[str, PhaseTiming] = dict()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float = 0.0, calls: int = 1):
+        with self._lock:
+            timing = self._timings.setdefault(name, PhaseTiming())
+            timing.calls += calls
+            timing.seconds += seconds
+
+    @property
+    def timings(self) -> Dict[str, PhaseTiming]:
+        """
+        :return: The timing of every phase, in the order they were first recorded
+        """
+        with self._lock:
+            return {name: PhaseTiming(timing.calls, timing.seconds) for name, timing in self._timings.items()}
+
+    def to_json(self) -> str:
+        return json.dumps({name: asdict(timing) for name, timing in self.timings.items()}, indent=2)
+
+    def format_table(self) -> str:
+        timings = self.timings
+        if not timings:
+            return 'No phases were recorded'
+
+        longest_name = max(len(name) for name in timings)
+        lines = [f'{"Phase".ljust(longest_name + 2)}{"Calls":>10}{"Total (s)":>12}{"Mean (ms)":>12}']
+        for name, timing in timings.items():
+            mean_milliseconds = 1000 * timing.seconds / timing.calls if timing.calls > 0 else 0.0
+            lines.append(f'{name.ljust(longest_name + 2)}{timing.calls:>10}{timing.seconds:>12.4f}'
+                         f'{mean_milliseconds:>12.3f}')
+
+        return '\n'.join(lines)
+
+
+_recorder: Optional[TimingRecorder] = None
+
+
+def get_recorder() -> Optional[TimingRecorder]:
+    return _recorder
+
+
+def set_recorder(recorder: Optional[TimingRecorder]) -> Optional[TimingRecorder]:
+    """
+    Sets the recorder that the instrumented code reports to, or None to stop recording.
+    :return: The previous recorder
+    """
+    global _recorder
+    previous_recorder = _recorder
+    _recorder = recorder
+    return previous_recorder
+
+
+@contextlib.contextmanager
+def recording(recorder: Optional[TimingRecorder] = None) -> Iterator[TimingRecorder]:
+    """
+    Records the phases of the instrumented code that runs inside the context:
+
+        with profiling.recording() as recorder:
+            balance.calculate_next_purchases(...)
+        print(recorder.format_table())
+    """
+    recorder = recorder if recorder is not None else TimingRecorder()
+    previous_recorder = set_recorder(recorder)
+    try:
+        yield recorder
+    finally:
+        set_recorder(previous_recorder)
+
+
+def phase(name: str):
+    """
+    :return: A context manager that records the time spent in it under the name, or that does nothing if there is no
+    recorder
+    """
+    recorder = _recorder
+    if recorder is None:
+        return contextlib.nullcontext()
+
+    return recorder.phase(name)
+
+
+def count(name: str, calls: int = 1, seconds: float = 0.0):
+    """
+    Adds calls, and optionally their time, to a phase of the recorder, if there is one
+    """
+    recorder = _recorder
+    if recorder is not None:
+        recorder.add(name, seconds, calls)
@@ -0,0 +1,2 @@
+from .balancer_service import BalancerService
+from .http_server import BalancerHTTPServer, BalancerRequestHandler
@@ -0,0 +1,170 @@
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+
+import balance
+import persistence
+from data_types.security_values import Allocation, Portfolio
+from price_fetcher import PriceProvider
+
+
+FileState = Tuple[Tuple[int, int], ...]
+
+
+def _file_state(file_name: str) -> FileState:
+    """
+    :return: The modification time and size of the file and of its SQLite write-ahead log, which changes instead of
+    the database file until the log is checkpointed
+    """
+    state = []
+    for path in (Path(file_name), Path(f'{file_name}-wal')):
+        try:
+            file_stat = path.stat()
+            state.append((file_stat.st_mtime_ns, file_stat.st_size))
+        except FileNotFoundError:
+            state.append((0, 0))
+
+    return tuple(state)
+
+
+class BalancerService:
+    """
+    Keeps the transactions, the allocations and the computed portfolio values in memory between requests. The files
+    are read again when they change on disk, and the values that depend on today's prices are computed again when
+    they are older than price_ttl.
+
+    The methods can be called from several threads. The lock is only held to refresh the files and to look up or
+    store the computed values, which are computed without it, so that a request does not wait for the prices of
+    another one. Concurrent requests for the same value wait for a single computation.
+    """
+    def __init__(self, transactions_file: str, allocations_file: str, price_provider: PriceProvider,
+                 price_ttl: timedelta = timedelta(minutes=15), clock: Callable[[], datetime] = datetime.now):
+        self._transactions_file = transactions_file
+        self._allocations_file = allocations_file
+        self._price_provider = price_provider
+        self._price_ttl = price_ttl
+        self._clock = clock
+
+        self._lock = threading.RLock()
+        self._files_state: Optional[Tuple[FileState, FileState]] = None
+        self._transaction_persistence: Optional[persistence.TransactionPersistence] = None
+        self._allocations = Allocation.from_arrays([], [])
+        self._computed: Dict[Hashable, Tuple[datetime, object]] = dict()
+        self._in_flight: Dict[Tuple[int, Hashable], Future] = dict()
+        self.reload_count = 0
+
+    def _refresh(self):
+        files_state = (_file_state(self._transactions_file), _file_state(self._allocations_file))
+        if files_state == self._files_state:
+            return
+
+        self._transaction_persistence = persistence.TransactionPersistence(
+            persistence.transactions_io_for_file(self._transactions_file),
+            persistence.holdings_snapshot_for_file(self._transactions_file))
+        allocation_persistence = persistence.AllocationPercentagesPersistence(
+            persistence.allocations_io_for_file(self._allocations_file))
+        self._allocations = allocation_persistence.read_allocation_percentages() \
+            if Path(self._allocations_file).is_file() else Allocation.from_arrays([], [])
+        self._computed = dict()
+        self._files_state = files_state
+        self.reload_count += 1
+
+    def _get_or_compute(self, key: Hashable, compute: Callable[[persistence.TransactionPersistence], object]):
+        """
+        :param compute: Computes the value from the transactions of the files as they are when it is called
+        """
+        with self._lock:
+            self._refresh()
+            now = self._clock()
+            computed = self._computed.get(key)
+            if computed is not None and now - computed[0] < self._price_ttl:
+                return computed[1]
+
+            # Values computed from files that changed since are not waited for
+            generation = self.reload_count
+            future = self._in_flight.get((generation, key))
+            is_computing = future is None
+            if is_computing:
+                future = Future()
+                self._in_flight[(generation, key)] = future
+            transaction_persistence = self._transaction_persistence
+
+        if not is_computing:
+            return future.result()
+
+        try:
+            value = compute(transaction_persistence)
+        except BaseException as error:
+            with self._lock:
+                del self._in_flight[(generation, key)]
+            future.set_exception(error)
+            raise
+
+        with self._lock:
+            del self._in_flight[(generation, key)]
+            if generation == self.reload_count:
+                self._computed[key] = (now, value)
+        future.set_result(value)
+        return value
+
+    def _compute_portfolio(self, transaction_persistence: persistence.TransactionPersistence) \
+            -> Tuple[Portfolio, Portfolio]:
+        shares = transaction_persistence.read_portfolio()
+        today = self._clock()
+        prices = self._price_provider.get_quotes([(security, today) for security in shares.keys()])
+        return shares, shares.with_values(shares.array * np.array([prices[(security, today)] for security in shares],
+                                                                  dtype=np.float64))
+
+    def _state(self) -> Tuple[Portfolio, Portfolio, Allocation]:
+        """
+        :return: The shares and values of the portfolio, and the desired allocations
+        """
+        shares, values = self._get_or_compute('portfolio', self._compute_portfolio)
+        with self._lock:
+            return shares, values, self._allocations
+
+    def portfolio(self) -> dict:
+        shares, values, _ = self._state()
+        return {
+            'shares': {security.identifier: amount for security, amount in shares.items()},
+            'values': {security.identifier: value for security, value in values.items()},
+            'total': sum(values.values())
+        }
+
+    def invest(self, amount: float, max_count: Optional[int] = None,
+               strategy: balance.LimitedPurchaseStrategy = balance.LimitedPurchaseStrategy.EXACT) -> dict:
+        _, values, allocations = self._state()
+        purchases = balance.calculate_next_purchases(values, allocations, amount, purchases_to_keep=max_count,
+                                                     strategy=strategy)
+
+        return {
+            'portfolio_value': sum(values.values()),
+            'purchases': {security.identifier: purchase for security, purchase in purchases.items()},
+            'deviation': float(balance.get_deviation_from_ideal(values, purchases, allocations))
+        }
+
+    def invest_sweep(self, amounts: Sequence[float], max_count: Optional[int] = None) -> dict:
+        _, values, allocations = self._state()
+        sweep = balance.calculate_purchase_sweep(values, allocations, amounts, purchases_to_keep=max_count)
+
+        return {
+            'portfolio_value': sum(values.values()),
+            'amounts': sweep.amounts.tolist(),
+            'purchases': [{security.identifier: purchase for security, purchase in sweep.purchases_at(row).items()}
+                          for row in range(len(sweep.amounts))],
+            'deviations': sweep.deviations.tolist()
+        }
+
+    def history(self, frequency: Optional[str] = None) -> dict:
+        # Every history is computed from its own copy of the transactions, since histories of several frequencies can
+        # be computed at the same time
+        history = self._get_or_compute(
+            ('history', frequency),
+            lambda _: persistence.TransactionPersistence(persistence.transactions_io_for_file(self._transactions_file))
+            .read_portfolio_history(range_price_provider=self._price_provider.get_prices, frequency=frequency))
+
+        return {'history': [[date.isoformat(), float(value)] for date, value in history.items()]}
@@ -0,0 +1,76 @@
+import json
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import balance
+from .balancer_service import BalancerService
+
+
+class BalancerRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers GET requests with JSON:
+        /health
+        /portfolio
+        /invest?amount=1000[&max_count=3][&strategy=exact]
+        /invest?amounts=500,1000,1500[&max_count=3]
+        /history[?frequency=weekly]
+    """
+    server: 'BalancerHTTPServer'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parameters = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/health':
+                self._send_json(HTTPStatus.OK, {'status': 'ok'})
+            elif url.path == '/portfolio':
+                self._send_json(HTTPStatus.OK, self.server.service.portfolio())
+            elif url.path == '/invest':
+                self._send_json(HTTPStatus.OK, self._invest(parameters))
+            elif url.path == '/history':
+                self._send_json(HTTPStatus.OK, self.server.service.history(parameters.get('frequency')))
+            else:
+                self._send_json(HTTPStatus.NOT_FOUND, {'error': f'Unknown path {url.path}'})
+        except (ValueError, LookupError) as error:
+            self._send_json(HTTPStatus.BAD_REQUEST, {'error': str(error)})
+        except Exception as error:
+            self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(error)})
+
+    def _invest(self, parameters: Dict[str, str]) -> dict:
+        max_count = _optional_int(parameters.get('max_count'))
+        if 'amounts' in parameters:
+            amounts = [float(amount) for amount in parameters['amounts'].split(',')]
+            return self.server.service.invest_sweep(amounts, max_count)
+
+        if 'amount' not in parameters:
+            raise ValueError('Either the amount or the amounts parameter is needed')
+
+        strategy = balance.LimitedPurchaseStrategy(parameters.get('strategy', 'exact'))
+        return self.server.service.invest(float(parameters['amount']), max_count, strategy)
+
+    def _send_json(self, status: HTTPStatus, content: dict):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class BalancerHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service: BalancerService, verbose: bool = False):
+        super().__init__(address, BalancerRequestHandler)
+        self.service = service
+        self.verbose = verbose
+
+
+def _optional_int(value: Optional[str]) -> Optional[int]:
+    return int(value) if value is not None else None
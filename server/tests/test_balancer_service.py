@@ -0,0 +1,174 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from price_fetcher import InMemoryPriceProvider
+from server import BalancerService, BalancerHTTPServer
+
+PRICES = pd.DataFrame({
+    'AAPL': [10.0, 12.0],
+    'TSLA': [20.0, 25.0]
+}, index=pd.to_datetime(['2021-01-04', '2021-01-05']))
+
+
+class CountingPriceProvider(InMemoryPriceProvider):
+    def __init__(self, prices: pd.DataFrame):
+        super().__init__(prices)
+        self.price_calls = 0
+        self.range_calls = 0
+
+    def get_price(self, security, date):
+        self.price_calls += 1
+        return super().get_price(security, date)
+
+    def get_prices(self, securities, start, end) -> pd.DataFrame:
+        self.range_calls += 1
+        return super().get_prices(securities, start, end)
+
+
+class BlockingPriceProvider(CountingPriceProvider):
+    """
+    Waits until it is released before returning the prices of a range, as a slow price server
+    """
+    def __init__(self, prices: pd.DataFrame):
+        super().__init__(prices)
+        self.range_requested = threading.Event()
+        self.released = threading.Event()
+
+    def get_prices(self, securities, start, end) -> pd.DataFrame:
+        self.range_requested.set()
+        self.released.wait(timeout=10)
+        return super().get_prices(securities, start, end)
+
+
+class FakeClock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+
+class BalancerServiceTests(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        directory = Path(self._directory.name)
+        self.transactions_file = directory / 'transactions.tsv'
+        self.allocations_file = directory / 'allocations.tsv'
+        self.transactions_file.write_text('security_id\ttransaction_share_amount\ttransaction_date\n'
+                                          'AAPL\t10\t2021-01-04\n'
+                                          'TSLA\t5\t2021-01-04\n')
+        self.allocations_file.write_text('security_id\tallocation_percentage\nAAPL\t0.5\nTSLA\t0.5\n')
+
+        self.clock = FakeClock(datetime(2021, 1, 5, 12))
+        self.price_provider = CountingPriceProvider(PRICES)
+        self.service = BalancerService(str(self.transactions_file), str(self.allocations_file), self.price_provider,
+                                       price_ttl=timedelta(minutes=15), clock=self.clock)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_portfolio_is_kept_in_memory(self):
+        first = self.service.portfolio()
+        second = self.service.portfolio()
+
+        self.assertEqual(first, second)
+        self.assertEqual(first['values'], {'AAPL': 120.0, 'TSLA': 125.0})
+        self.assertEqual(self.price_provider.price_calls, 2)
+        self.assertEqual(self.service.reload_count, 1)
+
+    def test_prices_expire(self):
+        self.service.portfolio()
+        self.clock.now += timedelta(minutes=20)
+        self.service.portfolio()
+
+        self.assertEqual(self.price_provider.price_calls, 4)
+        self.assertEqual(self.service.reload_count, 1)
+
+    def test_files_are_read_again_when_they_change(self):
+        self.service.portfolio()
+        with open(self.transactions_file, 'a') as transactions_file:
+            transactions_file.write('TSLA\t5\t2021-01-05\n')
+        # Make sure the modification time changes even on file systems with a coarse resolution
+        modification_time = self.transactions_file.stat().st_mtime_ns + 10 ** 9
+        os.utime(self.transactions_file, ns=(modification_time, modification_time))
+
+        portfolio = self.service.portfolio()
+
+        self.assertEqual(portfolio['shares']['TSLA'], 10)
+        self.assertEqual(self.service.reload_count, 2)
+
+    def test_requests_do_not_wait_for_the_prices_of_other_requests(self):
+        price_provider = BlockingPriceProvider(PRICES)
+        service = BalancerService(str(self.transactions_file), str(self.allocations_file), price_provider,
+                                  clock=self.clock)
+        histories = []
+        thread = threading.Thread(target=lambda: histories.append(service.history()))
+        thread.start()
+        try:
+            self.assertTrue(price_provider.range_requested.wait(timeout=10))
+            self.assertEqual(service.portfolio()['values'], {'AAPL': 120.0, 'TSLA': 125.0})
+            self.assertEqual(histories, [])
+        finally:
+            price_provider.released.set()
+            thread.join()
+
+        self.assertEqual(len(histories), 1)
+
+    def test_concurrent_requests_compute_once(self):
+        price_provider = BlockingPriceProvider(PRICES)
+        service = BalancerService(str(self.transactions_file), str(self.allocations_file), price_provider,
+                                  clock=self.clock)
+        histories = []
+        threads = [threading.Thread(target=lambda: histories.append(service.history())) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(price_provider.range_requested.wait(timeout=10))
+        price_provider.released.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(histories), 4)
+        self.assertTrue(all(history == histories[0] for history in histories))
+        self.assertEqual(price_provider.range_calls, 1)
+
+    def test_invest(self):
+        result = self.service.invest(255.0)
+        self.assertAlmostEqual(result['purchases']['AAPL'], 130.0)
+        self.assertAlmostEqual(result['purchases']['TSLA'], 125.0)
+        self.assertAlmostEqual(result['deviation'], 0.0)
+
+        sweep = self.service.invest_sweep([255.0, 500.0], max_count=1)
+        self.assertEqual(sweep['purchases'][0], {'AAPL': 255.0})
+
+    def test_http_requests(self):
+        http_server = BalancerHTTPServer(('127.0.0.1', 0), self.service)
+        thread = threading.Thread(target=http_server.serve_forever)
+        thread.start()
+        try:
+            url = f'http://127.0.0.1:{http_server.server_port}'
+            with urllib.request.urlopen(f'{url}/invest?amount=255&max_count=2') as response:
+                self.assertAlmostEqual(json.loads(response.read())['purchases']['AAPL'], 130.0)
+
+            with urllib.request.urlopen(f'{url}/history') as response:
+                self.assertEqual(len(json.loads(response.read())['history']), 1)
+
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(f'{url}/invest?amount=255&strategy=unknown')
+            self.assertEqual(context.exception.code, 400)
+        finally:
+            http_server.shutdown()
+            http_server.server_close()
+            thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
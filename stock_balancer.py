@@ -1,24 +1,112 @@
 import argparse
-from datetime import datetime
+import cProfile
+import sys
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Tuple, Dict
+from typing import Dict, Iterable, List, Mapping, Optional
 
-import balance
-import persistence
-import price_fetcher as price
+import profiling
 from data_types import Security
 
+# balance, persistence and price_fetcher import numpy, scipy, pandas and yfinance, which take most of the startup
+# time. They are imported by the subcommands that need them, so that --help and the interactive menu start instantly.
+
+# Same as backtest.FREQUENCIES, which is not imported to parse the arguments
+BACKTEST_FREQUENCIES = ['weekly', 'monthly', 'quarterly']
+
+
+def _parse_amounts(text: str) -> List[float]:
+    """
+    Parses a range of amounts given as START:STOP:STEP, where STOP is included if the steps reach it
+    """
+    try:
+        start, stop, step = (float(value) for value in text.split(':'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Invalid range of amounts {text}, expected START:STOP:STEP')
+    if step <= 0 or stop < start:
+        raise argparse.ArgumentTypeError(f'Invalid range of amounts {text}, the step must move from START to STOP')
+
+    step_count = int((stop - start) / step + 1e-9)
+    return [start + index * step for index in range(step_count + 1)]
+
+
+def _parse_amount_list(text: str) -> List[float]:
+    """
+    Parses amounts given as a comma-separated list, or as a range START:STOP:STEP
+    """
+    if ':' in text:
+        return _parse_amounts(text)
+
+    try:
+        return [float(value) for value in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Invalid list of amounts {text}')
+
+
+def _parse_frequency_list(text: str) -> List[str]:
+    frequencies = text.split(',')
+    unknown_frequencies = [frequency for frequency in frequencies if frequency not in BACKTEST_FREQUENCIES]
+    if unknown_frequencies:
+        raise argparse.ArgumentTypeError(f'Unknown frequencies {", ".join(unknown_frequencies)}, expected some of '
+                                         f'{", ".join(BACKTEST_FREQUENCIES)}')
+
+    return frequencies
+
+
+def _parse_max_count_list(text: str) -> List[Optional[int]]:
+    """
+    Parses a comma-separated list of maximum purchase counts, where 'all' means no maximum
+    """
+    try:
+        return [None if value == 'all' else int(value) for value in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Invalid list of maximum counts {text}')
+
 
 def _set_argument_parser() -> argparse.ArgumentParser:
     default_data_directory = Path.home() / '.stock_balancer.data'
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
     parser.add_argument('-a', '--allocations_file',
-                        help='File containing the desired allocations of the securities to buy as tab-separated-values',
+                        help='File containing the desired allocations of the securities to buy as tab-separated-values, '
+                             'or as Parquet, Feather or SQLite depending on its extension',
                         default=str(default_data_directory / 'security_allocations.tsv'))
     parser.add_argument('-t', '--transactions_file',
-                        help='File containing the transactions of the current portfolio as tab-separated-values',
+                        help='File containing the transactions of the current portfolio as tab-separated-values, '
+                             'or as Parquet, Feather or SQLite depending on its extension',
                         default=str(default_data_directory / 'security_transactions.tsv'))
+    parser.add_argument('--price_cache_file',
+                        help='File where the fetched prices are cached',
+                        default=str(default_data_directory / 'price_cache.sqlite'))
+    parser.add_argument('--price_ttl',
+                        help="Minutes during which today's cached prices are reused",
+                        type=float,
+                        default=15.0)
+    price_mode_group = parser.add_mutually_exclusive_group()
+    price_mode_group.add_argument('--offline',
+                                  help='Only use cached prices, without fetching any price',
+                                  action='store_true')
+    price_mode_group.add_argument('--refresh_prices',
+                                  help='Fetch all the prices again, overwriting the cached ones',
+                                  action='store_true')
+    parser.add_argument('--price_store',
+                        help='Directory of a local price store filled with the sync_prices subcommand. When given, '
+                             'all the prices are read from it, without fetching any price')
+    parser.add_argument('--max_price_requests',
+                        help='Maximum number of prices that are fetched at the same time',
+                        type=int,
+                        default=8)
+    parser.add_argument('--timings',
+                        help='Prints the wall time and the amount of calls of every phase of the run to stderr',
+                        action='store_true')
+    parser.add_argument('--timings_format',
+                        help='Format of the timings printed with --timings',
+                        choices=['table', 'json'],
+                        default='table')
+    parser.add_argument('--profile',
+                        help='File where a cProfile dump of the main thread is written, which can be read with pstats. '
+                             'Prices fetched by the thread pool and searches run by --workers processes are not in it, '
+                             'use --timings for them')
     parser.add_argument('-i', '--interactive',
                         help='Use the script in interactive mode. Ignores any other option.',
                         action='store_true')
@@ -30,10 +118,35 @@ def _set_argument_parser() -> argparse.ArgumentParser:
                                           help='Additional help')
     invest_parser.add_argument('purchase_amount',
                                help='Amount of money to be invested',
-                               type=float)
+                               type=float,
+                               nargs='?')
+    invest_parser.add_argument('--amounts',
+                               help='Amounts to be invested instead of purchase_amount, as a comma-separated list or '
+                                    'as START:STOP:STEP. Prints the purchases and the deviation for every amount, '
+                                    'computed together with a single load of the files and prices',
+                               type=_parse_amount_list)
     invest_parser.add_argument('-n', '--max-count',
                                help='Limit output to maximum of n purchases. Balancing will be approximate',
                                type=int)
+    invest_parser.add_argument('--strategy',
+                               help='Search strategy used to choose the purchases when -n is given',
+                               choices=['exact', 'brute_force'],
+                               default='exact')
+    invest_parser.add_argument('--workers',
+                               help='Number of processes used by the brute-force search when -n is given',
+                               type=int,
+                               default=1)
+    invest_parser.add_argument('--time-budget',
+                               help='Seconds after which the brute-force search stops and keeps the best purchases '
+                                    'found until then',
+                               type=float)
+    invest_parser.add_argument('--max-evaluations',
+                               help='Maximum number of combinations of securities optimized by the brute-force search',
+                               type=int)
+    invest_parser.add_argument('--whole-shares',
+                               help='Buy whole shares only, at the current prices, without spending more than the '
+                                    'amount to invest',
+                               action='store_true')
     invest_parser.set_defaults(which='invest')
 
     portfolio_parser = subparsers.add_parser('portfolio',
@@ -45,28 +158,253 @@ def _set_argument_parser() -> argparse.ArgumentParser:
     portfolio_parser.add_argument('--get_historical_values',
                                   help='Gets the historical value of the portfolio',
                                   action='store_true')
+    portfolio_parser.add_argument('--history_frequency',
+                                  help='Gets the historical values on a calendar until today instead of on the '
+                                       'transaction dates',
+                                  choices=['daily', 'weekly', 'monthly'])
+    portfolio_parser.add_argument('--incremental',
+                                  help='Keeps the computed historical values next to the transactions file, and only '
+                                       'processes the transactions after them on the next call',
+                                  action='store_true')
+    portfolio_parser.add_argument('--analytics',
+                                  help='Computes the daily value of the portfolio from its first transaction until '
+                                       'today, with its time-weighted and money-weighted returns, the contribution of '
+                                       'every security, the drift from the allocations and the maximum drawdown',
+                                  action='store_true')
+    portfolio_parser.add_argument('--analytics_output',
+                                  help='File where the analytics are written, as JSON if its extension is .json and as '
+                                       'CSV with a row per day otherwise')
     portfolio_parser.set_defaults(which='portfolio')
 
+    compact_parser = subparsers.add_parser('compact',
+                                           description='Rewrites the transactions file sorted by date',
+                                           help='Additional help')
+    compact_parser.add_argument('--remove_duplicates',
+                                help='Keeps only the first of identical transactions, and prints the removed ones. '
+                                     'Identical transactions can also be purchases of the same amount on the same day',
+                                action='store_true')
+    compact_parser.set_defaults(which='compact')
+
+    migrate_parser = subparsers.add_parser('migrate',
+                                           description='Converts the transactions and allocations files to another '
+                                                       'format, chosen from the extension of the target files '
+                                                       '(.tsv, .parquet, .feather or .sqlite)',
+                                           help='Additional help')
+    migrate_parser.add_argument('--transactions_target',
+                                help='File where the transactions are converted to')
+    migrate_parser.add_argument('--allocations_target',
+                                help='File where the allocations are converted to')
+    migrate_parser.set_defaults(which='migrate')
+
+    import_parser = subparsers.add_parser('import',
+                                          description='Appends the transactions of a file exported by a broker to the '
+                                                      'transactions file, reading it in chunks. Transactions that are '
+                                                      'already in the transactions file are skipped.',
+                                          help='Additional help')
+    import_parser.add_argument('export_file',
+                               help='Delimited text file with a row per transaction')
+    import_parser.add_argument('--security_column',
+                               help='Column of the export file with the security identifier',
+                               default='security_id')
+    import_parser.add_argument('--amount_column',
+                               help='Column of the export file with the amount of shares, negative when sold',
+                               default='transaction_share_amount')
+    import_parser.add_argument('--date_column',
+                               help='Column of the export file with the date of the transaction',
+                               default='transaction_date')
+    import_parser.add_argument('--date_format',
+                               help='strftime format of the dates, inferred if not given')
+    import_parser.add_argument('--delimiter',
+                               help='Delimiter of the columns of the export file',
+                               default=',')
+    import_parser.add_argument('--chunk_size',
+                               help='Amount of rows read and appended at once',
+                               type=int,
+                               default=100_000)
+    import_parser.set_defaults(which='import')
+
+    sync_prices_parser = subparsers.add_parser('sync_prices',
+                                               description='Adds the daily prices of every security of the '
+                                                           'transactions and the allocations to the local price store '
+                                                           'given with --price_store, fetching only the days after '
+                                                           'the last stored price',
+                                               help='Additional help')
+    sync_prices_parser.add_argument('--start',
+                                    help='First day of the prices, as YYYY-MM-DD. By default, the day of the first '
+                                         'transaction.',
+                                    type=datetime.fromisoformat)
+    sync_prices_parser.set_defaults(which='sync_prices')
+
+    backtest_parser = subparsers.add_parser('backtest',
+                                            description='Replays investing an amount periodically with the next '
+                                                        'purchases, starting from an empty portfolio with the '
+                                                        'allocation of the allocations file, over historical prices. '
+                                                        'Every combination of amount, frequency and maximum count is '
+                                                        'simulated, and its final value and deviation from the '
+                                                        'allocation are printed.',
+                                            help='Additional help')
+    backtest_parser.add_argument('--prices',
+                                 help='Price matrix with a row per day and a column per security identifier, as CSV, '
+                                      'TSV or Parquet. By default, the prices are read from the price store or the '
+                                      'price cache between --start and --end.')
+    backtest_parser.add_argument('--start',
+                                 help='First day of the backtest, as YYYY-MM-DD',
+                                 type=datetime.fromisoformat)
+    backtest_parser.add_argument('--end',
+                                 help='Last day of the backtest, as YYYY-MM-DD. By default, today.',
+                                 type=datetime.fromisoformat)
+    backtest_parser.add_argument('--amounts',
+                                 help='Amounts invested every period, as a comma-separated list or as '
+                                      'START:STOP:STEP',
+                                 type=_parse_amount_list,
+                                 required=True)
+    backtest_parser.add_argument('--frequencies',
+                                 help=f'Comma-separated frequencies of the investments, among '
+                                      f'{", ".join(BACKTEST_FREQUENCIES)}',
+                                 type=_parse_frequency_list,
+                                 default=['monthly'])
+    backtest_parser.add_argument('--max_counts',
+                                 help="Comma-separated maximum numbers of purchases of every investment, where 'all' "
+                                      "buys all the securities",
+                                 type=_parse_max_count_list,
+                                 default=[None])
+    backtest_parser.add_argument('--workers',
+                                 help='Number of processes that run the backtests',
+                                 type=int,
+                                 default=1)
+    backtest_parser.add_argument('-o', '--output',
+                                 help='CSV file where the results are written, besides printing them')
+    backtest_parser.set_defaults(which='backtest')
+
+    batch_parser = subparsers.add_parser('batch',
+                                         description='Calculates the next investments of many accounts, fetching the '
+                                                     'prices of all their securities once. The result of every '
+                                                     'account is written as a line of JSON.',
+                                         help='Additional help')
+    accounts_group = batch_parser.add_mutually_exclusive_group(required=True)
+    accounts_group.add_argument('--manifest',
+                                help='Tab-separated file with the columns account, transactions_file, '
+                                     'allocations_file and optionally amount')
+    accounts_group.add_argument('--directory',
+                                help='Directory with a pair of files <account>_transactions.<extension> and '
+                                     '<account>_allocations.<extension> for every account')
+    batch_parser.add_argument('--amount',
+                              help='Amount of money to be invested in the accounts without an amount in the manifest',
+                              type=float)
+    batch_parser.add_argument('-n', '--max-count',
+                              help='Limit every account to a maximum of n purchases',
+                              type=int)
+    batch_parser.add_argument('--strategy',
+                              help='Search strategy used to choose the purchases when -n is given',
+                              choices=['exact', 'brute_force'],
+                              default='exact')
+    batch_parser.add_argument('--workers',
+                              help='Number of processes that read and balance the accounts',
+                              type=int,
+                              default=1)
+    batch_parser.add_argument('--time-budget',
+                              help='Seconds after which the brute-force search stops and keeps the best purchases '
+                                   'found until then',
+                              type=float)
+    batch_parser.add_argument('--max-evaluations',
+                              help='Maximum number of combinations of securities optimized by the brute-force search',
+                              type=int)
+    batch_parser.add_argument('-o', '--output',
+                              help='File where the results are written, or - for the standard output',
+                              default='-')
+    batch_parser.set_defaults(which='batch')
+
+    serve_parser = subparsers.add_parser('serve',
+                                         description='Serves invest, portfolio and history requests as JSON over '
+                                                     'HTTP, keeping the files and prices in memory between requests. '
+                                                     'The files are read again when they change.',
+                                         help='Additional help')
+    serve_parser.add_argument('--host',
+                              help='Address the server listens on',
+                              default='127.0.0.1')
+    serve_parser.add_argument('--port',
+                              help='Port the server listens on',
+                              type=int,
+                              default=8765)
+    serve_parser.add_argument('--verbose',
+                              help='Logs every request',
+                              action='store_true')
+    serve_parser.set_defaults(which='serve')
+
     return parser
 
 
-def _read_persistence(args) -> Tuple[persistence.TransactionPersistence, persistence.AllocationPercentagesPersistence]:
-    per = persistence
-    transaction_persistence = per.TransactionPersistence(per.FileDataFrameIO(args.transactions_file))
-    allocation_persistence = per.AllocationPercentagesPersistence(per.FileDataFrameIO(args.allocations_file))
+def _read_transaction_persistence(args) -> 'persistence.TransactionPersistence':
+    import persistence
 
-    return transaction_persistence, allocation_persistence
+    return persistence.TransactionPersistence(persistence.transactions_io_for_file(args.transactions_file),
+                                              persistence.holdings_snapshot_for_file(args.transactions_file))
 
 
-def _get_portfolio_values(portfolio: Dict[Security, int]) -> Dict[Security, float]:
-    return {
-        sec: shares * price.get_price(security=sec, date=datetime.today()) for sec, shares in portfolio.items()
-    }
+def _read_allocation_persistence(args) -> 'persistence.AllocationPercentagesPersistence':
+    import persistence
+
+    return persistence.AllocationPercentagesPersistence(persistence.allocations_io_for_file(args.allocations_file))
+
+
+def _create_price_provider(args) -> 'price.PriceProvider':
+    import price_fetcher as price
+
+    if getattr(args, 'price_store', None) is not None:
+        return price.PriceStore(args.price_store)
+
+    return _create_fetching_price_provider(args)
+
+
+def _create_fetching_price_provider(args) -> 'price.PriceProvider':
+    import price_fetcher as price
+
+    mode = price.CacheMode.NORMAL
+    if args.offline:
+        mode = price.CacheMode.OFFLINE
+    elif args.refresh_prices:
+        mode = price.CacheMode.REFRESH
+
+    cached_fetcher = price.CachedPriceFetcher(price.get_price, price.PriceCache(args.price_cache_file),
+                                              today_ttl=timedelta(minutes=args.price_ttl), mode=mode,
+                                              range_fetcher=price.get_prices)
+    return price.ConcurrentPriceProvider(cached_fetcher.get_price, cached_fetcher.get_prices,
+                                         max_concurrency=args.max_price_requests)
+
+
+def _get_portfolio_values(portfolio: Mapping[Security, int],
+                          price_provider: 'price.PriceProvider') -> 'Portfolio':
+    prices = _get_current_prices(portfolio.keys(), price_provider)
+    return _value_portfolio(portfolio, prices)
+
+
+def _value_portfolio(portfolio: Mapping[Security, int], prices: Mapping[Security, float]) -> 'Portfolio':
+    import numpy as np
+    from data_types.security_values import Portfolio
+
+    portfolio = Portfolio.from_mapping(portfolio)
+    return portfolio.with_values(portfolio.array * np.array([prices[sec] for sec in portfolio], dtype=np.float64))
+
+
+def _get_current_prices(securities: Iterable[Security],
+                        price_provider: 'price.PriceProvider') -> Dict[Security, float]:
+    today = datetime.today()
+    prices = price_provider.get_quotes([(sec, today) for sec in securities])
+    return {sec: price for (sec, _), price in prices.items()}
+
+
+def _get_available_prices(securities: Iterable[Security],
+                          price_provider: 'price.PriceProvider') -> Dict[Security, float]:
+    """
+    :return: The current price of every security whose price can be found
+    """
+    today = datetime.today()
+    prices = price_provider.get_available_quotes([(sec, today) for sec in securities])
+    return {sec: price for (sec, _), price in prices.items()}
 
 
 def _print_security_dictionary(dictionary: dict):
-    longest_security_name = max(dictionary.keys(), key=lambda sec: len(sec.identifier))
-    longest_length = len(longest_security_name.identifier)
+    longest_length = max((len(security.identifier) for security in dictionary.keys()), default=0)
 
     for security, amount in sorted(dictionary.items(), key=lambda item: item[1], reverse=True):
         security_name = (security.identifier + ':').ljust(longest_length + 2)
@@ -76,48 +414,394 @@ def _print_security_dictionary(dictionary: dict):
     print(f'Total: {sum(dictionary.values())}')
 
 
+def _print_purchase_sweep(sweep: 'balance.PurchaseSweep'):
+    # Only the securities that are bought for some amount are shown, the most bought first
+    totals = sweep.purchases.sum(axis=0)
+    columns = [index for index in (-totals).argsort(kind='stable') if sweep.purchases[:, index].any()]
+
+    headers = ['Amount'] + [sweep.securities[index].identifier for index in columns] + ['Deviation']
+    widths = [max(len(header), 10) for header in headers]
+    print('  '.join(header.rjust(width) for header, width in zip(headers, widths)))
+    print('  '.join('-' * width for width in widths))
+    for row, amount in enumerate(sweep.amounts):
+        values = [f'{amount:.2f}'] + [f'{sweep.purchases[row, index]:.2f}' for index in columns]
+        values.append(f'{100 * sweep.deviations[row]:.2f}%')
+        print('  '.join(value.rjust(width) for value, width in zip(values, widths)))
+
+
 def _process_invest_args(args):
-    transaction_persistence, allocation_persistence = _read_persistence(args)
+    import balance
+
+    transaction_persistence = _read_transaction_persistence(args)
+    allocation_persistence = _read_allocation_persistence(args)
     purchase_amount = args.purchase_amount
 
-    current_portfolio = transaction_persistence.read_portfolio()
-    portfolio_values = _get_portfolio_values(current_portfolio)
+    with profiling.phase('persistence load'):
+        current_portfolio = transaction_persistence.read_portfolio()
+        current_allocations = allocation_persistence.read_allocation_percentages()
+
+    whole_shares = getattr(args, 'whole_shares', False)
+    with profiling.phase('prices'), _create_price_provider(args) as price_provider:
+        if whole_shares:
+            # Allocated securities that are not held are only needed to buy them, so they can go without a price
+            prices = _get_available_prices(set(current_portfolio.keys()).union(current_allocations.keys()),
+                                           price_provider)
+            unpriced_holdings = [sec.identifier for sec in current_portfolio.keys() if sec not in prices]
+            if unpriced_holdings:
+                raise LookupError(f'Cannot find the current price of {", ".join(sorted(unpriced_holdings))}')
+            portfolio_values = _value_portfolio(current_portfolio, prices)
+        else:
+            portfolio_values = _get_portfolio_values(current_portfolio, price_provider)
 
-    current_allocations = allocation_persistence.read_allocation_percentages()
     max_count = None
     if hasattr(args, 'max_count'):
         max_count = args.max_count
 
-    next_purchases = balance.calculate_next_purchases(portfolio_values, current_allocations, purchase_amount,
-                                                      purchases_to_keep=max_count)
+    strategy = balance.LimitedPurchaseStrategy(getattr(args, 'strategy', balance.LimitedPurchaseStrategy.EXACT.value))
+    workers = getattr(args, 'workers', 1)
+
+    if whole_shares:
+        _process_whole_share_investment(portfolio_values, current_allocations, purchase_amount, max_count, prices)
+        return
+
+    amounts = getattr(args, 'amounts', None)
+    if amounts is not None:
+        sweep = balance.calculate_purchase_sweep(portfolio_values, current_allocations, amounts,
+                                                 purchases_to_keep=max_count)
+        with profiling.phase('output'):
+            print(f'Portfolio value before purchases: {sum(portfolio_values.values())}')
+            print()
+            _print_purchase_sweep(sweep)
+        return
+
+    limited_search = None
+    if max_count is not None and strategy == balance.LimitedPurchaseStrategy.BRUTE_FORCE:
+        with profiling.phase('balance'):
+            limited_search = balance.search_limited_purchases(portfolio_values, current_allocations, purchase_amount,
+                                                              max_count, time_budget=getattr(args, 'time_budget', None),
+                                                              max_evaluations=getattr(args, 'max_evaluations', None),
+                                                              workers=workers)
+        next_purchases = limited_search.purchases
+    else:
+        next_purchases = balance.calculate_next_purchases(portfolio_values, current_allocations, purchase_amount,
+                                                          purchases_to_keep=max_count, strategy=strategy,
+                                                          workers=workers)
     deviation_from_ideal = balance.get_deviation_from_ideal(portfolio_values, next_purchases, current_allocations)
 
-    print(f'Portfolio value before purchases: {sum(portfolio_values.values())}')
-    print()
-    print('Next purchases')
-    print('--------------')
-    _print_security_dictionary(next_purchases)
-
-    if deviation_from_ideal > 1e-4:
-        print(f'The new portfolio deviates from the ideal by a standard error of {100*deviation_from_ideal:.2f}%')
+    with profiling.phase('output'):
+        print(f'Portfolio value before purchases: {sum(portfolio_values.values())}')
+        print()
+        print('Next purchases')
+        print('--------------')
+        _print_security_dictionary(next_purchases)
+
+        if deviation_from_ideal > 1e-4:
+            print(f'The new portfolio deviates from the ideal by a standard error of {100*deviation_from_ideal:.2f}%')
+        if limited_search is not None and not limited_search.complete:
+            print(f'The search stopped after {limited_search.optimizations} combinations. No purchases can deviate by '
+                  f'less than {100*limited_search.lower_bound:.2f}% (gap {100*limited_search.gap:.2f}%)')
+
+
+def _process_whole_share_investment(portfolio_values: Mapping[Security, float],
+                                    current_allocations: Mapping[Security, float], purchase_amount: float,
+                                    max_count: Optional[int], prices: Mapping[Security, float]):
+    """
+    :param prices: Current price of every security that can be bought. Allocated securities without a price are
+    reported as not buyable.
+    """
+    import balance
+
+    shares = balance.calculate_whole_share_purchases(portfolio_values, current_allocations, purchase_amount, prices,
+                                                     purchases_to_keep=max_count)
+    purchases = {sec: count * prices[sec] for sec, count in shares.items()}
+    deviation_from_ideal = balance.get_deviation_from_ideal(portfolio_values, purchases, current_allocations)
+
+    with profiling.phase('output'):
+        print(f'Portfolio value before purchases: {sum(portfolio_values.values())}')
+        print()
+        print('Next purchases')
+        print('--------------')
+        if shares:
+            longest_length = max(len(sec.identifier) for sec in shares.keys())
+            for sec, count in sorted(shares.items(), key=lambda item: purchases[item[0]], reverse=True):
+                security_name = (sec.identifier + ':').ljust(longest_length + 2)
+                print(f'{security_name}{count} shares at {prices[sec]:.2f} = {purchases[sec]:.2f}')
+            print()
+        print(f'Total: {sum(purchases.values()):.2f}')
+        print(f'Not invested: {purchase_amount - sum(purchases.values()):.2f}')
+        unpriced_securities = sorted(sec.identifier for sec in current_allocations.keys() if sec not in prices)
+        if unpriced_securities:
+            print(f'Not buyable without a current price: {", ".join(unpriced_securities)}')
+
+        if deviation_from_ideal > 1e-4:
+            print(f'The new portfolio deviates from the ideal by a standard error of {100*deviation_from_ideal:.2f}%')
 
 
 def _process_portfolio_args(args):
-    transaction_persistence, allocation_persistence = _read_persistence(args)
-    if args.read:
-        portfolio = transaction_persistence.read_portfolio()
-        portfolio_values = _get_portfolio_values(portfolio)
-
-        print('  Portfolio')
-        print('--------------')
-        _print_security_dictionary(portfolio_values)
+    analytics = getattr(args, 'analytics', False)
+    if not args.read and not args.get_historical_values and not analytics:
+        return
+
+    transaction_persistence = _read_transaction_persistence(args)
+    with _create_price_provider(args) as price_provider:
+        if args.read:
+            with profiling.phase('persistence load'):
+                portfolio = transaction_persistence.read_portfolio()
+            with profiling.phase('prices'):
+                portfolio_values = _get_portfolio_values(portfolio, price_provider)
+
+            with profiling.phase('output'):
+                print('  Portfolio')
+                print('--------------')
+                _print_security_dictionary(portfolio_values)
+
+        if args.get_historical_values:
+            checkpoint = None
+            if getattr(args, 'incremental', False):
+                import persistence
+
+                checkpoint_file = Path(args.transactions_file).with_suffix('.history.json')
+                checkpoint = persistence.HistoryCheckpoint(str(checkpoint_file))
+
+            with profiling.phase('portfolio history'):
+                historical_values = transaction_persistence.read_portfolio_history(
+                    range_price_provider=price_provider.get_prices, frequency=getattr(args, 'history_frequency', None),
+                    checkpoint=checkpoint)
+
+            with profiling.phase('output'):
+                print('Historical values')
+                print('--------------')
+                for date, value in historical_values.items():
+                    print(f'{date.strftime("%d.%m.%Y")}: {value}')
+
+        if analytics:
+            _process_portfolio_analytics(args, transaction_persistence, price_provider)
+
+
+def _process_portfolio_analytics(args, transaction_persistence: 'persistence.TransactionPersistence',
+                                 price_provider: 'price.PriceProvider'):
+    import analytics
+    from data_types import intern_security
+
+    with profiling.phase('portfolio history'):
+        holdings = transaction_persistence.read_holdings_history(frequency='daily')
+    if holdings.empty:
+        print('There are no transactions to analyse')
+        return
+
+    allocations = None
+    if Path(args.allocations_file).is_file():
+        allocations = _read_allocation_persistence(args).read_allocation_percentages()
+
+    with profiling.phase('prices'):
+        securities = [intern_security(str(identifier)) for identifier in holdings.columns]
+        prices = price_provider.get_prices(securities, holdings.index.min().to_pydatetime(),
+                                           holdings.index.max().to_pydatetime())
+
+    with profiling.phase('analytics'):
+        result = analytics.compute_analytics(holdings, prices, allocations)
+
+    with profiling.phase('output'):
+        _print_portfolio_analytics(result)
+        if args.analytics_output is not None:
+            if Path(args.analytics_output).suffix.lower() == '.json':
+                import json
+
+                with open(args.analytics_output, 'w') as output_file:
+                    json.dump(result.to_json(), output_file, indent=2)
+            else:
+                result.time_series().to_csv(args.analytics_output, index_label='date')
+
+
+def _print_portfolio_analytics(result: 'analytics.PortfolioAnalytics'):
+    import math
+
+    summary = result.summary()
+    print(f'Analytics from {result.start.strftime("%d.%m.%Y")} to {result.end.strftime("%d.%m.%Y")}')
+    print('--------------')
+    print(f'Final value:            {summary["final_value"]:.2f}')
+    print(f'Net invested:           {summary["net_invested"]:.2f}')
+    print(f'Gain:                   {summary["gain"]:.2f}')
+    print(f'Time-weighted return:   {100 * result.time_weighted_return:.2f}% '
+          f'({100 * result.annualized_time_weighted_return:.2f}% a year)')
+    if not math.isnan(result.money_weighted_return):
+        print(f'Money-weighted return:  {100 * result.money_weighted_return:.2f}% a year')
+    if result.max_drawdown_peak is not None:
+        print(f'Maximum drawdown:       {100 * result.max_drawdown:.2f}% '
+              f'(from {result.max_drawdown_peak.strftime("%d.%m.%Y")} '
+              f'to {result.max_drawdown_trough.strftime("%d.%m.%Y")})')
+    if summary['deviation'] is not None:
+        print(f'Deviation:              {100 * summary["deviation"]:.2f}%')
+    print()
 
-    if args.get_historical_values:
-        historical_values = transaction_persistence.read_portfolio_history(price.get_price)
-        print('Historical values')
-        print('--------------')
-        for date, value in historical_values.items():
-            print(f'{date.strftime("%d.%m.%Y")}: {value}')
+    headers = ['Security', 'Value', 'Invested', 'Gain', 'Contribution', 'Drift']
+    widths = [max(len(header), 11) for header in headers]
+    print('  '.join(header.rjust(width) for header, width in zip(headers, widths)))
+    print('  '.join('-' * width for width in widths))
+    final_drift = result.drift.iloc[-1]
+    for identifier, row in result.contributions.sort_values('value', ascending=False).iterrows():
+        values = [identifier, f'{row["value"]:.2f}', f'{row["net_invested"]:.2f}', f'{row["gain"]:.2f}',
+                  f'{100 * row["return_contribution"]:.2f}%', f'{100 * final_drift[identifier]:.2f}%']
+        print('  '.join(value.rjust(width) for value, width in zip(values, widths)))
+
+
+def _process_compact_args(args):
+    transaction_persistence = _read_transaction_persistence(args)
+    removed_transactions = transaction_persistence.compact_transactions(remove_duplicates=args.remove_duplicates)
+    if not args.remove_duplicates:
+        print('Sorted the transactions by date')
+        return
+
+    print(f'Removed {len(removed_transactions)} duplicated transactions')
+    for transaction in removed_transactions.itertuples(index=False):
+        print(f'{transaction.security_id}: {transaction.transaction_share_amount} on '
+              f'{transaction.transaction_date.strftime("%d.%m.%Y")}')
+
+
+def _process_import_args(args):
+    import persistence
+    from persistence import transaction_persistence
+
+    columns = {
+        transaction_persistence.SECURITY_ID: args.security_column,
+        transaction_persistence.TRANSACTION_SHARE_AMOUNT: args.amount_column,
+        transaction_persistence.TRANSACTION_DATE: args.date_column
+    }
+    chunks = persistence.read_transaction_export(args.export_file, columns, chunk_size=args.chunk_size,
+                                                 delimiter=args.delimiter, date_format=args.date_format)
+    summary = _read_transaction_persistence(args).import_transactions(chunks, chunk_size=args.chunk_size)
+    print(f'Read {summary.read_count} transactions, imported {summary.imported_count} and skipped '
+          f'{summary.duplicate_count} duplicated transactions')
+
+
+def _process_sync_prices_args(args):
+    import price_fetcher as price
+
+    transaction_persistence = _read_transaction_persistence(args)
+    with profiling.phase('persistence load'):
+        securities = set(transaction_persistence.read_portfolio().keys())
+        securities.update(_read_allocation_persistence(args).read_allocation_percentages().keys())
+        start = args.start
+        if start is None:
+            holdings = transaction_persistence.read_holdings_history()
+            start = holdings.index.min().to_pydatetime() if not holdings.empty else datetime.today()
+
+    price_store = price.PriceStore(args.price_store)
+    with _create_fetching_price_provider(args) as price_provider:
+        fetched_count = price_store.sync(sorted(securities, key=lambda sec: sec.identifier), price_provider.get_prices,
+                                         start)
+    print(f'Stored {fetched_count} prices of {len(securities)} securities')
+
+
+def _read_backtest_prices(args, securities: List[Security]) -> 'pd.DataFrame':
+    import pandas as pd
+
+    if args.prices is not None:
+        if Path(args.prices).suffix.lower() in ('.parquet', '.pq'):
+            prices = pd.read_parquet(args.prices)
+        else:
+            separator = '\t' if Path(args.prices).suffix.lower() == '.tsv' else ','
+            prices = pd.read_csv(args.prices, sep=separator, index_col=0)
+        prices.index = pd.to_datetime(prices.index)
+    else:
+        end = args.end if args.end is not None else datetime.today()
+        with profiling.phase('prices'), _create_price_provider(args) as price_provider:
+            prices = price_provider.get_prices(securities, args.start, end)
+
+    return prices.loc[args.start:args.end]
+
+
+def _process_backtest_args(args):
+    import backtest
+
+    allocations = _read_allocation_persistence(args).read_allocation_percentages()
+    prices = _read_backtest_prices(args, list(allocations.keys()))
+    parameters = backtest.parameter_grid(args.amounts, args.frequencies, args.max_counts)
+    with profiling.phase('backtest'):
+        results = backtest.run_backtests(prices, allocations, parameters, workers=args.workers)
+
+    rows = [{
+        'amount': result.parameters.amount,
+        'frequency': result.parameters.frequency,
+        'max_count': result.parameters.purchases_to_keep if result.parameters.purchases_to_keep is not None else 'all',
+        'invested': result.invested,
+        'final_value': result.final_value,
+        'mean_deviation': result.mean_deviation,
+        'max_deviation': result.max_deviation,
+        'final_deviation': result.final_deviation
+    } for result in results]
+
+    with profiling.phase('output'):
+        days = prices.index
+        print(f'Backtest from {days.min().strftime("%d.%m.%Y")} to {days.max().strftime("%d.%m.%Y")}')
+        print()
+        headers = ['Amount', 'Frequency', 'Max count', 'Invested', 'Final value', 'Mean dev.', 'Max dev.', 'Final dev.']
+        widths = [max(len(header), 11) for header in headers]
+        print('  '.join(header.rjust(width) for header, width in zip(headers, widths)))
+        print('  '.join('-' * width for width in widths))
+        for row in rows:
+            values = [f'{row["amount"]:.2f}', row['frequency'], str(row['max_count']), f'{row["invested"]:.2f}',
+                      f'{row["final_value"]:.2f}', f'{100 * row["mean_deviation"]:.2f}%',
+                      f'{100 * row["max_deviation"]:.2f}%', f'{100 * row["final_deviation"]:.2f}%']
+            print('  '.join(value.rjust(width) for value, width in zip(values, widths)))
+
+        if args.output is not None:
+            import pandas as pd
+
+            pd.DataFrame(rows).to_csv(args.output, index=False)
+
+
+def _process_migrate_args(args):
+    import persistence
+
+    if args.transactions_target is not None:
+        transaction_persistence = _read_transaction_persistence(args)
+        transaction_persistence.copy_transactions_to(persistence.transactions_io_for_file(args.transactions_target))
+        print(f'Transactions converted to {args.transactions_target}')
+
+    if args.allocations_target is not None:
+        allocation_persistence = _read_allocation_persistence(args)
+        target_persistence = persistence.AllocationPercentagesPersistence(
+            persistence.allocations_io_for_file(args.allocations_target))
+        target_persistence.write_allocation_percentages(allocation_persistence.read_allocation_percentages())
+        print(f'Allocations converted to {args.allocations_target}')
+
+
+def _process_batch_args(args):
+    import balance
+    import batch
+
+    accounts = batch.read_manifest(args.manifest) if args.manifest is not None else batch.find_accounts(args.directory)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        with _create_price_provider(args) as price_provider:
+            failed_accounts = batch.rebalance_accounts(accounts, price_provider, output, amount=args.amount,
+                                                       purchases_to_keep=args.max_count,
+                                                       strategy=balance.LimitedPurchaseStrategy(args.strategy),
+                                                       workers=args.workers, time_budget=args.time_budget,
+                                                       max_evaluations=args.max_evaluations)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(f'Balanced {len(accounts) - failed_accounts} of {len(accounts)} accounts', file=sys.stderr)
+
+
+def _process_serve_args(args):
+    import server
+
+    price_provider = _create_price_provider(args)
+    service = server.BalancerService(args.transactions_file, args.allocations_file, price_provider,
+                                     price_ttl=timedelta(minutes=args.price_ttl))
+    http_server = server.BalancerHTTPServer((args.host, args.port), service, verbose=args.verbose)
+    print(f'Serving on http://{args.host}:{http_server.server_port}')
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        price_provider.close()
 
 
 def _process_interactive_mode(args):
@@ -153,15 +837,68 @@ def _process_interactive_mode(args):
     input('Press any key to exit.')
 
 
-def _main():
-    parser = _set_argument_parser()
-    args = parser.parse_args()
+def _run_command(args):
     if args.interactive:
         _process_interactive_mode(args)
     elif args.which == 'invest':
         _process_invest_args(args)
     elif args.which == 'portfolio':
         _process_portfolio_args(args)
+    elif args.which == 'compact':
+        _process_compact_args(args)
+    elif args.which == 'migrate':
+        _process_migrate_args(args)
+    elif args.which == 'import':
+        _process_import_args(args)
+    elif args.which == 'sync_prices':
+        _process_sync_prices_args(args)
+    elif args.which == 'backtest':
+        _process_backtest_args(args)
+    elif args.which == 'batch':
+        _process_batch_args(args)
+    elif args.which == 'serve':
+        _process_serve_args(args)
+
+
+def _main():
+    parser = _set_argument_parser()
+    args = parser.parse_args()
+    if not args.interactive and getattr(args, 'which', None) == 'invest':
+        if args.purchase_amount is None and args.amounts is None:
+            parser.error('invest needs either purchase_amount or --amounts')
+        if args.purchase_amount is not None and args.amounts is not None:
+            parser.error('invest takes either purchase_amount or --amounts, not both')
+        if args.amounts is not None and args.strategy != 'exact':
+            parser.error('--amounts can only be used with the exact strategy')
+        if args.whole_shares and (args.amounts is not None or args.strategy != 'exact'):
+            parser.error('--whole-shares cannot be used with --amounts or with the brute_force strategy')
+    if not args.interactive and getattr(args, 'which', None) in ('invest', 'batch') and args.strategy == 'exact' and \
+            (args.time_budget is not None or args.max_evaluations is not None):
+        parser.error('--time-budget and --max-evaluations can only be used with the brute_force strategy')
+    if not args.interactive and getattr(args, 'which', None) == 'portfolio' and args.analytics_output is not None and \
+            not args.analytics:
+        parser.error('--analytics_output can only be used with --analytics')
+    if not args.interactive and getattr(args, 'which', None) == 'sync_prices' and args.price_store is None:
+        parser.error('sync_prices needs --price_store')
+    if not args.interactive and getattr(args, 'which', None) == 'backtest' and args.prices is None and \
+            args.start is None:
+        parser.error('backtest needs either --prices or --start')
+
+    recorder = profiling.TimingRecorder() if args.timings else None
+    previous_recorder = profiling.set_recorder(recorder)
+    profiler = cProfile.Profile() if args.profile is not None else None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        _run_command(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        profiling.set_recorder(previous_recorder)
+
+    if recorder is not None:
+        print(recorder.to_json() if args.timings_format == 'json' else recorder.format_table(), file=sys.stderr)
 
 
 if __name__ == '__main__':
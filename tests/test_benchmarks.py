@@ -0,0 +1,30 @@
+import unittest
+
+from benchmarks import run_benchmarks
+
+
+class BenchmarkTests(unittest.TestCase):
+    def test_run_benchmarks(self):
+        results = run_benchmarks.run_benchmarks(security_counts=[5], transaction_counts=[50], repeats=1,
+                                                writer_counts=[2])
+        benchmarks = results['benchmarks']
+
+        self.assertIn('calculate_next_purchases[securities=5]', benchmarks)
+        self.assertIn('calculate_whole_share_purchases[securities=5]', benchmarks)
+        self.assertIn('read_portfolio_history[transactions=50,format=tsv]', benchmarks)
+        self.assertIn(f'append_dataframe_concurrent[writers=2,appends={run_benchmarks.CONCURRENT_APPEND_COUNT}]',
+                      benchmarks)
+        self.assertTrue(all(seconds >= 0 for seconds in benchmarks.values()))
+
+    def test_compare_with_baseline(self):
+        baseline = {'benchmarks': {'slower': 1.0, 'noise': 0.001, 'faster': 1.0, 'removed': 1.0}}
+        results = {'benchmarks': {'slower': 2.0, 'noise': 0.004, 'faster': 0.5, 'new': 10.0}}
+
+        regressions = run_benchmarks.compare_with_baseline(results, baseline, threshold=1.5, min_seconds=0.005)
+
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith('slower:'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / 'stock_balancer.py'
+
+# Importing these modules takes several times longer than starting the interpreter. The startup is checked through
+# the imported modules rather than the wall time, which depends on the load of the machine.
+HEAVY_MODULES = ['numpy', 'pandas', 'scipy', 'yfinance']
+
+
+def _run_cli(*arguments: str):
+    """
+    Runs the CLI in a new interpreter
+    :return: The top-level modules that were imported
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', str(SCRIPT), *arguments],
+                            capture_output=True, text=True, check=True)
+
+    imported_modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            imported_modules.add(line.rsplit('|', 1)[1].strip().split('.')[0])
+
+    return imported_modules
+
+
+class StartupTests(unittest.TestCase):
+    def _assert_imports_nothing_heavy(self, *arguments: str):
+        imported_modules = _run_cli(*arguments)
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, imported_modules)
+
+    def test_help(self):
+        self._assert_imports_nothing_heavy('--help')
+
+    def test_portfolio_without_operations(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self._assert_imports_nothing_heavy('-t', str(Path(directory) / 'transactions.tsv'),
+                                               '-a', str(Path(directory) / 'allocations.tsv'), 'portfolio')
+
+    def test_portfolio_read_only_loads_what_it_needs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            imported_modules = _run_cli('-t', str(Path(directory) / 'transactions.tsv'),
+                                        '-a', str(Path(directory) / 'allocations.tsv'),
+                                        '--price_store', str(Path(directory) / 'prices'), 'portfolio', '--read')
+
+            # Reading needs neither the optimizer nor fetching prices, and it does not create any file
+            self.assertIn('persistence', imported_modules)
+            self.assertNotIn('scipy', imported_modules)
+            self.assertNotIn('balance', imported_modules)
+            self.assertNotIn('yfinance', imported_modules)
+            self.assertEqual([], list(Path(directory).iterdir()))
+
+    def test_timings_before_subcommand(self):
+        with tempfile.TemporaryDirectory() as directory:
+            result = subprocess.run([sys.executable, str(SCRIPT), '--timings', '-t',
+                                     str(Path(directory) / 'transactions.tsv'), '--timings_format', 'json',
+                                     'portfolio'], capture_output=True, text=True)
+
+        self.assertEqual(0, result.returncode, result.stderr)
+        self.assertTrue(result.stderr.strip().startswith('{'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            result = subprocess.run([sys.executable, str(SCRIPT), '-t', str(Path(directory) / 'transactions.tsv'),
+                                     '--timings', 'portfolio'], capture_output=True, text=True)
+
+        self.assertEqual(0, result.returncode, result.stderr)
+
+    def test_invest_takes_one_amount_or_several(self):
+        result = subprocess.run([sys.executable, str(SCRIPT), 'invest', '1000', '--amounts', '500:1500:500'],
+                                capture_output=True, text=True)
+
+        self.assertEqual(2, result.returncode)
+        self.assertIn('not both', result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()